@@ -1,6 +1,18 @@
 from django.contrib import admin
-from .models import FuelPrice, Route
+from .models import FuelPrice, FuelStation, Lane, Route
 
 # Register your models here.
 admin.site.register(FuelPrice)
-admin.site.register(Route)
\ No newline at end of file
+admin.site.register(Route)
+
+
+@admin.register(FuelStation)
+class FuelStationAdmin(admin.ModelAdmin):
+    list_display = ('opis_id', 'name', 'city', 'state', 'price', 'updated_at')
+    list_filter = ('state',)
+    search_fields = ('name', 'city', 'opis_id')
+
+
+@admin.register(Lane)
+class LaneAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'total_miles', 'location_version', 'updated_at')
@@ -2,4 +2,9 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'api'
\ No newline at end of file
+    name = 'api'
+
+    def ready(self):
+        # Load the fuel station index once per process so requests share it
+        from .stations import get_station_index
+        get_station_index()
@@ -0,0 +1,104 @@
+import numpy as np
+
+# Mean earth radius used by geopy's great_circle, so results line up with it
+EARTH_RADIUS_MILES = 6371.009 / 1.609344
+MILES_PER_DEGREE_LAT = EARTH_RADIUS_MILES * np.pi / 180
+
+
+def haversine_miles(lat1, lng1, lat2, lng2):
+    """Vectorized great-circle distance in miles between paired points"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=np.float64))
+                              for a in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def degree_radius(miles, lats):
+    """Radius in (lat, lng) degrees that covers `miles` anywhere within `lats`
+
+    Longitude degrees shrink towards the poles, so the radius is sized for the
+    highest latitude involved. Searches with it return a superset that still
+    needs an exact haversine check.
+    """
+    lat_margin = miles / MILES_PER_DEGREE_LAT
+    max_lat = min(float(np.max(np.abs(lats))) + lat_margin, 89.0)
+    return lat_margin / max(np.cos(np.radians(max_lat)), 0.01)
+
+
+# Spherical geometry on unit vectors, stored component-first as (3, n) arrays,
+# shared by polyline simplification and station projection
+def unit_vectors(lats, lngs):
+    """(3, n) unit vectors for latitude/longitude in degrees"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lng = np.radians(np.asarray(lngs, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def dot(u, v):
+    return u[0] * v[0] + u[1] * v[1] + u[2] * v[2]
+
+
+def cross(u, v):
+    return np.stack((u[1] * v[2] - u[2] * v[1],
+                     u[2] * v[0] - u[0] * v[2],
+                     u[0] * v[1] - u[1] * v[0]))
+
+
+def central_angle(a, b):
+    """Angle between paired unit vectors, accurate for tiny angles"""
+    chord = a - b
+    return 2 * np.arcsin(np.clip(np.sqrt(dot(chord, chord)) / 2, 0.0, 1.0))
+
+
+def arc_frames(a, b):
+    """Unit normal of each a-b great circle and the normals of the planes bounding the arc"""
+    normal = cross(a, b)
+    norm = np.sqrt(dot(normal, normal))
+    # Coincident endpoints have no circle; those points are measured from the endpoint
+    degenerate = norm < 1e-15
+    normal /= np.where(degenerate, 1.0, norm)
+    normal[:, degenerate] = 0.0
+    return np.concatenate((normal, cross(normal, a), cross(b, normal)))
+
+
+class RouteGeometry:
+    """Route polyline as contiguous lat/lng arrays with cumulative mileage
+
+    `miles[i]` is the distance along the route from the first point to point i.
+    """
+
+    # __weakref__ lets per-route caches drop their entries along with the route
+    __slots__ = ('lats', 'lngs', 'miles', '__weakref__')
+
+    def __init__(self, lats, lngs, miles=None):
+        self.lats = np.ascontiguousarray(lats, dtype=np.float64)
+        self.lngs = np.ascontiguousarray(lngs, dtype=np.float64)
+        if miles is None:
+            miles = np.zeros(self.lats.size)
+            np.cumsum(haversine_miles(self.lats[:-1], self.lngs[:-1], self.lats[1:], self.lngs[1:]),
+                      out=miles[1:])
+        self.miles = np.ascontiguousarray(miles, dtype=np.float64)
+
+    @classmethod
+    def from_coordinates(cls, coordinates):
+        """Build from (lat, lng) pairs, e.g. the output of polyline.decode"""
+        coords = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+        return cls(coords[:, 0], coords[:, 1])
+
+    def __len__(self):
+        return self.lats.size
+
+    @property
+    def total_miles(self):
+        return float(self.miles[-1]) if self.miles.size else 0.0
+
+    @property
+    def coords(self):
+        """(n, 2) array of (lat, lng)"""
+        return np.column_stack((self.lats, self.lngs))
+
+    def subset(self, indices):
+        """Geometry through the given points, keeping their original mileage"""
+        return RouteGeometry(self.lats[indices], self.lngs[indices], self.miles[indices])
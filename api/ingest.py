@@ -0,0 +1,89 @@
+"""Apply a new OPIS price file to the geocoded station CSV as a diff on OPIS Truckstop ID."""
+import csv
+import os
+import tempfile
+
+from geocoding.pipeline import GEOCODING_COLUMNS, geocode_csv
+
+ID_COLUMN = 'OPIS Truckstop ID'
+ADDRESS_COLUMNS = ('Address', 'City', 'State')
+
+
+def read_rows(path):
+    """(fieldnames, rows) of a CSV, keeping the first row of each OPIS ID"""
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        rows = {}
+        for row in reader:
+            rows.setdefault(row[ID_COLUMN].strip(), row)
+        return list(reader.fieldnames), rows
+
+
+def ingest_prices(price_path, stations_path, provider, cache=None, workers=8, prune=True):
+    """Update `stations_path` from the price file, geocoding only new or moved stations
+
+    Existing stations keep their coordinates and take the new price and
+    details; stations without coordinates are geocoded again. Stations
+    missing from the price file are dropped unless `prune` is false. The
+    station file is replaced atomically, so readers see either the old or
+    the new file. Returns counts of what changed.
+    """
+    _, prices = read_rows(price_path)
+    # Coordinates only ever come from geocoding, never from the price file
+    prices = {opis_id: {k: v for k, v in row.items() if k not in GEOCODING_COLUMNS}
+              for opis_id, row in prices.items()}
+    if os.path.exists(stations_path):
+        fieldnames, stations = read_rows(stations_path)
+    else:
+        fieldnames, stations = [], {}
+    stats = {'updated': 0, 'unchanged': 0, 'added': 0, 'geocode_failed': 0, 'removed': 0}
+
+    merged = {}
+    to_geocode = {}
+    for opis_id, row in prices.items():
+        current = stations.get(opis_id)
+        if (current is None or not current.get('Latitude')
+                or any(current[c] != row[c] for c in ADDRESS_COLUMNS)):
+            to_geocode[opis_id] = row
+            continue
+        stats['unchanged' if current['Retail Price'] == row['Retail Price'] else 'updated'] += 1
+        merged[opis_id] = {**current, **row}
+
+    if to_geocode:
+        for opis_id, row in _geocode_rows(list(to_geocode.values()), provider, cache, workers).items():
+            if row['Geocoding_Status'] != 'SUCCESS':
+                stats['geocode_failed'] += 1
+                if stations.get(opis_id, {}).get('Latitude'):
+                    # Keep the old location rather than dropping the station
+                    row = {**stations[opis_id], **prices[opis_id]}
+            stats['added' if opis_id not in stations else 'updated'] += 1
+            merged[opis_id] = row
+
+    if not prune:
+        for opis_id, row in stations.items():
+            merged.setdefault(opis_id, row)
+    stats['removed'] = len(set(stations) - set(merged))
+
+    price_fields = list(next(iter(prices.values())).keys()) if prices else []
+    columns = fieldnames or price_fields + GEOCODING_COLUMNS
+    columns += [c for c in price_fields + GEOCODING_COLUMNS if c not in columns]
+    directory = os.path.dirname(os.path.abspath(stations_path))
+    with tempfile.NamedTemporaryFile('w', newline='', dir=directory, suffix='.tmp', delete=False) as f:
+        writer = csv.DictWriter(f, columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(merged.values())
+    os.replace(f.name, stations_path)
+    return stats
+
+
+def _geocode_rows(rows, provider, cache, workers):
+    """Geocoded copies of `rows`, keyed by OPIS ID"""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'new_stations.csv')
+        target = os.path.join(tmp, 'new_stations_geocoded.csv')
+        with open(source, 'w', newline='') as f:
+            writer = csv.DictWriter(f, list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        geocode_csv(source, target, provider, workers=workers, cache=cache)
+        return read_rows(target)[1]
@@ -0,0 +1,101 @@
+"""Precomputed lanes: recurring trips whose route and corridor stations are stored.
+
+The precompute_lanes command routes each lane once and projects the stations
+onto it. Requests for a stored lane then skip routing and projection and run
+only the solver, against current prices looked up by OPIS ID. A lane depends
+on station locations, not prices: when the locations change it is projected
+again from its stored route, without calling the routing service.
+"""
+import hashlib
+import logging
+
+import numpy as np
+import polyline
+from django.conf import settings
+from django.db import DatabaseError
+
+from .geo import RouteGeometry
+from .models import Lane
+
+logger = logging.getLogger(__name__)
+
+
+def lane_key(coordinates):
+    """Key of the lane through [lng, lat] coordinates, rounded like the route cache"""
+    precision = settings.ROUTE_CACHE_PRECISION
+    rounded = ','.join(f"{c:.{precision}f}" for point in coordinates for c in point)
+    return hashlib.sha256(rounded.encode()).hexdigest()
+
+
+def get_lane(key):
+    """The stored lane for a key, or None"""
+    try:
+        return Lane.objects.filter(key=key).first()
+    except DatabaseError as e:
+        logger.error(f"Lane read failed: {e}")
+        return None
+
+
+def is_current(lane, location_version):
+    return (lane.location_version == location_version
+            and lane.corridor_miles == settings.ROUTE_CORRIDOR_MILES)
+
+
+def lane_record(key, coordinates, route_data, projection, fuel_stations, location_version):
+    """Unsaved Lane from a routed trip and its station projection
+
+    Stations without an OPIS ID can't be looked up later and are left out.
+    """
+    order = np.lexsort((projection['station_index'], projection['mile_position']))
+    stations = projection['station_index'][order]
+    ids = fuel_stations.ids[stations]
+    known = ids >= 0
+    geometry = route_data['geometry']
+    return Lane(
+        key=key,
+        coordinates=[list(point) for point in coordinates],
+        polyline=route_data['polyline'],
+        total_miles=route_data['total_miles'],
+        way_points=route_data['way_points'],
+        way_point_miles=geometry.miles[route_data['way_points']].tolist(),
+        leg_miles=route_data['leg_miles'],
+        corridor_miles=settings.ROUTE_CORRIDOR_MILES,
+        location_version=location_version,
+        station_ids=ids[known].tolist(),
+        mile_positions=projection['mile_position'][order][known].tolist(),
+        distances=projection['distance_from_route'][order][known].tolist(),
+    )
+
+
+def save_lane(record):
+    """Insert or replace the stored lane with the record's key"""
+    fields = [f.name for f in Lane._meta.concrete_fields if f.name not in ('id', 'key')]
+    try:
+        Lane.objects.update_or_create(key=record.key, defaults={f: getattr(record, f) for f in fields})
+    except DatabaseError as e:
+        logger.error(f"Lane write failed: {e}")
+
+
+def lane_route_data(lane, geometry=False):
+    """Route data of a stored lane; the geometry is only decoded when asked for"""
+    route_data = {
+        'total_miles': lane.total_miles,
+        'polyline': lane.polyline,
+        'way_points': lane.way_points,
+        'way_point_miles': lane.way_point_miles,
+        'leg_miles': lane.leg_miles,
+    }
+    if geometry:
+        route_data['geometry'] = RouteGeometry.from_coordinates(polyline.decode(lane.polyline))
+    return route_data
+
+
+def lane_projection(lane, fuel_stations):
+    """The lane's stations as a projection onto `fuel_stations`, for RouteView._plan_stops"""
+    positions = fuel_stations.positions(lane.station_ids)
+    found = positions >= 0
+    return {
+        'station_index': positions[found],
+        'mile_position': np.asarray(lane.mile_positions, dtype=np.float64)[found],
+        'distance_from_route': np.asarray(lane.distances, dtype=np.float64)[found],
+    }
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...stations import LOAD_ERRORS, read_station_index, write_station_snapshot
+
+
+class Command(BaseCommand):
+    help = ("Write the geocoded station CSV as a binary snapshot that workers memory-map "
+            "at startup. Running workers switch to a new snapshot without a restart.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', default=str(settings.FUEL_STATIONS_CSV),
+                            help="geocoded station CSV, defaults to FUEL_STATIONS_CSV")
+        parser.add_argument('--output', default=settings.FUEL_STATIONS_SNAPSHOT,
+                            help="snapshot directory, defaults to FUEL_STATIONS_SNAPSHOT")
+        parser.add_argument('--keep', type=int, default=2, help="snapshot versions to keep")
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            raise CommandError("Set FUEL_STATIONS_SNAPSHOT or pass --output")
+        try:
+            index = read_station_index(options['stations'])
+            path = write_station_snapshot(index, options['output'], source=options['stations'],
+                                          keep=options['keep'])
+        except LOAD_ERRORS as e:
+            raise CommandError(f"Could not build the snapshot: {e}")
+        self.stdout.write(self.style.SUCCESS(f"{path}: {len(index)} stations, version {index.version}"))
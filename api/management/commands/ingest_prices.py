@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from geocoding.cache import DEFAULT_CACHE_PATH, GeocodeCache
+from geocoding.providers import PROVIDERS
+
+from ...ingest import ingest_prices, read_rows
+from ...models import FuelStation, Lane
+from ...plans import prune_plans
+from ...stations import read_station_index, set_station_index, write_station_snapshot
+
+
+class Command(BaseCommand):
+    help = ("Apply a new OPIS price file to the station CSV, geocoding only new stations. "
+            "Running workers pick up the new file without a restart, and with "
+            "STATION_BACKEND = 'database' the FuelStation table is synced too. Stored plans for "
+            "the old prices are dropped, and precomputed lanes are refreshed if station locations changed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('price_file')
+        parser.add_argument('--stations', default=str(settings.FUEL_STATIONS_CSV),
+                            help="geocoded station CSV to update, defaults to FUEL_STATIONS_CSV")
+        parser.add_argument('--provider', choices=sorted(PROVIDERS), default='here')
+        parser.add_argument('--geocoder-url', help="override the provider endpoint")
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="SQLite geocode cache")
+        parser.add_argument('--keep-missing', action='store_true',
+                            help="keep stations that are not in the price file")
+
+    def handle(self, *args, **options):
+        provider = PROVIDERS[options['provider']](url=options['geocoder_url'], pool_size=options['workers'])
+        cache = GeocodeCache(options['cache'])
+        try:
+            stats = ingest_prices(options['price_file'], options['stations'], provider, cache=cache,
+                                  workers=options['workers'], prune=not options['keep_missing'])
+        except (OSError, KeyError) as e:
+            raise CommandError(f"Could not ingest {options['price_file']}: {e}")
+        finally:
+            cache.close()
+
+        index = read_station_index(options['stations'])
+        self.stdout.write(
+            f"{stats['updated']} updated, {stats['unchanged']} unchanged, {stats['added']} added, "
+            f"{stats['removed']} removed, {stats['geocode_failed']} could not be geocoded")
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['stations']}: {len(index)} stations, version {index.version}"))
+        if settings.FUEL_STATIONS_SNAPSHOT:
+            path = write_station_snapshot(index, settings.FUEL_STATIONS_SNAPSHOT, source=options['stations'])
+            self.stdout.write(f"Snapshot: {path}")
+        if settings.STATION_BACKEND == 'database':
+            synced = FuelStation.objects.sync_rows(read_rows(options['stations'])[1].values(),
+                                                   prune=not options['keep_missing'])
+            self.stdout.write(f"Database: {synced['created']} created, {synced['updated']} updated, "
+                              f"{synced['removed']} removed")
+        if settings.ROUTE_PLANS_ENABLED:
+            version = FuelStation.objects.data_version() if settings.STATION_BACKEND == 'database' else index.version
+            self.stdout.write(f"Dropped {prune_plans(version)} stored plans for older prices")
+        if settings.ROUTE_LANES_ENABLED and Lane.objects.exists():
+            if settings.STATION_BACKEND != 'database':
+                set_station_index(index)
+            call_command('precompute_lanes', refresh=True, stdout=self.stdout, stderr=self.stderr)
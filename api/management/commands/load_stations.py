@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from ...ingest import read_rows
+from ...models import FuelStation, Lane
+
+
+class Command(BaseCommand):
+    help = ("Load the geocoded station CSV into the FuelStation table, writing only "
+            "stations that changed. Used when STATION_BACKEND is 'database'. Precomputed lanes "
+            "are refreshed if station locations changed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stations', default=str(settings.FUEL_STATIONS_CSV),
+                            help="geocoded station CSV, defaults to FUEL_STATIONS_CSV")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--keep-missing', action='store_true',
+                            help="keep stations that are not in the CSV")
+
+    def handle(self, *args, **options):
+        try:
+            _, rows = read_rows(options['stations'])
+        except (OSError, KeyError) as e:
+            raise CommandError(f"Could not read {options['stations']}: {e}")
+        stats = FuelStation.objects.sync_rows(rows.values(), batch_size=options['batch_size'],
+                                              prune=not options['keep_missing'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['created']} created, {stats['updated']} updated, {stats['unchanged']} unchanged, "
+            f"{stats['removed']} removed; {FuelStation.objects.count()} stations"))
+        if settings.ROUTE_LANES_ENABLED and Lane.objects.exists():
+            call_command('precompute_lanes', refresh=True, stdout=self.stdout, stderr=self.stderr)
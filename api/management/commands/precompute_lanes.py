@@ -0,0 +1,84 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...lanes import is_current, lane_key
+from ...models import Lane
+from ...views import RouteView, _stations_location_version
+
+
+class Command(BaseCommand):
+    help = ("Route high-volume lanes once and store their corridor stations, so /route/ on "
+            "those lanes only runs the fuel planner against current prices. The lane file is a "
+            "JSON array of trips with the /route/ query fields, or a CSV with those columns. "
+            "With --refresh, stored lanes are projected again onto the current station "
+            "locations if these changed; price changes don't need a refresh.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('lane_file', nargs='?')
+        parser.add_argument('--refresh', action='store_true',
+                            help="re-project stored lanes whose station locations are out of date")
+        parser.add_argument('--prune', action='store_true',
+                            help="delete stored lanes that are not in the lane file")
+
+    def handle(self, *args, **options):
+        if not options['lane_file'] and not options['refresh']:
+            raise CommandError("Give a lane file, --refresh, or both")
+        if options['prune'] and not options['lane_file']:
+            raise CommandError("--prune needs a lane file")
+        location_version = _stations_location_version()
+        if location_version is None:
+            raise CommandError("No station data to precompute lanes against")
+        view = RouteView()
+
+        keys = set()
+        if options['lane_file']:
+            lanes = self._read_lanes(view, options['lane_file'])
+            failed = 0
+            for coordinates in lanes.values():
+                route_data = view._get_route_geometry(*coordinates[0], *coordinates[-1],
+                                                      [(lat, lng) for lng, lat in coordinates[1:-1]])
+                if not route_data:
+                    failed += 1
+                    self.stderr.write(f"Could not route lane {coordinates}")
+                    continue
+                lane = view._precompute_lane(coordinates, route_data, location_version)
+                keys.add(lane.key)
+                self.stdout.write(f"{lane}: {lane.total_miles:.0f} miles")
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(keys)} lanes precomputed, {failed} could not be routed"))
+            if options['prune']:
+                removed = Lane.objects.exclude(key__in=keys).delete()[0]
+                self.stdout.write(f"Deleted {removed} lanes not in {options['lane_file']}")
+
+        if options['refresh']:
+            refreshed = 0
+            for lane in Lane.objects.exclude(key__in=keys).iterator():
+                if not is_current(lane, location_version):
+                    view._refresh_lane(lane, location_version)
+                    refreshed += 1
+            self.stdout.write(f"Refreshed {refreshed} lanes for station locations {location_version}")
+
+    def _read_lanes(self, view, path):
+        """{lane key: [lng, lat] coordinates} of the distinct lanes in a lane file"""
+        try:
+            with open(path, newline='') as f:
+                trips = list(csv.DictReader(f)) if path.endswith('.csv') else json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+        if not isinstance(trips, list):
+            raise CommandError(f"{path} must hold a JSON array of trips")
+
+        lanes = {}
+        for i, trip in enumerate(trips):
+            try:
+                if not isinstance(trip, dict):
+                    raise ValueError('Trip must be a JSON object')
+                params = view._parse_params(trip)
+            except ValueError as e:
+                raise CommandError(f"Lane {i}: {e}")
+            coordinates = view._route_coordinates(params['start_lng'], params['start_lat'],
+                                                  params['end_lng'], params['end_lat'], params['waypoints'])
+            lanes.setdefault(lane_key(coordinates), coordinates)
+        return lanes
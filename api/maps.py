@@ -0,0 +1,62 @@
+import hashlib
+import json
+import logging
+
+import numpy as np
+import polyline
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+
+from visualize_map import plot_route_on_map
+
+from .simplify import simplify
+
+logger = logging.getLogger(__name__)
+
+
+def store_map(start, finish, stations, encoded_polyline):
+    """Save what is needed to draw a route map and return its content-addressed ID
+
+    Nothing is rendered here; render_map draws the map on first fetch.
+    """
+    spec = {
+        'start': list(start),
+        'finish': list(finish),
+        'stations': [list(station) for station in stations],
+        'polyline': encoded_polyline,
+    }
+    map_id = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:32]
+    try:
+        caches[settings.ROUTE_MAP_CACHE_ALIAS].add(f"map:{map_id}", spec, settings.ROUTE_MAP_TTL)
+    except DatabaseError as e:
+        logger.error(f"Map cache write failed: {e}")
+        return None
+    return map_id
+
+
+def render_map(map_id):
+    """HTML for a stored map, rendered once and then served from the cache"""
+    cache = caches[settings.ROUTE_MAP_CACHE_ALIAS]
+    try:
+        html = cache.get(f"map-html:{map_id}")
+        if html is not None:
+            return html
+        spec = cache.get(f"map:{map_id}")
+    except DatabaseError as e:
+        logger.error(f"Map cache read failed: {e}")
+        return None
+    if spec is None:
+        return None
+
+    coordinates = np.array(polyline.decode(spec['polyline']), dtype=np.float64).reshape(-1, 2)
+    kept = simplify(coordinates[:, 0], coordinates[:, 1], settings.ROUTE_SIMPLIFY_MAP_METERS)
+    route = [(lat, lng, 0) for lat, lng in coordinates[kept].tolist()]
+    stations = [tuple(station) for station in spec['stations']]
+    route_map = plot_route_on_map(tuple(spec['start']), tuple(spec['finish']), stations, route)
+    html = route_map.get_root().render()
+    try:
+        cache.set(f"map-html:{map_id}", html, settings.ROUTE_MAP_TTL)
+    except DatabaseError as e:
+        logger.error(f"Map cache write failed: {e}")
+    return html
@@ -0,0 +1,241 @@
+"""Per-stage request timing, Server-Timing headers and Prometheus metrics.
+
+Views wrap each stage of a request in `stage('name')`. With METRICS_ENABLED
+the durations go into the request's Server-Timing header and into
+process-wide latency histograms served as Prometheus text at /metrics.
+Disabled, `stage` hands back a shared no-op context manager and the
+middleware passes requests straight through.
+
+Every worker process keeps its own registry, so scrape each worker or put
+them behind one process per port.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+from django.conf import settings
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_timings = contextvars.ContextVar('request_timings', default=None)
+_no_stage = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout"""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """Stage and request latency histograms plus event counters for one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.requests = {}
+        self.counters = {}
+
+    def observe_stage(self, name, ms):
+        with self._lock:
+            self.stages.setdefault(name, Histogram()).observe(ms)
+
+    def observe_request(self, view, status, ms):
+        with self._lock:
+            self.requests.setdefault((view, str(status)), Histogram()).observe(ms)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            copy = lambda histograms: {key: (h.buckets, list(h.counts), h.total, h.count)
+                                       for key, h in histograms.items()}
+            return copy(self.stages), copy(self.requests), dict(self.counters)
+
+    def clear(self):
+        with self._lock:
+            self.stages.clear()
+            self.requests.clear()
+            self.counters.clear()
+
+
+registry = Registry()
+
+
+class RequestTimings:
+    """Stage durations of one request, in the order they finished"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+
+    def add(self, name, ms):
+        # Stages repeated within a request (e.g. per route in a batch) add up
+        with self._lock:
+            self.durations[name] = self.durations.get(name, 0.0) + ms
+
+    def header(self):
+        with self._lock:
+            return ', '.join(f"{name};dur={ms:.2f}" for name, ms in self.durations.items())
+
+
+class _Stage:
+    __slots__ = ('name', 'timings', 'start')
+
+    def __init__(self, name, timings):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        ms = (time.perf_counter() - self.start) * 1000
+        self.timings.add(self.name, ms)
+        registry.observe_stage(self.name, ms)
+        return False
+
+
+def stage(name):
+    """Context manager timing one stage of the current request"""
+    timings = _timings.get()
+    if timings is None:
+        return _no_stage
+    return _Stage(name, timings)
+
+
+def increment(name, amount=1):
+    """Count an event, e.g. a cache hit, while metrics are enabled"""
+    if settings.METRICS_ENABLED:
+        registry.increment(name, amount)
+
+
+def run_in_context(func):
+    """Wrap `func` to run in a copy of the caller's context, for executor threads
+
+    Executors don't carry context variables over, so stages timed in a
+    worker thread would otherwise be lost.
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
+
+
+class MetricsMiddleware:
+    """Times requests and adds Server-Timing headers while METRICS_ENABLED is set"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Django 3.2 only checks this marker to call middleware as a coroutine
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        timings, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        timings, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, start)
+
+    def _start(self):
+        timings = RequestTimings()
+        return timings, _timings.set(timings), time.perf_counter()
+
+    def _finish(self, request, response, timings, start):
+        ms = (time.perf_counter() - start) * 1000
+        timings.add('total', ms)
+        response['Server-Timing'] = timings.header()
+        match = getattr(request, 'resolver_match', None)
+        registry.observe_request(match.url_name if match else 'unmatched', response.status_code, ms)
+        return response
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def _histogram_lines(name, help_text, histograms, label_names):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for key, (buckets, counts, total, count) in sorted(histograms.items()):
+        labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {total:.3f}")
+        lines.append(f"{name}_count{_labels(**labels)} {count}")
+    return lines
+
+
+def render():
+    """Prometheus text exposition of this process's metrics"""
+    from . import routing
+    from .route_cache import get_projection_cache, get_route_cache
+    from .singleflight import get_route_flight
+
+    stages, requests, counters = registry.snapshot()
+    lines = _histogram_lines('route_stage_duration_ms', 'Time spent in each stage of a route request',
+                             stages, ('stage',))
+    lines += _histogram_lines('http_request_duration_ms', 'Request latency by view and status',
+                              requests, ('view', 'status'))
+
+    totals = dict(counters)
+    route_cache = get_route_cache().stats()
+    totals.update({
+        'route_cache_memory_hits': route_cache['memory_hits'],
+        'route_cache_persistent_hits': route_cache['persistent_hits'],
+        'route_cache_misses': route_cache['misses'],
+        'route_cache_evictions': route_cache['evictions'],
+    })
+    projection_cache = get_projection_cache().stats()
+    totals.update({
+        'projection_cache_hits': projection_cache['hits'],
+        'projection_cache_misses': projection_cache['misses'],
+    })
+    flights = get_route_flight().stats()
+    totals.update({
+        'route_flight_calls': flights['calls'],
+        'route_requests_coalesced': flights['coalesced'],
+    })
+    for prefix, client in (('routing', routing._client), ('routing_async', routing._async_client)):
+        if client is not None:
+            client_stats = client.stats()
+            for field in ('requests', 'failures', 'retries', 'rejected'):
+                totals[f"{prefix}_{field}"] = client_stats[field]
+    for name, value in sorted(totals.items()):
+        lines += [f"# TYPE {name}_total counter", f"{name}_total {value}"]
+    return '\n'.join(lines) + '\n'
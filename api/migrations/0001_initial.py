@@ -0,0 +1,51 @@
+# Generated by Django 3.2.23 on 2026-10-18 07:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FuelPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location', models.CharField(max_length=255)),
+                ('price_per_gallon', models.DecimalField(decimal_places=2, max_digits=5)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FuelStation',
+            fields=[
+                ('opis_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('address', models.CharField(max_length=255)),
+                ('city', models.CharField(max_length=100)),
+                ('state', models.CharField(max_length=2)),
+                ('rack_id', models.IntegerField(null=True)),
+                ('price', models.FloatField()),
+                ('lat', models.FloatField(null=True)),
+                ('lng', models.FloatField(null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Route',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_location', models.CharField(max_length=255)),
+                ('finish_location', models.CharField(max_length=255)),
+                ('distance', models.FloatField()),
+                ('fuel_stops', models.ManyToManyField(related_name='routes', to='api.FuelPrice')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='fuelstation',
+            index=models.Index(fields=['lat', 'lng'], name='api_fuelsta_lat_eb8e60_idx'),
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from api.spatial import create_rtree, drop_rtree
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2.23 on 2026-10-18 07:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_fuelstation_rtree'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='input_hash',
+            field=models.CharField(max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='plan',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='price_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='total_cost',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.23 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_route_plan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Lane',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('coordinates', models.JSONField()),
+                ('polyline', models.TextField()),
+                ('total_miles', models.FloatField()),
+                ('way_points', models.JSONField(default=list)),
+                ('way_point_miles', models.JSONField(default=list)),
+                ('leg_miles', models.JSONField(default=list)),
+                ('corridor_miles', models.FloatField()),
+                ('location_version', models.CharField(max_length=64)),
+                ('station_ids', models.JSONField(default=list)),
+                ('mile_positions', models.JSONField(default=list)),
+                ('distances', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,4 +1,12 @@
-from django.db import models
+import hashlib
+
+from django.db import connections, models, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from . import spatial
+from .stations import StationIndex
+
 
 class FuelPrice(models.Model):
     location = models.CharField(max_length=255)
@@ -12,6 +20,180 @@ class Route(models.Model):
     finish_location = models.CharField(max_length=255)
     distance = models.FloatField()  # Distance in miles
     fuel_stops = models.ManyToManyField(FuelPrice, related_name='routes')
+    # Computed plans (see api.plans): the hash covers every input including
+    # the station data version, so new prices never match an old plan
+    input_hash = models.CharField(max_length=64, unique=True, null=True)
+    price_version = models.CharField(max_length=64, blank=True, default='')
+    total_cost = models.FloatField(null=True)
+    plan = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Route from {self.start_location} to {self.finish_location}"
+
+class FuelStationQuerySet(models.QuerySet):
+    def in_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """Stations inside a lat/lng box, through the R*Tree on SQLite"""
+        if spatial.has_rtree(connections[self.db]):
+            return self.filter(pk__in=RawSQL(spatial.RTREE_BBOX_SQL, (min_lat, max_lat, min_lng, max_lng)))
+        return self.filter(lat__range=(min_lat, max_lat), lng__range=(min_lng, max_lng))
+
+    def near_route(self, route, miles):
+        """Candidate stations within `miles` of a RouteGeometry, a superset needing an exact check
+
+        The route is cut into short pieces and one box per piece is searched,
+        so a long diagonal route does not drag in everything between its ends.
+        """
+        boxes = spatial.route_boxes(route.lats, route.lngs, miles)
+        if not boxes:
+            return self.none()
+        if spatial.has_rtree(connections[self.db]):
+            sql = ' UNION '.join([spatial.RTREE_BBOX_SQL] * len(boxes))
+            params = [value for box in boxes for value in (box[0], box[2], box[1], box[3])]
+            return self.filter(pk__in=RawSQL(sql, params))
+        query = models.Q()
+        for min_lat, min_lng, max_lat, max_lng in boxes:
+            query |= models.Q(lat__range=(min_lat, max_lat), lng__range=(min_lng, max_lng))
+        return self.filter(query)
+
+    def data_version(self):
+        """Identifies the current station data; changes when stations are added, removed or updated"""
+        summary = self.aggregate(count=models.Count('pk'), updated=models.Max('updated_at'))
+        if not summary['count']:
+            return None
+        return hashlib.sha256(f"{summary['count']}:{summary['updated'].isoformat()}".encode()).hexdigest()[:16]
+
+    def location_version(self):
+        """Identifies the station locations; unlike data_version it ignores price changes"""
+        version = self.data_version()
+        if version is None:
+            return None
+        location = _location_versions.get(version)
+        if location is None:
+            rows = self.filter(lat__isnull=False, lng__isnull=False).order_by('pk').values_list('pk', 'lat', 'lng')
+            location = hashlib.sha256(repr(list(rows)).encode()).hexdigest()[:16]
+            _location_versions.clear()
+            _location_versions[version] = location
+        return location
+
+    def as_index(self, version=None):
+        """StationIndex over the stations with coordinates"""
+        rows = self.filter(lat__isnull=False, lng__isnull=False).values_list('pk', 'lat', 'lng', 'price')
+        return _build_index(list(rows), version=version)
+
+    def index_near_routes(self, routes, miles):
+        """StationIndex over the stations near any of `routes`, one query per route"""
+        rows = {}
+        for route in routes:
+            candidates = self.near_route(route, miles).filter(lat__isnull=False, lng__isnull=False)
+            rows.update((row[0], row) for row in candidates.values_list('pk', 'lat', 'lng', 'price'))
+        return _build_index([rows[pk] for pk in sorted(rows)], version=self.data_version())
+
+    def sync_rows(self, rows, batch_size=1000, prune=False):
+        """Insert or update stations from geocoded CSV rows in one transaction
+
+        Only stations whose fields changed are written. With `prune`, stations
+        not in `rows` are deleted. Returns counts of what changed.
+        """
+        incoming = {}
+        for row in rows:
+            station = FuelStation.from_row(row)
+            if station is not None:
+                incoming[station.opis_id] = station
+        existing = self.in_bulk(list(incoming))
+        now = timezone.now()
+        created, changed = [], []
+        for opis_id, station in incoming.items():
+            current = existing.get(opis_id)
+            if current is None:
+                created.append(station)
+            elif any(getattr(current, f) != getattr(station, f) for f in FuelStation.SYNC_FIELDS):
+                station.updated_at = now
+                changed.append(station)
+        with transaction.atomic(using=self.db):
+            self.bulk_create(created, batch_size=batch_size)
+            self.bulk_update(changed, FuelStation.SYNC_FIELDS + ['updated_at'], batch_size=batch_size)
+            removed = self.exclude(pk__in=list(incoming)).delete()[0] if prune else 0
+        return {'created': len(created), 'updated': len(changed),
+                'unchanged': len(existing) - len(changed), 'removed': removed}
+
+
+# Location version of the latest data_version, so it is computed once per data change
+_location_versions = {}
+
+
+def _build_index(rows, version=None):
+    if not rows:
+        return StationIndex([], [], [], version=version)
+    ids, lats, lngs, prices = zip(*rows)
+    return StationIndex(lats, lngs, prices, version=version, ids=ids)
+
+
+class FuelStation(models.Model):
+    """A truck stop from the OPIS price list, with its geocoded location"""
+
+    SYNC_FIELDS = ['name', 'address', 'city', 'state', 'rack_id', 'price', 'lat', 'lng']
+
+    opis_id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=255)
+    address = models.CharField(max_length=255)
+    city = models.CharField(max_length=100)
+    state = models.CharField(max_length=2)
+    rack_id = models.IntegerField(null=True)
+    price = models.FloatField()
+    lat = models.FloatField(null=True)
+    lng = models.FloatField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = FuelStationQuerySet.as_manager()
+
+    class Meta:
+        # Bounding-box fallback on databases without the R*Tree
+        indexes = [models.Index(fields=['lat', 'lng'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.city}, {self.state}): ${self.price}/gallon"
+
+    @classmethod
+    def from_row(cls, row):
+        """Unsaved station from a geocoded fuel price CSV row, or None if the row is unusable"""
+        try:
+            return cls(
+                opis_id=int(row['OPIS Truckstop ID']),
+                name=row['Truckstop Name'],
+                address=row['Address'],
+                city=row['City'],
+                state=row['State'],
+                rack_id=int(row['Rack ID']) if row.get('Rack ID') else None,
+                price=float(row['Retail Price']),
+                lat=float(row['Latitude']) if row.get('Latitude') else None,
+                lng=float(row['Longitude']) if row.get('Longitude') else None,
+            )
+        except (KeyError, ValueError, TypeError):
+            return None
+
+
+class Lane(models.Model):
+    """A recurring trip with its route and corridor stations precomputed (see api.lanes)
+
+    Stations are stored by OPIS ID, sorted by mile position, so current
+    prices are looked up at request time. `location_version` records the
+    station locations they were projected from.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    coordinates = models.JSONField()  # [lng, lat] from the start through the waypoints to the end
+    polyline = models.TextField()
+    total_miles = models.FloatField()
+    way_points = models.JSONField(default=list)
+    way_point_miles = models.JSONField(default=list)
+    leg_miles = models.JSONField(default=list)
+    corridor_miles = models.FloatField()
+    location_version = models.CharField(max_length=64)
+    station_ids = models.JSONField(default=list)
+    mile_positions = models.JSONField(default=list)
+    distances = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Route from {self.start_location} to {self.finish_location}"
\ No newline at end of file
+        start, end = self.coordinates[0], self.coordinates[-1]
+        return f"Lane {start[1]},{start[0]} to {end[1]},{end[0]} ({len(self.station_ids)} stations)"
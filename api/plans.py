@@ -0,0 +1,76 @@
+"""Computed fuel plans persisted on the Route model.
+
+A plan is stored under a hash of everything it depends on: the rounded trip
+coordinates and waypoints, strategy, vehicle parameters, corridor width and
+the version of the station data. New prices therefore never match an old
+plan, and prune_plans clears the stale rows.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .models import Route
+
+logger = logging.getLogger(__name__)
+
+
+def plan_key(params, version, vehicle):
+    """Input hash for a trip plan, or None when plans can't be stored for this station data
+
+    `vehicle` is the (range_miles, mpg, start_fuel) the solver runs with.
+    """
+    if version is None or not settings.ROUTE_PLANS_ENABLED:
+        return None
+    precision = settings.ROUTE_CACHE_PRECISION
+    inputs = {
+        'trip': [f"{params[k]:.{precision}f}" for k in ('start_lat', 'start_lng', 'end_lat', 'end_lng')],
+        'waypoints': [[f"{c:.{precision}f}" for c in point] for point in params.get('waypoints', ())],
+        'strategy': params['strategy'],
+        'vehicle': list(vehicle),
+        'corridor_miles': settings.ROUTE_CORRIDOR_MILES,
+        'stations': version,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+
+def get_plans(keys):
+    """Stored plans for the given input hashes, as {key: plan}"""
+    keys = [key for key in keys if key]
+    if not keys:
+        return {}
+    try:
+        return dict(Route.objects.filter(input_hash__in=keys).values_list('input_hash', 'plan'))
+    except DatabaseError as e:
+        logger.error(f"Route plan read failed: {e}")
+        return {}
+
+
+def plan_record(key, params, version, total_miles, plan):
+    """Unsaved Route holding a computed plan"""
+    return Route(
+        start_location=f"{params['start_lat']},{params['start_lng']}",
+        finish_location=f"{params['end_lat']},{params['end_lng']}",
+        distance=total_miles,
+        input_hash=key,
+        price_version=version,
+        total_cost=plan['total_cost'],
+        plan=plan,
+    )
+
+
+def save_plans(records):
+    """Insert plan records in one statement; a plan stored meanwhile by another worker wins"""
+    if not records:
+        return
+    try:
+        Route.objects.bulk_create(records, ignore_conflicts=True)
+    except DatabaseError as e:
+        logger.error(f"Route plan write failed: {e}")
+
+
+def prune_plans(version):
+    """Delete stored plans computed from station data other than `version`"""
+    return Route.objects.filter(input_hash__isnull=False).exclude(price_version=version).delete()[0]
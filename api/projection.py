@@ -0,0 +1,140 @@
+"""Exact projection of stations onto the segments of a route polyline.
+
+Stations are measured to the great-circle arc of each route segment rather
+than to the nearest vertex, and their mile position is interpolated between
+the segment's endpoints. Accuracy no longer depends on vertex spacing, so
+projection can run on a heavily simplified geometry.
+
+Long segments are densified with query points at most `spacing_miles` apart.
+A KDTree over those points, as unit vectors, finds the segments worth an exact
+check: any segment within distance d of a station has a query point within
+d + spacing / 2 of it.
+"""
+import numpy as np
+from scipy.spatial import KDTree
+
+from .geo import EARTH_RADIUS_MILES, arc_frames, central_angle, dot, unit_vectors
+
+# Query point spacing as a fraction of the corridor width; the corridor
+# search radius grows by half of it
+QUERY_SPACING = 0.5
+MIN_QUERY_SPACING_MILES = 0.1
+
+
+def query_spacing(corridor_miles):
+    return max(corridor_miles * QUERY_SPACING, MIN_QUERY_SPACING_MILES)
+
+
+def _chord(radians):
+    """Straight-line distance between unit vectors `radians` apart"""
+    return 2 * np.sin(np.minimum(radians, np.pi) / 2)
+
+
+class SegmentIndex:
+    """Route segments with densified query points for finding the nearest one
+
+    `coords` holds the query points as (lat, lng) degrees, for corridor
+    searches against the station index, and `segment` the segment each one
+    lies on.
+    """
+
+    __slots__ = ('route', 'spacing_miles', 'xyz', 'coords', 'segment', 'tree')
+
+    def __init__(self, route, spacing_miles):
+        self.route = route
+        self.spacing_miles = spacing_miles
+        self.xyz = unit_vectors(route.lats, route.lngs)
+        n = len(route)
+        if n < 2:
+            self.coords = route.coords
+            self.segment = np.zeros(n, dtype=np.intp)
+            points = self.xyz
+        else:
+            a, b = self.xyz[:, :-1], self.xyz[:, 1:]
+            theta = central_angle(a, b)
+            pieces = np.maximum(np.ceil(theta * EARTH_RADIUS_MILES / spacing_miles), 1).astype(np.intp)
+            self.segment = np.append(np.repeat(np.arange(n - 1), pieces), n - 2)
+            first = np.cumsum(pieces) - pieces
+            fraction = np.append((np.arange(pieces.sum()) - np.repeat(first, pieces))
+                                 / np.repeat(pieces, pieces), 1.0)
+            points = self._slerp(self.segment, fraction, theta[self.segment])
+            lat = np.degrees(np.arcsin(np.clip(points[2], -1.0, 1.0)))
+            lng = np.degrees(np.arctan2(points[1], points[0]))
+            self.coords = np.column_stack((lat, lng))
+        self.tree = KDTree(points.T) if n else None
+
+    def _slerp(self, segment, fraction, theta):
+        """Points at `fraction` of the way along each segment's arc"""
+        a, b = self.xyz[:, segment], self.xyz[:, segment + 1]
+        sin_theta = np.sin(theta)
+        short = sin_theta < 1e-12
+        sin_theta[short] = 1.0
+        weight_a = np.where(short, 1 - fraction, np.sin((1 - fraction) * theta) / sin_theta)
+        weight_b = np.where(short, fraction, np.sin(fraction * theta) / sin_theta)
+        points = weight_a * a + weight_b * b
+        return points / np.sqrt(dot(points, points))
+
+    def project(self, lats, lngs, max_miles):
+        """Project points within `max_miles` of the route onto it
+
+        Returns (point indices, segment index, mile position, distance in
+        miles) for the points that are inside, each as an array.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        if self.tree is None or not lats.size:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty, np.empty(0), np.empty(0)
+        points = unit_vectors(lats, lngs)
+        max_angle = max_miles / EARTH_RADIUS_MILES
+        half_spacing = self.spacing_miles / 2 / EARTH_RADIUS_MILES
+
+        # The nearest query point's segment bounds the distance from above
+        _, nearest = self.tree.query(points.T)
+        guess, _ = self._arc_projection(points, self.segment[nearest])
+        reach = np.minimum(guess, max_angle) + half_spacing
+        near = np.flatnonzero(guess <= max_angle + half_spacing)
+        hits = self.tree.query_ball_point(points[:, near].T, _chord(reach[near]) * (1 + 1e-9),
+                                          return_sorted=False)
+        counts = np.fromiter((len(h) for h in hits), dtype=np.intp, count=len(hits))
+        found = np.fromiter((i for h in hits for i in h), dtype=np.intp, count=int(counts.sum()))
+        segments = max(len(self.route) - 1, 1)
+        pairs = np.unique(np.repeat(near, counts) * segments + self.segment[found])
+        point_index, segment = np.divmod(pairs, segments)
+
+        distance, fraction = self._arc_projection(points[:, point_index], segment)
+        # Pairs are sorted by point; keep each point's nearest segment
+        order = np.lexsort((distance, point_index))
+        first = np.flatnonzero(np.diff(point_index[order], prepend=-1))
+        best = order[first]
+        best = best[distance[best] <= max_angle]
+        point_index, segment, distance, fraction = (point_index[best], segment[best],
+                                                    distance[best], fraction[best])
+        miles = self.route.miles
+        if len(self.route) > 1:
+            mile_position = miles[segment] + fraction * (miles[segment + 1] - miles[segment])
+        else:
+            mile_position = miles[segment]
+        return point_index, segment, mile_position, distance * EARTH_RADIUS_MILES
+
+    def _arc_projection(self, points, segment):
+        """(angle to the segment's arc, fraction along it of the nearest point) for paired points"""
+        a = self.xyz[:, segment]
+        if len(self.route) < 2:
+            return central_angle(points, a), np.zeros(segment.size)
+        b = self.xyz[:, segment + 1]
+        frames = arc_frames(a, b)
+        normal, after_a, before_b = frames[0:3], frames[3:6], frames[6:9]
+        height = dot(points, normal)
+        distance = np.arcsin(np.clip(np.abs(height), 0.0, 1.0))
+        theta = central_angle(a, b)
+        # Angle from a to the foot of the perpendicular, in the plane of the arc
+        along = np.arctan2(dot(points, after_a), dot(points, a))
+        fraction = np.clip(along / np.where(theta > 0, theta, 1.0), 0.0, 1.0)
+
+        beyond = (dot(points, after_a) < 0) | (dot(points, before_b) < 0) | (theta == 0)
+        if beyond.any():
+            to_a = central_angle(points[:, beyond], a[:, beyond])
+            to_b = central_angle(points[:, beyond], b[:, beyond])
+            distance[beyond] = np.minimum(to_a, to_b)
+            fraction[beyond] = np.where(to_b < to_a, 1.0, 0.0)
+        return distance, fraction
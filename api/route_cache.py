@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import polyline
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError
+
+from .geo import RouteGeometry
+
+logger = logging.getLogger(__name__)
+
+
+class RouteCache:
+    """Two-tier cache of route geometry keyed on rounded start/end coordinates
+
+    The memory tier is a per-process LRU of decoded routes. The persistent
+    tier is a Django cache (the database by default) holding only the encoded
+    polyline, mileage and leg boundaries, so every worker and restart can
+    reuse it.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, precision=None, alias=None):
+        self.max_entries = settings.ROUTE_CACHE_MEMORY_ENTRIES if max_entries is None else max_entries
+        self.ttl = settings.ROUTE_CACHE_TTL if ttl is None else ttl
+        self.precision = settings.ROUTE_CACHE_PRECISION if precision is None else precision
+        self.alias = settings.ROUTE_CACHE_ALIAS if alias is None else alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def make_key(self, *coordinates):
+        """Cache key for a route through the given (lng, lat) values"""
+        rounded = ','.join(f"{c:.{self.precision}f}" for c in coordinates)
+        return f"route:{rounded}"
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, route_data = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return route_data
+                del self._entries[key]
+
+        try:
+            stored = caches[self.alias].get(key)
+        except DatabaseError as e:
+            logger.error(f"Route cache read failed: {e}")
+            stored = None
+        if stored is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        geometry = RouteGeometry.from_coordinates(polyline.decode(stored['polyline']))
+        # Entries written before multi-stop routes have a single leg
+        way_points = stored.get('way_points', [0, max(len(geometry) - 1, 0)])
+        route_data = {
+            'geometry': geometry,
+            'total_miles': stored['total_miles'],
+            'polyline': stored['polyline'],
+            'way_points': way_points,
+            'leg_miles': stored.get('leg_miles', [stored['total_miles']]),
+        }
+        with self._lock:
+            self.persistent_hits += 1
+        self._remember(key, route_data)
+        return route_data
+
+    def set(self, key, route_data):
+        self._remember(key, route_data)
+        try:
+            caches[self.alias].set(key, {
+                'polyline': route_data['polyline'],
+                'total_miles': route_data['total_miles'],
+                'way_points': route_data['way_points'],
+                'leg_miles': route_data['leg_miles'],
+            }, self.ttl)
+        except DatabaseError as e:
+            logger.error(f"Route cache write failed: {e}")
+
+    def _remember(self, key, route_data):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, route_data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear_memory(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_entries': len(self._entries),
+                'memory_hits': self.memory_hits,
+                'persistent_hits': self.persistent_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class ProjectionCache:
+    """Station projections per RouteGeometry, for the route's lifetime
+
+    Projecting stations onto a route is the expensive part of planning and
+    does not depend on the vehicle, so plans that only differ in range, MPG
+    or fuel reuse it. Entries are keyed on the station data and corridor and
+    go away with the geometry, which the route cache keeps alive while the
+    route is in use.
+    """
+
+    def __init__(self, max_per_route=4):
+        self.max_per_route = max_per_route
+        self._routes = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, route, fuel_stations, corridor_miles):
+        """The cached projection of `fuel_stations` onto `route`, or None"""
+        key, owner = self._key(fuel_stations, corridor_miles)
+        with self._lock:
+            entry = self._routes.get(route, {}).get(key)
+            if entry is not None and (owner is None or entry[0]() is fuel_stations):
+                self._routes[route].move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        return None
+
+    def set(self, route, fuel_stations, corridor_miles, projection):
+        key, owner = self._key(fuel_stations, corridor_miles)
+        with self._lock:
+            entries = self._routes.setdefault(route, OrderedDict())
+            entries[key] = (owner, projection)
+            entries.move_to_end(key)
+            while len(entries) > self.max_per_route:
+                entries.popitem(last=False)
+
+    def get_or_compute(self, route, fuel_stations, corridor_miles, compute):
+        projection = self.get(route, fuel_stations, corridor_miles)
+        if projection is None:
+            projection = compute()
+            self.set(route, fuel_stations, corridor_miles, projection)
+        return projection
+
+    @staticmethod
+    def _key(fuel_stations, corridor_miles):
+        if fuel_stations.version:
+            # Projections hold station positions, so the index must list the
+            # same stations in the same order, not just share a data version
+            return (fuel_stations.version, fuel_stations.id_version, corridor_miles), None
+        # An unversioned index only matches itself; the weak reference guards
+        # against its id being reused by a later index
+        return (id(fuel_stations), corridor_miles), weakref.ref(fuel_stations)
+
+    def stats(self):
+        with self._lock:
+            return {'routes': len(self._routes), 'hits': self.hits, 'misses': self.misses}
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+_projection_cache = ProjectionCache()
+
+
+def get_route_cache():
+    """Return the process-wide route cache"""
+    global _route_cache
+    if _route_cache is None:
+        with _route_cache_lock:
+            if _route_cache is None:
+                _route_cache = RouteCache()
+    return _route_cache
+
+
+def get_projection_cache():
+    """Return the process-wide projection cache"""
+    return _projection_cache
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from collections import deque
+
+import httpx
+import numpy as np
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Upstream statuses worth another attempt; anything else is final
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class RoutingError(Exception):
+    """The upstream routing service could not produce a route"""
+
+
+class CircuitOpenError(RoutingError):
+    """Requests are being rejected without calling the upstream"""
+
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.error(f"Routing circuit opened after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class BaseRoutingClient:
+    """Settings, circuit breaker and metrics shared by the sync and async clients"""
+
+    def __init__(self, url=None, api_key=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, backoff=None, pool_size=None, breaker=None):
+        self.url = settings.ORS_DIRECTIONS_URL if url is None else url
+        self.api_key = settings.ORS_API_KEY if api_key is None else api_key
+        self.connect_timeout = settings.ORS_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.read_timeout = settings.ORS_READ_TIMEOUT if read_timeout is None else read_timeout
+        self.max_retries = settings.ORS_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff = settings.ORS_BACKOFF_SECONDS if backoff is None else backoff
+        self.pool_size = settings.ORS_POOL_SIZE if pool_size is None else pool_size
+        self.breaker = breaker or CircuitBreaker(settings.ORS_BREAKER_FAILURES,
+                                                 settings.ORS_BREAKER_RESET_SECONDS)
+        self.headers = {'Authorization': self.api_key or '', 'Content-Type': 'application/json'}
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def _check_circuit(self):
+        if not self.breaker.allow():
+            with self._lock:
+                self.rejected += 1
+            raise CircuitOpenError("Routing service unavailable, circuit open")
+
+    def _backoff_delay(self, attempt):
+        """Seconds to wait before retry `attempt`, counting the retry"""
+        with self._lock:
+            self.retries += 1
+        # Full jitter keeps retrying workers from hitting the upstream in lockstep
+        return random.uniform(0, self.backoff * 2 ** (attempt - 1))
+
+    def _record_latency(self, start):
+        with self._lock:
+            self.requests += 1
+            self._latencies.append((time.perf_counter() - start) * 1000)
+
+    def _handle_response(self, status_code, parse_json):
+        """Return the route for a 200, or the RoutingError and whether to retry"""
+        if status_code == 200:
+            self.breaker.record_success()
+            try:
+                return parse_json()['routes'][0], None, False
+            except (ValueError, KeyError, IndexError) as e:
+                return None, RoutingError(f"Malformed routing response: {e}"), False
+        error = RoutingError(f"Routing service returned {status_code}")
+        if status_code not in RETRY_STATUSES:
+            # The upstream is healthy, it just can't route these coordinates
+            self.breaker.record_success()
+            return None, error, False
+        return None, error, True
+
+    def _give_up(self, error):
+        with self._lock:
+            self.failures += 1
+        self.breaker.record_failure()
+        return error
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies)
+            stats = {
+                'requests': self.requests,
+                'failures': self.failures,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'circuit': self.breaker.state,
+            }
+        if latencies.size:
+            stats['latency_ms'] = {
+                'p50': round(float(np.percentile(latencies, 50)), 2),
+                'p95': round(float(np.percentile(latencies, 95)), 2),
+                'max': round(float(latencies.max()), 2),
+            }
+        return stats
+
+
+class RoutingClient(BaseRoutingClient):
+    """Pooled, timeout-bounded and retrying client for OpenRouteService directions"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def directions(self, coordinates):
+        """Return the first ORS route through the given [lng, lat] coordinates"""
+        self._check_circuit()
+        payload = {'coordinates': coordinates}
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(self._backoff_delay(attempt))
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=payload, headers=self.headers,
+                                             timeout=(self.connect_timeout, self.read_timeout))
+            except requests.RequestException as e:
+                error = RoutingError(f"Routing request failed: {e}")
+                continue
+            finally:
+                self._record_latency(start)
+            route, error, retry = self._handle_response(response.status_code, response.json)
+            if not retry:
+                if error:
+                    raise error
+                return route
+        raise self._give_up(error)
+
+
+class AsyncRoutingClient(BaseRoutingClient):
+    """asyncio counterpart of RoutingClient built on an httpx connection pool
+
+    httpx pools are bound to the event loop that created them, so one is kept
+    per running loop.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+            )
+            self._clients[loop] = client
+        return client
+
+    async def directions(self, coordinates):
+        """Return the first ORS route through the given [lng, lat] coordinates"""
+        self._check_circuit()
+        client = self._client()
+        payload = {'coordinates': coordinates}
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff_delay(attempt))
+            start = time.perf_counter()
+            try:
+                response = await client.post(self.url, json=payload, headers=self.headers)
+            except httpx.HTTPError as e:
+                error = RoutingError(f"Routing request failed: {e!r}")
+                continue
+            finally:
+                self._record_latency(start)
+            route, error, retry = self._handle_response(response.status_code, response.json)
+            if not retry:
+                if error:
+                    raise error
+                return route
+        raise self._give_up(error)
+
+    async def aclose(self):
+        """Close the pool belonging to the running event loop"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_routing_client():
+    """Return the process-wide routing client"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RoutingClient()
+    return _client
+
+
+def get_async_routing_client():
+    """Return the process-wide async routing client, sharing the sync client's circuit"""
+    global _async_client
+    if _async_client is None:
+        breaker = get_routing_client().breaker
+        with _client_lock:
+            if _async_client is None:
+                _async_client = AsyncRoutingClient(breaker=breaker)
+    return _async_client
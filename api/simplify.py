@@ -0,0 +1,88 @@
+"""Douglas-Peucker simplification of route polylines on the sphere.
+
+Distances are measured to the great-circle arc between kept vertices, so the
+guarantee holds on long routes: every dropped point lies within `tolerance_m`
+meters of the simplified polyline. Vectors are stored component-first, as
+(3, n) arrays, which keeps the per-round gathers contiguous.
+"""
+import numpy as np
+
+from .geo import arc_frames, central_angle, dot, unit_vectors
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def _frame_distance(points, frames, a, b):
+    """Meters from points to arcs whose frames are already paired with the points
+
+    `a` and `b` map a boolean mask of the points to their arc endpoints; they
+    are only needed for points beyond either end of their arc.
+    """
+    normal, after_a, before_b = frames[0:3], frames[3:6], frames[6:9]
+    distance = np.arcsin(np.clip(np.abs(dot(points, normal)), 0.0, 1.0))
+    beyond = (dot(points, after_a) < 0) | (dot(points, before_b) < 0) | ~dot(normal, normal).astype(bool)
+    if beyond.any():
+        outside = points[:, beyond]
+        distance[beyond] = np.minimum(central_angle(outside, a(beyond)), central_angle(outside, b(beyond)))
+    return distance * EARTH_RADIUS_M
+
+
+def arc_distance(points, a, b):
+    """Meters from each point to the great-circle arc from a to b, all (3, n) unit vectors"""
+    return _frame_distance(points, arc_frames(a, b),
+                           lambda mask: a[:, mask], lambda mask: b[:, mask])
+
+
+def simplify(lats, lngs, tolerance_m, max_segment_m=None):
+    """Indices of the vertices kept by Douglas-Peucker with a tolerance in meters
+
+    All pending segments are refined together each round, so the work is a
+    handful of array passes rather than one Python call per segment.
+    Segments longer than `max_segment_m` are split even when straight. A
+    tolerance of 0 keeps every vertex.
+    """
+    n = len(lats)
+    if n < 3 or tolerance_m <= 0:
+        return np.arange(n)
+    xyz = unit_vectors(lats, lngs)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    starts, ends = np.array([0]), np.array([n - 1])
+
+    while starts.size:
+        # Interior points of every pending segment, grouped by segment
+        counts = ends - starts - 1
+        first = np.cumsum(counts) - counts
+        segment = np.repeat(np.arange(starts.size), counts)
+        points = np.arange(counts.sum()) - np.repeat(first - starts - 1, counts)
+        frames = arc_frames(xyz[:, starts], xyz[:, ends]).take(segment, axis=1)
+        distance = _frame_distance(xyz.take(points, axis=1), frames,
+                                   lambda mask: xyz[:, starts[segment[mask]]],
+                                   lambda mask: xyz[:, ends[segment[mask]]])
+
+        worst = np.maximum.reduceat(distance, first)
+        position = np.where(distance == worst[segment], np.arange(distance.size), distance.size)
+        split = np.where(worst > tolerance_m, points[np.minimum.reduceat(position, first)], -1)
+        if max_segment_m is not None:
+            too_long = (split < 0) & (central_angle(xyz[:, starts], xyz[:, ends]) * EARTH_RADIUS_M > max_segment_m)
+            split = np.where(too_long, (starts + ends) // 2, split)
+
+        # Split segments become two pending halves; the rest are settled
+        refined = split >= 0
+        starts, split, ends = starts[refined], split[refined], ends[refined]
+        keep[split] = True
+        starts, ends = np.concatenate((starts, split)), np.concatenate((split, ends))
+        has_interior = ends - starts > 1
+        starts, ends = starts[has_interior], ends[has_interior]
+
+    return np.flatnonzero(keep)
+
+
+def max_error(lats, lngs, kept):
+    """Largest distance in meters from any original point to the simplified polyline"""
+    kept = np.asarray(kept)
+    if kept.size < 2:
+        return 0.0
+    xyz = unit_vectors(lats, lngs)
+    segment = np.clip(np.searchsorted(kept, np.arange(len(lats)), side='right') - 1, 0, kept.size - 2)
+    return float(arc_distance(xyz, xyz[:, kept[segment]], xyz[:, kept[segment + 1]]).max())
@@ -0,0 +1,90 @@
+"""Coalescing of concurrent identical work.
+
+While a call for a key is in flight, further calls with the same key wait
+for it and share its result (or exception) instead of repeating the work.
+Nothing is cached: once the call finishes, the next one starts afresh.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time, for threads and for asyncio tasks
+
+    `do` coalesces calls across threads. `ado` coalesces coroutines on the
+    same event loop; the work runs as its own task, so a cancelled caller
+    does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        """Return func(), or the result of the call already running for `key`"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key, coroutine_func):
+        """Await coroutine_func(), or the task already running for `key` on this loop"""
+        task_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = asyncio.ensure_future(coroutine_func())
+                task.add_done_callback(lambda _: self._forget(task_key))
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key):
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls) + len(self._tasks),
+                    'calls': self.calls, 'coalesced': self.coalesced}
+
+
+_route_flight = SingleFlight()
+
+
+def get_route_flight():
+    """Return the process-wide single flight for route requests"""
+    return _route_flight
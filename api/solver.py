@@ -0,0 +1,126 @@
+"""Fuel purchase planning along a route.
+
+Every planner takes the on-route stations as arrays sorted by mile position
+and returns a list of purchases ``{'index', 'gallons', 'cost'}`` (``index``
+points into those arrays), or None when the trip cannot be completed.
+"""
+from collections import deque
+
+import numpy as np
+
+# Purchases smaller than this many miles of fuel are floating point noise
+_EPSILON_MILES = 1e-9
+
+
+def plan_greedy(miles, prices, total_miles, range_miles, mpg, start_fuel=None):
+    """Cheapest station in each range window, then jump a full range past it
+
+    This is the original RouteView behaviour: each stop is billed for the
+    miles between the previous window start and the stop at the stop's price.
+    It always starts with a full tank; `start_fuel` is only accepted for a
+    uniform signature, and RouteView rejects it for this strategy.
+    """
+    plan = []
+    current_pos = 0.0
+    while current_pos < total_miles:
+        max_range = min(current_pos + range_miles, total_miles)
+        lo = np.searchsorted(miles, current_pos, side='left')
+        hi = np.searchsorted(miles, max_range, side='right')
+        if lo == hi:
+            return None
+        best = lo + int(np.argmin(prices[lo:hi]))
+        gallons = (miles[best] - current_pos) / mpg
+        plan.append({'index': best, 'gallons': gallons, 'cost': gallons * prices[best]})
+        current_pos = miles[best] + range_miles
+    return plan
+
+
+def next_cheaper(prices):
+    """Index of the next station with a strictly lower price, or -1"""
+    prices = np.asarray(prices).tolist()
+    result = [-1] * len(prices)
+    stack = []
+    for i, price in enumerate(prices):
+        while stack and prices[stack[-1]] > price:
+            result[stack.pop()] = i
+        stack.append(i)
+    return np.array(result, dtype=np.intp)
+
+
+def cheapest_ahead(miles, prices, range_miles):
+    """Index of the cheapest station after each station within range, or -1
+
+    Ties go to the furthest station. Uses a monotonic deque over the sliding
+    window (i, last station within range of i].
+    """
+    miles = np.asarray(miles, dtype=np.float64)
+    last = (np.searchsorted(miles, miles + range_miles, side='right') - 1).tolist()
+    prices = np.asarray(prices).tolist()
+    n = len(prices)
+    result = [-1] * n
+    window = deque()
+    pushed = 0
+    for i in range(n):
+        while pushed <= last[i]:
+            while window and prices[window[-1]] >= prices[pushed]:
+                window.pop()
+            window.append(pushed)
+            pushed += 1
+        while window and window[0] <= i:
+            window.popleft()
+        if window:
+            result[i] = window[0]
+    return np.array(result, dtype=np.intp)
+
+
+def plan_optimal(miles, prices, total_miles, range_miles, mpg, start_fuel=None):
+    """Minimum-cost purchases with partial fills (the gas station problem)
+
+    At each station: if a cheaper station is within range, buy just enough to
+    reach it; otherwise buy enough to finish if the destination is within
+    range, or fill up and go to the cheapest station within range. The tank
+    starts with `start_fuel` miles of fuel (a full tank by default) and
+    arrives empty. Runs in O(n) after the O(n log n) sort done by the caller.
+    """
+    miles = np.asarray(miles, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    fuel = range_miles if start_fuel is None else min(start_fuel, range_miles)
+    if total_miles <= fuel:
+        return []
+
+    # Stations at or past the destination are of no use
+    n = int(np.searchsorted(miles, total_miles, side='left'))
+    miles, prices = miles[:n], prices[:n]
+    if not n or miles[0] > fuel:
+        return None
+    cheaper = next_cheaper(prices).tolist()
+    ahead = cheapest_ahead(miles, prices, range_miles).tolist()
+    miles, prices = miles.tolist(), prices.tolist()
+
+    plan = []
+    i = 0
+    fuel -= miles[0]
+    while True:
+        j = cheaper[i]
+        if j != -1 and miles[j] - miles[i] <= range_miles:
+            target, buy = j, max(0.0, miles[j] - miles[i] - fuel)
+        elif total_miles - miles[i] <= range_miles:
+            target, buy = None, max(0.0, total_miles - miles[i] - fuel)
+        elif ahead[i] != -1:
+            target, buy = ahead[i], range_miles - fuel
+        else:
+            return None
+
+        if buy > _EPSILON_MILES:
+            gallons = buy / mpg
+            plan.append({'index': i, 'gallons': gallons, 'cost': gallons * prices[i]})
+        if target is None:
+            return plan
+        fuel += buy - (miles[target] - miles[i])
+        i = target
+
+
+STRATEGIES = {
+    'optimal': plan_optimal,
+    'greedy': plan_greedy,
+}
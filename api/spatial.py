@@ -0,0 +1,90 @@
+"""SQLite R*Tree index over FuelStation coordinates.
+
+The virtual table is kept in step with api_fuelstation by triggers, so
+bulk_create, bulk_update and deletes maintain it without extra work. Other
+databases fall back to the (lat, lng) B-tree index on the table itself.
+"""
+import math
+
+import numpy as np
+
+from .geo import MILES_PER_DEGREE_LAT, degree_radius
+
+RTREE_TABLE = 'api_fuelstation_rtree'
+
+# Box overlap test; parameters are min_lat, max_lat, min_lng, max_lng
+RTREE_BBOX_SQL = (f"SELECT id FROM {RTREE_TABLE} "
+                  f"WHERE max_lat >= %s AND min_lat <= %s AND max_lng >= %s AND min_lng <= %s")
+
+CREATE_RTREE = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    f"INSERT INTO {RTREE_TABLE} SELECT opis_id, lat, lat, lng, lng FROM api_fuelstation "
+    f"WHERE lat IS NOT NULL AND lng IS NOT NULL",
+    f"CREATE TRIGGER IF NOT EXISTS api_fuelstation_rtree_insert AFTER INSERT ON api_fuelstation "
+    f"WHEN NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL BEGIN "
+    f"INSERT OR REPLACE INTO {RTREE_TABLE} VALUES (NEW.opis_id, NEW.lat, NEW.lat, NEW.lng, NEW.lng); END",
+    f"CREATE TRIGGER IF NOT EXISTS api_fuelstation_rtree_update AFTER UPDATE OF lat, lng ON api_fuelstation "
+    f"BEGIN DELETE FROM {RTREE_TABLE} WHERE id = OLD.opis_id; "
+    f"INSERT INTO {RTREE_TABLE} SELECT NEW.opis_id, NEW.lat, NEW.lat, NEW.lng, NEW.lng "
+    f"WHERE NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL; END",
+    f"CREATE TRIGGER IF NOT EXISTS api_fuelstation_rtree_delete AFTER DELETE ON api_fuelstation "
+    f"BEGIN DELETE FROM {RTREE_TABLE} WHERE id = OLD.opis_id; END",
+]
+
+DROP_RTREE = [
+    "DROP TRIGGER IF EXISTS api_fuelstation_rtree_insert",
+    "DROP TRIGGER IF EXISTS api_fuelstation_rtree_update",
+    "DROP TRIGGER IF EXISTS api_fuelstation_rtree_delete",
+    f"DROP TABLE IF EXISTS {RTREE_TABLE}",
+]
+
+# Boxes per route query; keeps the parameter count under SQLite's limit
+MAX_ROUTE_BOXES = 200
+ROUTE_BOX_MILES = 25
+
+_rtree_available = {}
+
+
+def create_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in CREATE_RTREE:
+            schema_editor.execute(statement)
+        _rtree_available.clear()
+
+
+def drop_rtree(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in DROP_RTREE:
+            schema_editor.execute(statement)
+        _rtree_available.clear()
+
+
+def has_rtree(connection):
+    """Whether this database has the station R*Tree"""
+    if connection.vendor != 'sqlite':
+        return False
+    key = (connection.alias, str(connection.settings_dict['NAME']))
+    if key not in _rtree_available:
+        _rtree_available[key] = RTREE_TABLE in connection.introspection.table_names()
+    return _rtree_available[key]
+
+
+def route_boxes(lats, lngs, miles, box_miles=ROUTE_BOX_MILES):
+    """(min_lat, min_lng, max_lat, max_lng) boxes covering every point within `miles` of the route"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if not lats.size:
+        return []
+    span = float(np.ptp(lats) + np.ptp(lngs)) * MILES_PER_DEGREE_LAT
+    pieces = int(min(max(math.ceil(span / box_miles), 1), MAX_ROUTE_BOXES, lats.size))
+    starts = np.linspace(0, lats.size, pieces, endpoint=False).astype(np.intp)
+    # Each piece also covers the first point of the next one, so no gap opens between boxes
+    ends = np.append(starts[1:], lats.size - 1)
+    boxes = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        piece_lats, piece_lngs = lats[start:end + 1], lngs[start:end + 1]
+        lat_margin = miles / MILES_PER_DEGREE_LAT
+        lng_margin = degree_radius(miles, piece_lats)
+        boxes.append((float(piece_lats.min()) - lat_margin, float(piece_lngs.min()) - lng_margin,
+                      float(piece_lats.max()) + lat_margin, float(piece_lngs.max()) + lng_margin))
+    return boxes
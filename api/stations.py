@@ -0,0 +1,383 @@
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+from scipy.spatial import KDTree
+from django.conf import settings
+
+from .geo import degree_radius
+
+logger = logging.getLogger(__name__)
+
+
+class StationIndex:
+    """Read-only fuel station arrays plus a KDTree over (lat, lng).
+
+    One instance is shared by every request and worker thread, so the
+    arrays are flagged non-writeable and nothing mutates them after load.
+    New data means a new instance. `version` identifies the data it was
+    built from; `ids` are the OPIS Truckstop IDs.
+    """
+
+    # Built on first use, by whichever thread gets there first
+    _location_version = None
+    _id_version = None
+    _id_order = None
+
+    def __init__(self, lats, lngs, prices, version=None, ids=None):
+        coords = np.column_stack((np.asarray(lats, dtype=np.float64).reshape(-1),
+                                  np.asarray(lngs, dtype=np.float64).reshape(-1)))
+        prices = np.ascontiguousarray(prices, dtype=np.float64)
+        ids = np.arange(len(prices), dtype=np.int64) if ids is None else np.ascontiguousarray(ids, dtype=np.int64)
+        tree = KDTree(coords) if len(coords) else None
+        self._set_arrays(coords, prices, ids, tree, version)
+
+    @classmethod
+    def from_arrays(cls, coords, prices, ids, tree=None, version=None):
+        """Index over existing arrays without copying them, e.g. memory-mapped from a snapshot"""
+        index = cls.__new__(cls)
+        if tree is None and len(coords):
+            tree = KDTree(coords)
+        index._set_arrays(coords, prices, ids, tree, version)
+        return index
+
+    def _set_arrays(self, coords, prices, ids, tree, version):
+        self.version = version
+        self.coords = coords
+        self.prices = prices
+        self.ids = ids
+        for array in (self.coords, self.prices, self.ids):
+            if array.flags.writeable:
+                array.flags.writeable = False
+        # Column views: no copies, so snapshot pages stay shared
+        self.lats = self.coords[:, 0]
+        self.lngs = self.coords[:, 1]
+        self.tree = tree
+
+    @property
+    def location_version(self):
+        """Hash of the station IDs and coordinates, None for an unversioned index
+
+        Unlike `version` it stays the same when only prices change, or when
+        the same stations are loaded in a different order.
+        """
+        if self.version is None:
+            return None
+        if self._location_version is None:
+            order = self._ids_sorted()
+            digest = hashlib.sha256(self.ids[order].tobytes())
+            digest.update(np.ascontiguousarray(self.coords[order]).tobytes())
+            self._location_version = digest.hexdigest()[:16]
+        return self._location_version
+
+    @property
+    def id_version(self):
+        """Hash of the station IDs in index order
+
+        Positions into one index are only valid for another with the same
+        `id_version`; database subsets of the same data differ in it.
+        """
+        if self._id_version is None:
+            self._id_version = hashlib.sha256(np.ascontiguousarray(self.ids).tobytes()).hexdigest()[:16]
+        return self._id_version
+
+    def positions(self, ids):
+        """Index positions of the stations with the given OPIS IDs, -1 for unknown IDs"""
+        ids = np.asarray(ids, dtype=np.int64)
+        order = self._ids_sorted()
+        if not order.size:
+            return np.full(ids.size, -1, dtype=np.intp)
+        sorted_ids = self.ids[order]
+        found = np.minimum(np.searchsorted(sorted_ids, ids), order.size - 1)
+        return np.where((sorted_ids[found] == ids) & (ids >= 0), order[found], -1)
+
+    def _ids_sorted(self):
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind='stable')
+        return self._id_order
+
+    def __len__(self):
+        return len(self.prices)
+
+    def near_route(self, route_tree, miles):
+        """Indices of stations possibly within `miles` of any point in `route_tree`
+
+        The ball query runs in degree space, so callers must still check the
+        exact distance; the work scales with the stations near the route.
+        """
+        if self.tree is None or route_tree is None:
+            return np.empty(0, dtype=np.intp)
+        radius = degree_radius(miles, route_tree.data[:, 0])
+        hits = route_tree.query_ball_tree(self.tree, radius)
+        found = [np.asarray(h, dtype=np.intp) for h in hits if h]
+        if not found:
+            return np.empty(0, dtype=np.intp)
+        return np.unique(np.concatenate(found))
+
+    def near_routes(self, routes_coords, miles):
+        """near_route for several routes with a single ball query
+
+        Returns one array of candidate station indices per route.
+        """
+        if self.tree is None or not routes_coords:
+            return [np.empty(0, dtype=np.intp) for _ in routes_coords]
+        lengths = [len(coords) for coords in routes_coords]
+        if not sum(lengths):
+            return [np.empty(0, dtype=np.intp) for _ in routes_coords]
+        combined = np.concatenate([np.asarray(c, dtype=np.float64).reshape(-1, 2)
+                                   for c in routes_coords])
+        owner = np.repeat(np.arange(len(routes_coords)), lengths)
+        radius = degree_radius(miles, combined[:, 0])
+        hits = KDTree(combined).query_ball_tree(self.tree, radius)
+
+        counts = np.fromiter((len(h) for h in hits), dtype=np.intp, count=len(hits))
+        found = np.fromiter((i for h in hits for i in h), dtype=np.intp, count=int(counts.sum()))
+        pairs = np.unique(np.repeat(owner, counts) * len(self) + found)
+        routes, station_ids = np.divmod(pairs, len(self))
+        bounds = np.searchsorted(routes, np.arange(len(routes_coords) + 1))
+        return [station_ids[bounds[i]:bounds[i + 1]] for i in range(len(routes_coords))]
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [])
+
+
+def read_station_index(path):
+    """Parse the geocoded fuel price CSV into a StationIndex, raising on unreadable files
+
+    The index version is a hash of the file contents.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    lats, lngs, prices, ids = [], [], [], []
+    reader = csv.DictReader(io.StringIO(data.decode('utf-8'), newline=''))
+    for row in reader:
+        try:
+            lat = float(row['Latitude'])
+            lng = float(row['Longitude'])
+            price = float(row['Retail Price'])
+            opis_id = int(row['OPIS Truckstop ID']) if row.get('OPIS Truckstop ID') else -1
+        except (KeyError, ValueError, TypeError) as e:
+            logger.warning(f"Invalid station data: {e}")
+            continue
+        lats.append(lat)
+        lngs.append(lng)
+        prices.append(price)
+        ids.append(opis_id)
+    return StationIndex(lats, lngs, prices, version=hashlib.sha256(data).hexdigest()[:16], ids=ids)
+
+
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_POINTER = 'CURRENT'
+SNAPSHOT_ERRORS = (OSError, ValueError, KeyError, pickle.UnpicklingError)
+LOAD_ERRORS = (OSError, UnicodeDecodeError, csv.Error) + SNAPSHOT_ERRORS
+
+
+def write_station_snapshot(index, directory, source=None, keep=2):
+    """Write `index` as a binary snapshot under `directory` and make it current
+
+    Each version gets its own subdirectory of .npy arrays, including the
+    KDTree's nodes and point order; the CURRENT file naming the live one is
+    replaced atomically. Older versions beyond `keep` are deleted. Returns
+    the snapshot path.
+    """
+    version = index.version or hashlib.sha256(index.coords.tobytes() + index.prices.tobytes()).hexdigest()[:16]
+    os.makedirs(directory, exist_ok=True)
+    target = os.path.join(directory, version)
+    staging = tempfile.mkdtemp(dir=directory, prefix='.building-')
+    try:
+        np.save(os.path.join(staging, 'coords.npy'), np.ascontiguousarray(index.coords))
+        np.save(os.path.join(staging, 'prices.npy'), np.ascontiguousarray(index.prices))
+        np.save(os.path.join(staging, 'ids.npy'), np.ascontiguousarray(index.ids))
+        tree = None
+        if index.tree is not None:
+            # cKDTree's pickled state: node buffer, points, sizes, bounds, point order
+            nodes, _, _, _, leafsize, maxes, mins, indices = index.tree.__getstate__()[:8]
+            np.save(os.path.join(staging, 'tree_nodes.npy'), np.frombuffer(nodes, dtype=np.uint8))
+            np.save(os.path.join(staging, 'tree_indices.npy'), indices)
+            tree = {'leafsize': leafsize, 'maxes': maxes.tolist(), 'mins': mins.tolist()}
+        with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+            json.dump({'format': SNAPSHOT_FORMAT, 'version': version, 'stations': len(index), 'tree': tree,
+                       'source': str(source) if source else None,
+                       'created_at': datetime.now().isoformat()}, f)
+        if os.path.exists(target):
+            shutil.rmtree(staging)
+        else:
+            os.rename(staging, target)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    pointer = os.path.join(directory, SNAPSHOT_POINTER)
+    with open(f"{pointer}.tmp", 'w') as f:
+        f.write(version)
+    os.replace(f"{pointer}.tmp", pointer)
+
+    # Workers still mapping a removed version keep their pages until they reload
+    versions = sorted((entry for entry in os.scandir(directory)
+                       if entry.is_dir() and not entry.name.startswith('.') and entry.name != version),
+                      key=lambda entry: entry.stat().st_mtime, reverse=True)
+    for entry in versions[max(keep - 1, 0):]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+    return target
+
+
+def read_station_snapshot(directory):
+    """StationIndex over the current snapshot in `directory`, with its arrays memory-mapped
+
+    Pages are shared through the OS page cache by every process mapping
+    the same snapshot, including the KDTree's points and point order. Only
+    its node array is copied, since scipy keeps the nodes in its own
+    buffer. Raises one of SNAPSHOT_ERRORS if it can't be read.
+    """
+    with open(os.path.join(directory, SNAPSHOT_POINTER)) as f:
+        path = os.path.join(directory, f.read().strip())
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    if manifest['format'] not in (1, SNAPSHOT_FORMAT):
+        raise ValueError(f"Unsupported station snapshot format {manifest['format']}")
+    coords = np.load(os.path.join(path, 'coords.npy'), mmap_mode='r')
+    tree = None
+    if manifest['format'] == 1:
+        # Built before the tree was stored as arrays; it is read into private memory
+        with open(os.path.join(path, 'tree.pickle'), 'rb') as f:
+            tree = pickle.load(f)
+    elif manifest['tree'] is not None:
+        nodes = np.load(os.path.join(path, 'tree_nodes.npy'), mmap_mode='r')
+        indices = np.load(os.path.join(path, 'tree_indices.npy'), mmap_mode='r')
+        if coords.ndim != 2 or len(indices) != len(coords):
+            raise ValueError(f"Station snapshot {path} has a KDTree of the wrong size")
+        tree = KDTree.__new__(KDTree)
+        tree.__setstate__((nodes.view('S1'), coords, coords.shape[0], coords.shape[1],
+                           manifest['tree']['leafsize'], np.array(manifest['tree']['maxes']),
+                           np.array(manifest['tree']['mins']), indices, None, None))
+    return StationIndex.from_arrays(
+        coords,
+        np.load(os.path.join(path, 'prices.npy'), mmap_mode='r'),
+        np.load(os.path.join(path, 'ids.npy'), mmap_mode='r'),
+        tree=tree, version=manifest['version'],
+    )
+
+
+def read_stations(path):
+    """A snapshot directory or a station CSV, whichever `path` is"""
+    if os.path.isdir(path):
+        return read_station_snapshot(path)
+    return read_station_index(path)
+
+
+def load_station_index(path):
+    """read_stations, falling back to an empty index if the data can't be read"""
+    try:
+        return read_stations(path)
+    except LOAD_ERRORS as e:
+        logger.error(f"Failed loading fuel data: {e}")
+        return StationIndex.empty()
+
+
+def station_source():
+    """Where workers load stations from: the snapshot when one is built, else the CSV"""
+    snapshot = settings.FUEL_STATIONS_SNAPSHOT
+    if snapshot and os.path.exists(os.path.join(snapshot, SNAPSHOT_POINTER)):
+        return snapshot
+    return settings.FUEL_STATIONS_CSV
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (str(path), stat.st_mtime_ns, stat.st_size)
+
+
+_index = None
+_index_source = None  # signature of the file _index was loaded from
+_index_checked = 0.0
+_reloading = False
+_index_lock = threading.Lock()
+
+
+def get_station_index():
+    """Return the process-wide station index, loading it on first use
+
+    When the station file changes on disk (see the ingest_prices command) a
+    new index is loaded in the background and swapped in; callers keep
+    getting the current one meanwhile.
+    """
+    global _index, _index_source
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                source = station_source()
+                _index_source = _file_signature(source)
+                _index = load_station_index(source)
+            index = _index
+    else:
+        _check_for_reload()
+    return index
+
+
+def _check_for_reload():
+    """Start a background reload if the station file changed, at most once per interval"""
+    global _index_checked, _reloading
+    interval = settings.STATION_RELOAD_INTERVAL
+    now = time.monotonic()
+    if _index_source is None or interval <= 0 or now - _index_checked < interval:
+        return
+    with _index_lock:
+        if _index_source is None or _reloading or now - _index_checked < interval:
+            return
+        _index_checked = now
+        signature = _file_signature(_index_source[0])
+        if signature is None or signature == _index_source:
+            return
+        _reloading = True
+    threading.Thread(target=_reload, args=(_index_source[0],), daemon=True).start()
+
+
+def _reload(path):
+    global _reloading
+    try:
+        reload_station_index(path, only_if_watched=True)
+    finally:
+        _reloading = False
+
+
+def reload_station_index(path=None, only_if_watched=False):
+    """Load the station file or snapshot and swap it in, keeping the current index if that fails
+
+    With `only_if_watched` an index installed by set_station_index meanwhile
+    is left alone.
+    """
+    global _index, _index_source
+    path = path or station_source()
+    signature = _file_signature(path)
+    try:
+        index = read_stations(path)
+    except LOAD_ERRORS as e:
+        logger.error(f"Station index reload failed, keeping the current one: {e}")
+        return None
+    with _index_lock:
+        if only_if_watched and _index_source is None:
+            return None
+        _index, _index_source = index, signature
+    logger.info(f"Station index reloaded: {len(index)} stations, version {index.version}")
+    return index
+
+
+def set_station_index(index):
+    """Replace the process-wide station index; it is not reloaded from disk"""
+    global _index, _index_source
+    with _index_lock:
+        _index, _index_source = index, None
@@ -0,0 +1,144 @@
+"""Local stand-ins for upstream services, used by the tests and benchmarks."""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import polyline
+
+from .geo import haversine_miles
+
+
+def ors_response(coordinates, points_per_leg=50):
+    """Build an OpenRouteService directions response through [lng, lat] coordinates
+
+    Each leg is a straight line with `points_per_leg` vertices, reported with
+    its distance and way_points just like ORS does.
+    """
+    geometry = []
+    segments = []
+    for (lng1, lat1), (lng2, lat2) in zip(coordinates, coordinates[1:]):
+        t = np.linspace(0.0, 1.0, points_per_leg)
+        lats = lat1 + (lat2 - lat1) * t
+        lngs = lng1 + (lng2 - lng1) * t
+        start = max(len(geometry) - 1, 0)
+        leg = list(zip(lats.round(5).tolist(), lngs.round(5).tolist()))
+        geometry.extend(leg if not geometry else leg[1:])
+        miles = float(haversine_miles(lats[:-1], lngs[:-1], lats[1:], lngs[1:]).sum())
+        segments.append({
+            'distance': miles * 1609.34,
+            'duration': miles * 60,
+            'way_points': [start, len(geometry) - 1],
+        })
+    distance = sum(s['distance'] for s in segments)
+    return {
+        'routes': [{
+            'summary': {'distance': distance, 'duration': distance / 26.8},
+            'segments': segments,
+            'way_points': [segments[0]['way_points'][0]] + [s['way_points'][1] for s in segments],
+            'geometry': polyline.encode(geometry),
+        }]
+    }
+
+
+def recorded_response(path):
+    """ORS directions response from a recorded file
+
+    Takes either a raw ORS response or a /route/ response with the route
+    under `route` (`distance` in miles and the encoded polyline as `steps`),
+    like api/response.json.
+    """
+    with open(path) as f:
+        recorded = json.load(f)
+    if 'routes' in recorded:
+        return recorded
+    route = recorded['route']
+    last = len(polyline.decode(route['steps'])) - 1
+    distance = route['distance'] * 1609.34
+    return {
+        'routes': [{
+            'summary': {'distance': distance, 'duration': route['duration'] * 3600},
+            'segments': [{'distance': distance, 'duration': route['duration'] * 3600, 'way_points': [0, last]}],
+            'way_points': [0, last],
+            'geometry': route['steps'],
+        }]
+    }
+
+
+class FakeORSServer:
+    """Threaded HTTP server answering ORS directions requests on localhost
+
+    `latency` delays every response and `status` forces an error status;
+    `fail_first` answers that many requests with 503 before behaving.
+    With `response`, e.g. from recorded_response, every request is answered
+    with that body instead of a straight-line route. Received request
+    payloads are kept in `requests`, the client addresses seen in
+    `connections`, and the most requests handled at once in `max_in_flight`.
+    """
+
+    def __init__(self, latency=0.0, status=200, points_per_leg=50, fail_first=0, response=None):
+        self.latency = latency
+        self.status = status
+        self.points_per_leg = points_per_leg
+        self.fail_first = fail_first
+        self.response = response
+        self.requests = []
+        self.connections = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                with server._lock:
+                    server.requests.append(payload)
+                    server.connections.add(self.client_address)
+                    status = 503 if len(server.requests) <= server.fail_first else server.status
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+                if status == 200 and server.response is not None:
+                    body = server.response
+                elif status == 200:
+                    body = ors_response(payload['coordinates'], server.points_per_leg)
+                else:
+                    body = {'error': 'fake upstream failure'}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/v2/directions/driving-car"
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05}, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def request_count(self):
+        with self._lock:
+            return len(self.requests)
@@ -1,30 +1,1356 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gc
+import io
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import urlencode
+
+import numpy as np
+from scipy.spatial import KDTree
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
 
-class APITests(TestCase):
+from api import geo, metrics, plans, projection, simplify, singleflight, solver, spatial, stations
+from api.geo import RouteGeometry
+from api.models import FuelStation, Lane, Route
+from api.route_cache import ProjectionCache, RouteCache
+from api.routing import (AsyncRoutingClient, CircuitBreaker, CircuitOpenError, RoutingClient,
+                         RoutingError)
+from api.testing import FakeORSServer, recorded_response
+from api.views import RouteView
+from geocoding.testing import FakeGeocoder
+from cleandata import deduplicate_truckstops
+from visualize_map import plot_route_on_map
+
+def serve_routes(test, latency=0.0):
+    """Route requests in `test` through a FakeORSServer and a fresh route cache, until cleanup
+
+    Returns the server; the route cache is kept as `test.route_cache`.
+    """
+    server = FakeORSServer(latency=latency).__enter__()
+    test.addCleanup(server.__exit__, None, None, None)
+    test.addCleanup(caches['default'].clear)
+    test.route_cache = RouteCache(alias='default')
+    patch_views(test, get_routing_client=RoutingClient(url=server.url, max_retries=0),
+                get_async_routing_client=AsyncRoutingClient(url=server.url),
+                get_route_cache=test.route_cache)
+    return server
+
+
+def patch_views(test, **values):
+    """Make the named api.views getters return `values` until `test` cleans up"""
+    for name, value in values.items():
+        patcher = mock.patch(f"api.views.{name}", return_value=value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
+class RouteViewTestMixin:
+    """A fake upstream and stations for route view tests
+
+    The default stations are nine, a degree apart along latitude 40 from
+    -81, getting dearer westwards; override set_up_stations for others.
+    """
+
+    UPSTREAM_LATENCY = 0.0
+
+    def setUp(self):
+        super().setUp()
+        self.server = serve_routes(self, self.UPSTREAM_LATENCY)
+        self.addCleanup(stations.set_station_index, stations.get_station_index())
+        self.set_up_stations()
+
+    def set_up_stations(self):
+        stations.set_station_index(stations.StationIndex(
+            [40.0] * 9, [-81.0 - i for i in range(9)], [3.0 + i / 10 for i in range(9)]))
+
+
+class APITests(RouteViewTestMixin, TestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -100.0}
+
+    def set_up_stations(self):
+        # A station every ~10 miles along the route, getting dearer westwards
+        lngs = np.arange(-80.1, -100.0, -0.2)
+        stations.set_station_index(stations.StationIndex(
+            np.full(lngs.size, 40.01), lngs, np.linspace(2.9, 3.9, lngs.size)))
+
     def test_route_endpoint(self):
-        response = self.client.get(reverse('route_endpoint'))  # Replace 'route_endpoint' with your actual endpoint name
+        response = self.client.get(reverse('route'), self.QUERY)
         self.assertEqual(response.status_code, 200)
-        self.assertIn('route', response.json())  # Check if 'route' is in the response
+        self.assertEqual(set(response.json()), {'total_cost', 'fuel_stops'})
+        self.assertEqual(self.server.requests[0]['coordinates'], [[-80.0, 40.0], [-100.0, 40.0]])
 
     def test_fuel_price_calculation(self):
-        start_location = "Location A"
-        finish_location = "Location B"
-        response = self.client.post(reverse('route_endpoint'), data={
-            'start': start_location,
-            'finish': finish_location
-        })  # Replace 'route_endpoint' with your actual endpoint name
-        self.assertEqual(response.status_code, 200)
-        self.assertIn('total_cost', response.json())  # Check if 'total_cost' is in the response
+        body = self.client.get(reverse('route'), self.QUERY).json()
+        self.assertAlmostEqual(body['total_cost'], sum(stop['cost'] for stop in body['fuel_stops']), places=1)
+        for stop in body['fuel_stops']:
+            self.assertAlmostEqual(stop['cost'], stop['gallons'] * stop['price_per_gallon'], places=1)
 
     def test_multiple_fuel_stops(self):
-        start_location = "Location A"
-        finish_location = "Location B"
-        response = self.client.post(reverse('route_endpoint'), data={
-            'start': start_location,
-            'finish': finish_location
-        })  # Replace 'route_endpoint' with your actual endpoint name
+        # ~1060 miles on a 500 mile range needs at least two stops, each within range of the last
+        stops = self.client.get(reverse('route'), self.QUERY).json()['fuel_stops']
+        self.assertGreaterEqual(len(stops), 2)
+        positions = [0] + [stop['distance_from_start'] for stop in stops]
+        self.assertLessEqual(max(np.diff(positions)), RouteView.MAX_RANGE)
+
+    def test_recorded_route_replay(self):
+        recorded = recorded_response(os.path.join(os.path.dirname(__file__), 'response.json'))
+        with FakeORSServer(response=recorded) as server, \
+                mock.patch('api.views.get_routing_client',
+                           return_value=RoutingClient(url=server.url, max_retries=0)):
+            route_data = RouteView()._fetch_route_geometry([[-74.0, 40.7], [-118.2, 34.1]])
+        self.assertAlmostEqual(route_data['total_miles'], 2793.0, places=1)
+        self.assertEqual(route_data['way_points'], [0, len(route_data['geometry']) - 1])
+
+
+class StationIndexTests(SimpleTestCase):
+    def _write_csv(self, content):
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_load_skips_invalid_rows(self):
+        path = self._write_csv(
+            "Retail Price,Latitude,Longitude\n"
+            "3.10,36.5,-95.2\n"
+            "3.20,,\n"
+            "2.95,43.9,-90.3\n"
+        )
+        index = stations.load_station_index(path)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.prices.tolist(), [3.10, 2.95])
+        self.assertEqual(index.coords.shape, (2, 2))
+        self.assertFalse(index.coords.flags.writeable)
+
+    def test_missing_file_gives_empty_index(self):
+        index = stations.load_station_index('/nonexistent/stations.csv')
+        self.assertEqual(len(index), 0)
+        self.assertIsNone(index.tree)
+
+    def test_registry_is_shared(self):
+        previous = stations.get_station_index()
+        self.addCleanup(stations.set_station_index, previous)
+        index = stations.StationIndex([36.5], [-95.2], [3.1])
+        stations.set_station_index(index)
+        self.assertIs(stations.get_station_index(), index)
+        self.assertIs(stations.get_station_index(), index)
+
+
+class StationSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.snapshot_dir = os.path.join(tmp.name, 'snapshot')
+        self.csv = write_station_rows(os.path.join(tmp.name, 'stations.csv'), lane_station_rows('3.5'))
+
+    def test_round_trip_is_memory_mapped(self):
+        index = stations.read_station_index(self.csv)
+        stations.write_station_snapshot(index, self.snapshot_dir)
+        loaded = stations.load_station_index(self.snapshot_dir)
+
+        self.assertEqual(loaded.version, index.version)
+        self.assertIsInstance(loaded.coords, np.memmap)
+        self.assertFalse(loaded.prices.flags.writeable)
+        np.testing.assert_array_equal(loaded.coords, index.coords)
+        np.testing.assert_array_equal(loaded.lngs, index.lngs)
+        self.assertEqual(loaded.ids.tolist(), list(range(1, 10)))
+        route = KDTree([[40.0, -81.0], [40.0, -84.0]])
+        self.assertEqual(loaded.near_route(route, 5).tolist(), index.near_route(route, 5).tolist())
+        # The tree's points and order are the mapped arrays, not private copies
+        self.assertTrue(np.shares_memory(loaded.tree.data, loaded.coords))
+        self.assertIsInstance(loaded.tree.indices, np.memmap)
+        np.testing.assert_array_equal(loaded.tree.query([[40.0, -83.2]], k=3)[1],
+                                      index.tree.query([[40.0, -83.2]], k=3)[1])
+
+    def test_new_version_becomes_current(self):
+        for price in ('3.5', '3.4', '3.3'):
+            path = write_station_rows(os.path.join(self.dir, 'stations.csv'), lane_station_rows(price))
+            out = io.StringIO()
+            call_command('build_station_snapshot', stations=path, output=self.snapshot_dir, stdout=out)
+        self.assertIn('9 stations', out.getvalue())
+        loaded = stations.read_station_snapshot(self.snapshot_dir)
+        self.assertEqual(loaded.prices.tolist(), [3.3] * 9)
+        self.assertEqual(loaded.version, stations.read_station_index(path).version)
+        # The current version and the one before it
+        versions = [name for name in os.listdir(self.snapshot_dir) if name != stations.SNAPSHOT_POINTER]
+        self.assertEqual(len(versions), 2)
+        self.assertIn(loaded.version, versions)
+
+    def test_workers_load_snapshot_and_fall_back_to_csv(self):
+        previous = stations.get_station_index()
+        self.addCleanup(stations.set_station_index, previous)
+        with override_settings(FUEL_STATIONS_CSV=self.csv, FUEL_STATIONS_SNAPSHOT=self.snapshot_dir):
+            self.assertEqual(stations.station_source(), self.csv)
+            stations.write_station_snapshot(stations.read_station_index(self.csv), self.snapshot_dir)
+            self.assertEqual(stations.station_source(), self.snapshot_dir)
+            stations.set_station_index(None)
+            self.assertIsInstance(stations.get_station_index().coords, np.memmap)
+
+    def test_reads_pickled_tree_snapshots(self):
+        index = stations.read_station_index(self.csv)
+        path = stations.write_station_snapshot(index, self.snapshot_dir)
+        with open(os.path.join(path, 'tree.pickle'), 'wb') as f:
+            pickle.dump(index.tree, f)
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump({**manifest, 'format': 1}, f)
+        loaded = stations.read_station_snapshot(self.snapshot_dir)
+        route = KDTree([[40.0, -81.0], [40.0, -84.0]])
+        self.assertEqual(loaded.near_route(route, 5).tolist(), index.near_route(route, 5).tolist())
+
+    def test_unknown_format_is_rejected(self):
+        path = stations.write_station_snapshot(stations.read_station_index(self.csv), self.snapshot_dir)
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump({'format': stations.SNAPSHOT_FORMAT + 1}, f)
+        with self.assertRaises(ValueError):
+            stations.read_station_snapshot(self.snapshot_dir)
+        with self.assertLogs('api.stations', 'ERROR'):
+            self.assertEqual(len(stations.load_station_index(self.snapshot_dir)), 0)
+
+
+class FuelStopTests(SimpleTestCase):
+    # Straight route along the equator, ~691 miles long
+    ROUTE = [(0.0, lng / 10) for lng in range(101)]
+
+    def setUp(self):
+        previous = stations.get_station_index()
+        self.addCleanup(stations.set_station_index, previous)
+        stations.set_station_index(stations.StationIndex(
+            [0.01, 0.01, 0.01, 0.01, 1.0],
+            [2.0, 3.0, 8.0, 3.5, 4.0],
+            [3.0, 2.5, 3.5, 2.5, 1.0],
+        ))
+        self.view = RouteView()
+        self.route = RouteGeometry.from_coordinates(self.ROUTE)
+        self.total = self.route.total_miles
+
+    def test_projection_is_batched_per_station(self):
+        projection = self.view._project_stations(self.route, stations.get_station_index(), 5)
+        self.assertEqual(projection['station_index'].tolist(), [0, 1, 2, 3])
+        np.testing.assert_allclose(projection['mile_position'], self.route.miles[[20, 30, 80, 35]])
+        self.assertAlmostEqual(projection['distance_from_route'][0], 0.691, places=2)
+
+    def test_corridor_excludes_off_route_stations(self):
+        index = stations.get_station_index()
+        # The cheap station ~69 miles off the route only shows up in a wide corridor
+        self.assertNotIn(4, self.view._project_stations(self.route, index, 5)['station_index'])
+        self.assertIn(4, self.view._project_stations(self.route, index, 100)['station_index'])
+        self.assertEqual(self.view._project_stations(self.route, index, 0.5)['station_index'].size, 0)
+
+    @override_settings(ROUTE_CORRIDOR_MILES=100)
+    def test_corridor_width_from_settings(self):
+        stops, _ = self.view._calculate_fuel_stops(self.route, self.total)
+        self.assertEqual((stops[0]['lat'], stops[0]['lng']), (1.0, 4.0))
+
+    def test_greedy_cheapest_station_in_window(self):
+        stops, total_cost = self.view._calculate_fuel_stops(self.route, self.total, 'greedy')
+        self.assertEqual(len(stops), 1)
+        # Tied on price, the nearer station wins
+        self.assertEqual(stops[0]['lng'], 3.0)
+        self.assertEqual(stops[0]['distance_from_start'], 207.3)
+        self.assertAlmostEqual(total_cost, 207.3 / 10 * 2.5, places=1)
+
+    def test_optimal_buys_only_what_is_needed(self):
+        stops, total_cost = self.view._calculate_fuel_stops(self.route, self.total)
+        # Starts full, passes the 3.00 station and tops up at 2.50 to reach the end
+        self.assertEqual(len(stops), 1)
+        self.assertEqual(stops[0]['lng'], 3.0)
+        gallons = (self.total - 500) / 10
+        self.assertAlmostEqual(stops[0]['gallons'], gallons, places=2)
+        self.assertAlmostEqual(total_cost, gallons * 2.5, places=6)
+
+    def test_no_stations_in_window(self):
+        stations.set_station_index(stations.StationIndex([0.01], [9.0], [3.0]))
+        self.assertEqual(self.view._calculate_fuel_stops(self.route, self.total), (None, 0))
+        self.assertEqual(self.view._calculate_fuel_stops(self.route, self.total, 'greedy'), (None, 0))
+
+
+class VehicleParameterTests(SimpleTestCase):
+    def setUp(self):
+        previous = stations.get_station_index()
+        self.addCleanup(stations.set_station_index, previous)
+        self.index = stations.StationIndex(
+            [0.01, 0.01, 0.01, 0.01, 1.0], [2.0, 3.0, 8.0, 3.5, 4.0], [3.0, 2.5, 3.5, 2.5, 1.0])
+        stations.set_station_index(self.index)
+        self.view = RouteView()
+        self.route = RouteGeometry.from_coordinates(FuelStopTests.ROUTE)
+        self.total = self.route.total_miles
+        self.cache = ProjectionCache()
+        patcher = mock.patch('api.views.get_projection_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def plan(self, **query):
+        return self.view._calculate_fuel_stops(self.route, self.total, 'optimal', None,
+                                               self.view._parse_vehicle(query))
+
+    def test_parse(self):
+        self.assertEqual(self.view._parse_vehicle({}),
+                         {'range_miles': 500, 'mpg': 10, 'tank_gallons': None, 'start_fuel': None})
+        self.assertEqual(self.view._parse_vehicle({'tank_gallons': '150', 'mpg': '6.5'})['range_miles'], 975)
+        for query in ({'mpg': '0'}, {'mpg': 'x'}, {'range_miles': '-1'}, {'range_miles': 'nan'},
+                      {'range_miles': '800', 'tank_gallons': '50'}, {'start_fuel': '60'}):
+            with self.assertRaises(ValueError):
+                self.view._parse_vehicle(query)
+        response = self.client.get(reverse('route'), {'start_lat': 0, 'start_lng': 0, 'end_lat': 0,
+                                                      'end_lng': 1, 'start_fuel': '-2'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('route'), {'start_lat': 0, 'start_lng': 0, 'end_lat': 0, 'end_lng': 1,
+                                                      'strategy': 'greedy', 'start_fuel': '20'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('start_fuel', response.json()['error'])
+
+    def test_vehicle_changes_plan(self):
+        _, default_cost = self.plan()
+        self.assertEqual(self.plan(range_miles='700'), ([], 0.0))
+        _, cost = self.plan(mpg='20', range_miles='500')
+        self.assertAlmostEqual(cost, default_cost / 2, places=6)
+        # ~138 miles to the first station
+        self.assertEqual(self.plan(start_fuel='5'), (None, 0))
+        stops, _ = self.plan(start_fuel='20')
+        self.assertEqual([stop['lng'] for stop in stops], [2.0, 3.0])
+
+    def test_projection_reused_across_vehicles(self):
+        with mock.patch.object(RouteView, '_project_stations', autospec=True,
+                               side_effect=RouteView._project_stations) as project:
+            for query in ({}, {'mpg': '7'}, {'range_miles': '300', 'start_fuel': '10'}):
+                self.plan(**query)
+            self.assertEqual(project.call_count, 1)
+            stations.set_station_index(stations.StationIndex([0.01], [3.0], [2.0]))
+            self.plan()
+            self.assertEqual(project.call_count, 2)
+        self.assertEqual(self.cache.stats(), {'routes': 1, 'hits': 2, 'misses': 2})
+
+    def test_projections_live_as_long_as_the_route(self):
+        self.plan()
+        self.assertEqual(self.cache.stats()['routes'], 1)
+        del self.route
+        gc.collect()
+        self.assertEqual(self.cache.stats()['routes'], 0)
+
+
+class RouteGeometryTests(SimpleTestCase):
+    def test_mileage_matches_geopy(self):
+        from geopy.distance import great_circle
+
+        coords = [(40.0 + i / 100, -80.0 - i / 37) for i in range(200)]
+        route = RouteGeometry.from_coordinates(coords)
+        expected = sum(great_circle(a, b).miles for a, b in zip(coords, coords[1:]))
+        self.assertEqual(route.miles[0], 0.0)
+        self.assertAlmostEqual(route.total_miles, expected, places=6)
+        self.assertTrue(route.lats.flags.c_contiguous and route.lats.dtype == np.float64)
+        self.assertEqual(RouteGeometry.from_coordinates([]).total_miles, 0.0)
+
+
+def brute_force_cost(miles, prices, total_miles, range_miles, mpg, start_fuel):
+    """Exhaustive DP over integer fuel levels, for integer positions only"""
+    best = {start_fuel - miles[0]: 0.0} if miles and miles[0] <= start_fuel else {}
+    if total_miles <= start_fuel:
+        return 0.0
+    stops = list(miles) + [total_miles]
+    for i, price in enumerate(prices):
+        leg = stops[i + 1] - stops[i]
+        arrivals = {}
+        for fuel, cost in best.items():
+            for buy in range(range_miles - fuel + 1):
+                left = fuel + buy - leg
+                if left >= 0:
+                    total = cost + buy / mpg * price
+                    if total < arrivals.get(left, float('inf')):
+                        arrivals[left] = total
+        best = arrivals
+    return min(best.values()) if best else None
+
+
+class SolverTests(SimpleTestCase):
+    def test_next_cheaper_and_cheapest_ahead(self):
+        miles = np.array([0.0, 1.0, 2.0, 3.0, 9.0])
+        prices = np.array([3.0, 4.0, 2.0, 2.0, 1.0])
+        self.assertEqual(solver.next_cheaper(prices).tolist(), [2, 2, 4, 4, -1])
+        self.assertEqual(solver.cheapest_ahead(miles, prices, 3).tolist(), [3, 3, 3, -1, -1])
+
+    def test_optimal_matches_brute_force(self):
+        rng = random.Random(4)
+        for _ in range(300):
+            range_miles = rng.randint(4, 12)
+            total_miles = rng.randint(5, 40)
+            miles = sorted(rng.sample(range(total_miles), rng.randint(1, min(8, total_miles))))
+            prices = [rng.choice([2.5, 2.9, 3.1, 3.4, 3.9]) for _ in miles]
+            start_fuel = rng.randint(0, range_miles)
+            expected = brute_force_cost(miles, prices, total_miles, range_miles, 2, start_fuel)
+            plan = solver.plan_optimal(miles, prices, total_miles, range_miles, 2, start_fuel)
+            if expected is None:
+                self.assertIsNone(plan)
+            else:
+                self.assertAlmostEqual(sum(p['cost'] for p in plan), expected, places=6)
+
+    def test_optimal_buys_exactly_the_missing_fuel(self):
+        rng = np.random.default_rng(0)
+        miles = np.sort(rng.uniform(0, 3000, 5000))
+        prices = rng.uniform(2.8, 4.2, 5000)
+        plan = solver.plan_optimal(miles, prices, 3000, 500, 10)
+        self.assertAlmostEqual(sum(p['gallons'] for p in plan) * 10, 2500, places=6)
+        self.assertEqual([p['index'] for p in plan], sorted({p['index'] for p in plan}))
+
+    def test_unreachable_destination(self):
+        self.assertIsNone(solver.plan_optimal([100.0, 700.0], [3.0, 3.0], 900, 500, 10))
+        self.assertEqual(solver.plan_optimal([], [], 400, 500, 10), [])
+
+
+class SimplifyTests(SimpleTestCase):
+    def wiggly_route(self, n=20000):
+        rng = np.random.default_rng(7)
+        t = np.linspace(0, 1, n)
+        lats = 35 + 5 * t + 0.02 * np.sin(t * 400) + rng.normal(0, 1e-5, n)
+        lngs = -118 + 30 * t + 0.02 * np.cos(t * 250)
+        return lats, lngs
+
+    def test_error_stays_within_tolerance(self):
+        lats, lngs = self.wiggly_route()
+        for tolerance in (5, 50, 500):
+            kept = simplify.simplify(lats, lngs, tolerance)
+            self.assertEqual(kept[[0, -1]].tolist(), [0, len(lats) - 1])
+            self.assertLess(kept.size, len(lats))
+            self.assertLessEqual(simplify.max_error(lats, lngs, kept), tolerance)
+
+    def test_straight_line_collapses_unless_segments_are_capped(self):
+        # A meridian is a great circle, so every interior point is redundant
+        lats = np.linspace(40.0, 41.0, 1000)
+        lngs = np.full(1000, -100.0)
+        self.assertEqual(simplify.simplify(lats, lngs, 1).tolist(), [0, 999])
+        kept = simplify.simplify(lats, lngs, 1, max_segment_m=1000)
+        steps = geo.unit_vectors(lats[kept], lngs[kept])
+        gaps = np.linalg.norm(np.diff(steps, axis=1), axis=0) * simplify.EARTH_RADIUS_M
+        self.assertLessEqual(gaps.max(), 1000)
+
+    @override_settings(ROUTE_SIMPLIFY_INDEX_METERS=20)
+    def test_projection_keeps_full_resolution_mileage(self):
+        route = RouteGeometry(np.linspace(40, 41, 500), np.linspace(-90, -89, 500))
+        simplified = RouteView()._index_geometry(route)
+        self.assertLess(len(simplified), len(route))
+        self.assertEqual(simplified.total_miles, route.total_miles)
+
+
+class SegmentProjectionTests(SimpleTestCase):
+    # Station lats/lngs spread within ~8 miles either side of a wiggly ~450 mile route
+    def setUp(self):
+        rng = np.random.default_rng(3)
+        t = np.linspace(0, 1, 4000)
+        self.route = RouteGeometry(35 + 3 * t + 0.05 * np.sin(t * 40), -100 + 6 * t)
+        at = rng.integers(0, len(self.route), 300)
+        self.lats = self.route.lats[at] + rng.uniform(-0.12, 0.12, at.size)
+        self.lngs = self.route.lngs[at] + rng.uniform(-0.12, 0.12, at.size)
+
+    def test_matches_brute_force(self):
+        segments = projection.SegmentIndex(self.route, 2.5)
+        inside, _, miles, distance = segments.project(self.lats, self.lngs, 5)
+        xyz = geo.unit_vectors(self.lats, self.lngs)
+        route_xyz = geo.unit_vectors(self.route.lats, self.route.lngs)
+        expected = np.array([simplify.arc_distance(np.repeat(xyz[:, [i]], len(self.route) - 1, axis=1),
+                                                   route_xyz[:, :-1], route_xyz[:, 1:]).min()
+                             for i in range(self.lats.size)]) / 1609.344
+        self.assertEqual(inside.tolist(), np.flatnonzero(expected <= 5).tolist())
+        np.testing.assert_allclose(distance, expected[inside], atol=1e-3)
+        self.assertTrue(np.all((miles >= 0) & (miles <= self.route.total_miles)))
+
+    def test_simplified_route_projects_like_full_route(self):
+        full = projection.SegmentIndex(self.route, 2.5).project(self.lats, self.lngs, 5)
+        coarse_route = self.route.subset(simplify.simplify(self.route.lats, self.route.lngs, 20))
+        self.assertLess(len(coarse_route), len(self.route) / 4)
+        coarse = projection.SegmentIndex(coarse_route, 2.5).project(self.lats, self.lngs, 5)
+        self.assertEqual(coarse[0].tolist(), full[0].tolist())
+        # Mileage is interpolated along each simplified segment, so positions shift slightly
+        np.testing.assert_allclose(coarse[2], full[2], atol=0.2)
+        np.testing.assert_allclose(coarse[3], full[3], atol=0.02)
+
+    def test_station_beside_long_segment(self):
+        # Two vertices 69 miles apart; the station is 3 miles off the middle
+        route = RouteGeometry([0.0, 0.0], [0.0, 1.0])
+        inside, segment, miles, distance = projection.SegmentIndex(route, 2.5).project([3 / 69.09], [0.5], 5)
+        self.assertEqual((inside.tolist(), segment.tolist()), ([0], [0]))
+        self.assertAlmostEqual(miles[0], route.total_miles / 2, places=3)
+        self.assertAlmostEqual(distance[0], 3.0, places=2)
+
+
+class RouteCacheTests(TestCase):
+    def setUp(self):
+        self.server = FakeORSServer().__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        client = RoutingClient(url=self.server.url, max_retries=0)
+        client_patch = mock.patch('api.views.get_routing_client', return_value=client)
+        client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.cache = RouteCache(max_entries=2, ttl=60)
+        cache_patch = mock.patch('api.views.get_route_cache', return_value=self.cache)
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        self.view = RouteView()
+
+    def test_repeat_lane_is_served_from_memory(self):
+        first = self.view._get_route_geometry(-74.006, 40.7128, -118.2437, 34.0522)
+        second = self.view._get_route_geometry(-74.00601, 40.71281, -118.2437, 34.0522)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertIs(first, second)
+        self.assertEqual(self.cache.stats()['memory_hits'], 1)
+
+    def test_persistent_tier_survives_memory_loss(self):
+        first = self.view._get_route_geometry(-74.006, 40.7128, -118.2437, 34.0522)
+        self.cache.clear_memory()
+        second = self.view._get_route_geometry(-74.006, 40.7128, -118.2437, 34.0522)
+        self.assertEqual(self.server.request_count, 1)
+        np.testing.assert_array_equal(second['geometry'].coords, first['geometry'].coords)
+        self.assertEqual(second['total_miles'], first['total_miles'])
+        self.assertEqual(self.cache.stats()['persistent_hits'], 1)
+
+    def test_lru_eviction_and_ttl(self):
+        for lng in (-74.0, -75.0, -76.0):
+            self.view._get_route_geometry(lng, 40.0, -118.0, 34.0)
+        stats = self.cache.stats()
+        self.assertEqual((stats['memory_entries'], stats['evictions'], stats['misses']), (2, 1, 3))
+
+        expired = RouteCache(ttl=0)
+        expired.set('route:a', {'geometry': RouteGeometry([0.0], [0.0]), 'total_miles': 1.0, 'polyline': '??',
+                                'way_points': [0, 0], 'leg_miles': [1.0]})
+        self.assertIsNone(expired.get('route:a'))
+
+    def test_failed_routes_are_not_cached(self):
+        self.server.status = 500
+        self.assertIsNone(self.view._get_route_geometry(-74.0, 40.0, -118.0, 34.0))
+        self.server.status = 200
+        self.assertIsNotNone(self.view._get_route_geometry(-74.0, 40.0, -118.0, 34.0))
+        self.assertEqual(self.server.request_count, 2)
+
+
+class RoutingClientTests(SimpleTestCase):
+    COORDINATES = [[-74.006, 40.7128], [-118.2437, 34.0522]]
+
+    def _server(self, **kwargs):
+        server = FakeORSServer(**kwargs).__enter__()
+        self.addCleanup(server.__exit__, None, None, None)
+        return server
+
+    def _client(self, server, **kwargs):
+        kwargs.setdefault('backoff', 0.001)
+        kwargs.setdefault('breaker', CircuitBreaker(failure_threshold=2, reset_timeout=60))
+        return RoutingClient(url=server.url, api_key='test', **kwargs)
+
+    def test_connections_are_reused(self):
+        server = self._server()
+        client = self._client(server)
+        for _ in range(3):
+            self.assertIn('geometry', client.directions(self.COORDINATES))
+        self.assertEqual(len(server.connections), 1)
+        self.assertEqual(client.stats()['requests'], 3)
+        self.assertIn('p95', client.stats()['latency_ms'])
+
+    def test_retries_transient_failures(self):
+        server = self._server(fail_first=2)
+        client = self._client(server, max_retries=2)
+        self.assertIn('geometry', client.directions(self.COORDINATES))
+        self.assertEqual(server.request_count, 3)
+        self.assertEqual(client.stats()['retries'], 2)
+
+    def test_client_errors_are_not_retried(self):
+        server = self._server(status=404)
+        client = self._client(server, max_retries=2)
+        with self.assertRaises(RoutingError):
+            client.directions(self.COORDINATES)
+        self.assertEqual(server.request_count, 1)
+        self.assertEqual(client.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_read_timeout_is_bounded(self):
+        server = self._server(latency=1.0)
+        client = self._client(server, read_timeout=0.05, max_retries=0)
+        start = time.monotonic()
+        with self.assertRaises(RoutingError):
+            client.directions(self.COORDINATES)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_circuit_opens_and_recovers(self):
+        server = self._server(status=503)
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+        client = self._client(server, max_retries=0, breaker=breaker)
+        for _ in range(2):
+            with self.assertRaises(RoutingError):
+                client.directions(self.COORDINATES)
+        with self.assertRaises(CircuitOpenError):
+            client.directions(self.COORDINATES)
+        self.assertEqual(server.request_count, 2)
+        self.assertEqual(client.stats()['rejected'], 1)
+
+        server.status = 200
+        time.sleep(0.15)
+        self.assertIn('geometry', client.directions(self.COORDINATES))
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+class AsyncRouteViewTests(RouteViewTestMixin, SimpleTestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0}
+    UPSTREAM_LATENCY = 0.2
+
+    def _url(self, query):
+        # Django 3.2's AsyncClient drops the data argument of get()
+        return f"{reverse('route-async')}?{urlencode(query)}"
+
+    async def test_plans_route(self):
+        response = await self.async_client.get(self._url(self.QUERY))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['fuel_stops']), 1)
+
+    async def test_rejects_bad_parameters(self):
+        response = await self.async_client.get(self._url({'start_lat': 'x'}))
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post(reverse('route-async'))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_options(self):
+        response = await self.async_client.options(reverse('route-async'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('GET', response['Allow'])
+
+    async def test_requests_overlap_upstream_waits(self):
+        queries = [{**self.QUERY, 'end_lng': -90.0 - i / 100} for i in range(10)]
+        responses = await asyncio.gather(*(
+            self.async_client.get(self._url(q)) for q in queries))
+        self.assertEqual([r.status_code for r in responses], [200] * 10)
+        self.assertEqual(self.server.request_count, 10)
+        # Sequential requests would reach the 0.2 s upstream one at a time
+        self.assertGreater(self.server.max_in_flight, 1)
+
+    async def test_pool_threads_close_connections(self):
+        threads = []
+        with mock.patch('api.views.close_old_connections',
+                        side_effect=lambda: threads.append(threading.current_thread())):
+            response = await self.async_client.get(self._url(self.QUERY))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+        # Every pool thread that opened a connection closed it again afterwards
+        for thread in set(threads):
+            self.assertEqual(threads.count(thread) % 2, 0, thread.name)
+
+
+class SingleFlightTests(RouteViewTestMixin, SimpleTestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0}
+    UPSTREAM_LATENCY = 0.3
+
+    def setUp(self):
+        super().setUp()
+        self.flight = singleflight.SingleFlight()
+        patch_views(self, get_route_flight=self.flight)
+
+    def _burst(self, queries):
+        responses = [None] * len(queries)
+
+        def fetch(i):
+            responses[i] = self.client_class().get(reverse('route'), queries[i])
+
+        threads = [threading.Thread(target=fetch, args=(i,)) for i in range(len(queries))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_concurrent_duplicates_share_one_computation(self):
+        responses = self._burst([self.QUERY] * 8 + [{**self.QUERY, 'strategy': 'greedy'}] * 2)
+        self.assertEqual([r.status_code for r in responses], [200] * 10)
+        self.assertEqual(len({r.content for r in responses[:8]}), 1)
+        # One upstream call per distinct request; the greedy ones may also hit the route cache
+        self.assertLessEqual(self.server.request_count, 2)
+        self.assertEqual(self.flight.stats(), {'in_flight': 0, 'calls': 2, 'coalesced': 8})
+
+    @override_settings(ROUTE_SINGLE_FLIGHT=False)
+    def test_disabled(self):
+        self._burst([self.QUERY] * 4)
+        self.assertEqual(self.server.request_count, 4)
+        self.assertEqual(self.flight.stats()['calls'], 0)
+
+    async def test_async_duplicates_are_coalesced(self):
+        url = f"{reverse('route-async')}?{urlencode(self.QUERY)}"
+        responses = await asyncio.gather(*(self.async_client.get(url) for _ in range(6)))
+        self.assertEqual([r.status_code for r in responses], [200] * 6)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(self.flight.stats()['coalesced'], 5)
+
+    def test_errors_are_shared_and_not_kept(self):
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait()
+            raise RoutingError('upstream down')
+
+        def call():
+            try:
+                self.flight.do('key', fail)
+            except RoutingError as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        while self.flight.stats()['coalesced'] < 1:
+            time.sleep(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(self.flight.do('key', lambda: 'fresh'), 'fresh')
+
+    async def test_cancelled_waiter_does_not_cancel_the_work(self):
+        async def work():
+            await asyncio.sleep(0.1)
+            return 'done'
+
+        first = asyncio.ensure_future(self.flight.ado('key', work))
+        second = asyncio.ensure_future(self.flight.ado('key', work))
+        await asyncio.sleep(0)
+        first.cancel()
+        self.assertEqual(await second, 'done')
+        self.assertEqual(self.flight.stats(), {'in_flight': 0, 'calls': 1, 'coalesced': 1})
+
+
+class RouteBatchViewTests(RouteViewTestMixin, SimpleTestCase):
+    TRIP = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0}
+
+    def _post(self, body):
+        return self.client.post(reverse('route-batch'), data=json.dumps(body),
+                                content_type='application/json')
+
+    def test_duplicate_lanes_are_routed_once(self):
+        other = {**self.TRIP, 'end_lng': -88.0}
+        response = self._post([self.TRIP, other, self.TRIP, {**self.TRIP, 'strategy': 'greedy'}])
         self.assertEqual(response.status_code, 200)
-        self.assertIn('fuel_stops', response.json())  # Check if 'fuel_stops' is in the response
+        body = response.json()
+        self.assertEqual(body['unique_routes'], 2)
+        self.assertEqual(self.server.request_count, 2)
+        self.assertEqual([t['index'] for t in body['trips']], [0, 1, 2, 3])
+        self.assertEqual(body['trips'][0]['fuel_stops'], body['trips'][2]['fuel_stops'])
+        self.assertLess(body['trips'][1]['total_cost'], body['trips'][0]['total_cost'])
+
+    def test_matches_single_route_plan(self):
+        body = self._post([self.TRIP]).json()
+        route_data = RouteView()._get_route_geometry(-80.0, 40.0, -90.0, 40.0)
+        stops, total_cost = RouteView()._calculate_fuel_stops(
+            route_data['geometry'], route_data['total_miles'])
+        self.assertEqual(body['trips'][0]['fuel_stops'], stops)
+        self.assertEqual(body['trips'][0]['total_cost'], round(total_cost, 2))
+
+    def test_errors_are_reported_per_trip(self):
+        body = self._post([
+            self.TRIP,
+            {'start_lat': 40.0},
+            'not a trip',
+            {**self.TRIP, 'strategy': 'cheapest'},
+            {**self.TRIP, 'end_lat': 10.0, 'end_lng': 10.0},
+        ]).json()
+        self.assertIn('fuel_stops', body['trips'][0])
+        self.assertEqual(body['trips'][1]['error'], 'Invalid/missing coordinates')
+        self.assertEqual(body['trips'][2]['error'], 'Trip must be a JSON object')
+        self.assertIn('Unknown strategy', body['trips'][3]['error'])
+        self.assertEqual(body['trips'][4]['error'], 'No fuel stations found along route')
+
+    def test_non_scalar_fields_are_per_trip_errors(self):
+        response = self._post([
+            {**self.TRIP, 'strategy': ['x']},
+            {**self.TRIP, 'include_map': {'a': 1}},
+            {**self.TRIP, 'start_lat': True},
+            {**self.TRIP, 'mpg': [10]},
+            {**self.TRIP, 'include_map': False},
+        ])
+        self.assertEqual(response.status_code, 200)
+        trips = response.json()['trips']
+        self.assertIn('Unknown strategy', trips[0]['error'])
+        self.assertEqual(trips[1]['error'], 'Invalid include_map')
+        self.assertEqual(trips[2]['error'], 'Invalid/missing coordinates')
+        self.assertEqual(trips[3]['error'], 'Invalid mpg')
+        self.assertIn('fuel_stops', trips[4])
+
+    def test_vehicle_parameters_per_trip(self):
+        body = self._post([self.TRIP, {**self.TRIP, 'mpg': 5}, {**self.TRIP, 'range_miles': 100}]).json()
+        self.assertEqual(self.server.request_count, 1)
+        default, thirsty, short = body['trips']
+        self.assertAlmostEqual(thirsty['total_cost'], default['total_cost'] * 2, delta=0.02)
+        self.assertGreater(len(short['fuel_stops']), len(default['fuel_stops']))
+
+    @override_settings(ROUTE_MAP_CACHE_ALIAS='default')
+    def test_include_map_per_trip(self):
+        body = self._post([self.TRIP, {**self.TRIP, 'include_map': True}]).json()
+        plain, mapped = body['trips']
+        self.assertNotIn('map_url', plain)
+        self.assertEqual(mapped['fuel_stops'], plain['fuel_stops'])
+        response = self.client.get(mapped['map_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/html')
+
+    @override_settings(ROUTE_BATCH_MAX_TRIPS=2)
+    def test_rejects_oversized_and_malformed_batches(self):
+        self.assertEqual(self._post([self.TRIP] * 3).status_code, 400)
+        self.assertEqual(self._post({'trips': []}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('route-batch')).status_code, 405)
+
+
+@override_settings(METRICS_ENABLED=True)
+class MetricsTests(RouteViewTestMixin, SimpleTestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0}
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def _stages(self, response):
+        return {entry.split(';')[0] for entry in response['Server-Timing'].split(', ')}
+
+    def test_server_timing_lists_stages(self):
+        response = self.client.get(reverse('route'), self.QUERY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._stages(response),
+                         {'routing', 'decode', 'stations', 'projection', 'solver', 'total'})
+
+    def test_stages_in_worker_threads_are_timed(self):
+        response = self.client.post(reverse('route-batch'), data=json.dumps([self.QUERY]),
+                                    content_type='application/json')
+        self.assertIn('routing', self._stages(response))
+
+    async def test_async_view_is_timed(self):
+        response = await self.async_client.get(f"{reverse('route-async')}?{urlencode(self.QUERY)}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue({'routing', 'solver', 'total'} <= self._stages(response))
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse('route'), self.QUERY)
+        self.client.get(reverse('route'), self.QUERY)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('# TYPE route_stage_duration_ms histogram', text)
+        self.assertIn('route_stage_duration_ms_bucket{stage="solver",le="+Inf"} 2', text)
+        self.assertIn('route_stage_duration_ms_count{stage="routing"} 1', text)
+        self.assertIn('http_request_duration_ms_count{view="route",status="200"} 2', text)
+        self.assertIn('projection_cache_hits_total', text)
+        self.assertIn('route_cache_misses_total', text)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        response = self.client.get(reverse('route'), self.QUERY)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        self.assertIs(metrics.stage('solver'), metrics.stage('routing'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+        self.assertEqual(metrics.registry.snapshot(), ({}, {}, {}))
+
+
+class WaypointTests(RouteViewTestMixin, SimpleTestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0,
+             'waypoints': '40.0,-83.0|40.0,-86.5'}
+
+    def test_one_upstream_call_and_legs(self):
+        body = self.client.get(reverse('route'), self.QUERY).json()
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(self.server.requests[0]['coordinates'],
+                         [[-80.0, 40.0], [-83.0, 40.0], [-86.5, 40.0], [-90.0, 40.0]])
+
+        legs = body['legs']
+        self.assertEqual([(leg['from'], leg['to']) for leg in legs],
+                         [([40.0, -80.0], [40.0, -83.0]), ([40.0, -83.0], [40.0, -86.5]),
+                          ([40.0, -86.5], [40.0, -90.0])])
+        self.assertEqual(legs[0]['start_mile'], 0.0)
+        for leg, following in zip(legs, legs[1:]):
+            self.assertEqual(leg['end_mile'], following['start_mile'])
+        self.assertAlmostEqual(sum(leg['distance'] for leg in legs), legs[-1]['end_mile'], delta=0.5)
+        for stop in body['fuel_stops']:
+            leg = legs[stop['leg']]
+            self.assertTrue(leg['start_mile'] <= stop['distance_from_start'] <= leg['end_mile'])
+
+    def test_fuel_is_planned_across_legs(self):
+        body = self.client.get(reverse('route'), self.QUERY).json()
+        direct = self.client.get(reverse('route'), {k: v for k, v in self.QUERY.items() if k != 'waypoints'})
+        # The drops are on the way, so the plan is the one for the whole trip
+        self.assertAlmostEqual(body['total_cost'], direct.json()['total_cost'], delta=0.5)
+        self.assertEqual(len(body['fuel_stops']), len(direct.json()['fuel_stops']))
+        self.assertNotIn('legs', direct.json())
+
+    def test_legs_survive_the_persistent_cache(self):
+        first = self.client.get(reverse('route'), self.QUERY).json()
+        self.route_cache.clear_memory()
+        second = self.client.get(reverse('route'), self.QUERY).json()
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(second['legs'], first['legs'])
+
+    @override_settings(ROUTE_MAX_WAYPOINTS=1)
+    def test_invalid_waypoints(self):
+        for waypoints in ('40.0', '40.0,x', '40,-83|40,-84'):
+            response = self.client.get(reverse('route'), {**self.QUERY, 'waypoints': waypoints})
+            self.assertEqual(response.status_code, 400)
+        body = self.client.post(reverse('route-batch'), content_type='application/json', data=json.dumps([
+            {**self.QUERY, 'waypoints': [[40.0, -85.0]]}, {**self.QUERY, 'waypoints': [[40.0]]}])).json()
+        self.assertEqual(len(body['trips'][0]['legs']), 2)
+        self.assertIn('Invalid waypoints', body['trips'][1]['error'])
+
+
+class RoutePlanTests(RouteViewTestMixin, TestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0}
+
+    def set_up_stations(self):
+        self.set_prices(3.0, 'v1')
+
+    def set_prices(self, base, version):
+        stations.set_station_index(stations.StationIndex(
+            [40.0] * 9, [-81.0 - i for i in range(9)], [base + i / 10 for i in range(9)], version=version))
+
+    def test_repeat_trip_is_served_from_database(self):
+        first = self.client.get(reverse('route'), self.QUERY).json()
+        record = Route.objects.get()
+        self.assertEqual((record.price_version, record.total_cost, record.plan),
+                         ('v1', first['total_cost'], first))
+
+        with mock.patch.object(RouteView, '_calculate_fuel_stops', side_effect=AssertionError), \
+                self.assertNumQueries(1):
+            second = self.client.get(reverse('route'), self.QUERY).json()
+        self.assertEqual(second, first)
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_new_prices_invalidate_stored_plans(self):
+        first = self.client.get(reverse('route'), self.QUERY).json()
+        self.client.get(reverse('route'), {**self.QUERY, 'strategy': 'greedy'})
+        self.set_prices(2.5, 'v2')
+        second = self.client.get(reverse('route'), self.QUERY).json()
+        self.assertLess(second['total_cost'], first['total_cost'])
+        self.assertEqual(Route.objects.count(), 3)
+        self.assertEqual(plans.prune_plans('v2'), 2)
+        self.assertEqual(Route.objects.get().plan, second)
+
+    def test_batch_reuses_and_stores_plans(self):
+        single = self.client.get(reverse('route'), self.QUERY).json()
+        other = {**self.QUERY, 'end_lng': -88.0}
+        body = self.client.post(reverse('route-batch'), data=json.dumps([self.QUERY, other, other]),
+                                content_type='application/json').json()
+        self.assertEqual(body['unique_routes'], 1)
+        self.assertEqual(self.server.request_count, 2)
+        self.assertEqual({k: body['trips'][0][k] for k in single}, single)
+        self.assertEqual(Route.objects.count(), 2)
+        self.assertEqual(self.client.get(reverse('route'), other).json()['total_cost'],
+                         body['trips'][1]['total_cost'])
+
+    @override_settings(ROUTE_MAP_CACHE_ALIAS='default')
+    def test_batch_map_from_stored_plan(self):
+        single = self.client.get(reverse('route'), self.QUERY).json()
+        body = self.client.post(reverse('route-batch'), data=json.dumps([{**self.QUERY, 'include_map': 'true'}]),
+                                content_type='application/json').json()
+        trip = body['trips'][0]
+        self.assertEqual(trip['fuel_stops'], single['fuel_stops'])
+        self.assertIn('map_url', trip)
+        self.assertEqual(Route.objects.count(), 1)
+
+    def test_unversioned_station_data_is_not_stored(self):
+        stations.set_station_index(stations.StationIndex([40.0] * 9, [-81.0 - i for i in range(9)], [3.0] * 9))
+        self.assertIsNone(plans.plan_key(self.QUERY, None, (500, 10, None)))
+        self.assertEqual(self.client.get(reverse('route'), self.QUERY).status_code, 200)
+        self.assertFalse(Route.objects.exists())
+
+
+@override_settings(ROUTE_PLANS_ENABLED=False)
+class LaneTests(RouteViewTestMixin, TestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -100.0}
+
+    def setUp(self):
+        super().setUp()
+        fd, self.lane_file = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump([self.QUERY, self.QUERY], f)
+        self.addCleanup(os.remove, self.lane_file)
+
+    def set_up_stations(self):
+        self.lngs = np.arange(-80.1, -100.0, -0.2)
+        self.set_stations(self.lngs, 2.9, 'v1')
+
+    def set_stations(self, lngs, base_price, version):
+        # OPIS IDs follow the longitude, so removing a station keeps the others' IDs
+        stations.set_station_index(stations.StationIndex(
+            np.full(lngs.size, 40.01), lngs, base_price + (-80.1 - lngs) / 20, version=version,
+            ids=np.rint((-80.1 - lngs) * 5)))
+
+    def precompute(self, *args):
+        out = io.StringIO()
+        call_command('precompute_lanes', *args, stdout=out)
+        return out.getvalue()
+
+    def test_lane_skips_routing_and_projection(self):
+        self.assertIn('1 lanes precomputed', self.precompute(self.lane_file))
+        lane = Lane.objects.get()
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(lane.station_ids, sorted(lane.station_ids))
+        self.assertEqual(len(lane.station_ids), self.lngs.size)
+
+        with mock.patch.object(RouteView, '_project_stations', side_effect=AssertionError):
+            body = self.client.get(reverse('route'), self.QUERY).json()
+        self.assertEqual(self.server.request_count, 1)
+        with override_settings(ROUTE_LANES_ENABLED=False):
+            self.assertEqual(self.client.get(reverse('route'), self.QUERY).json(), body)
+
+    def test_price_change_needs_no_refresh(self):
+        self.precompute(self.lane_file)
+        first = self.client.get(reverse('route'), self.QUERY).json()
+        # Same stations loaded in another order, with new prices
+        self.set_stations(self.lngs[::-1], 2.5, 'v2')
+        with mock.patch('api.views.save_lane', side_effect=AssertionError):
+            second = self.client.get(reverse('route'), self.QUERY).json()
+            self.assertIn('Refreshed 0 lanes', self.precompute('--refresh'))
+        self.assertLess(second['total_cost'], first['total_cost'])
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_location_change_refreshes_lane(self):
+        self.precompute(self.lane_file)
+        version = Lane.objects.get().location_version
+        self.set_stations(self.lngs[::2], 2.9, 'v2')
+        body = self.client.get(reverse('route'), self.QUERY).json()
+        lane = Lane.objects.get()
+        self.assertNotEqual(lane.location_version, version)
+        self.assertEqual(len(lane.station_ids), self.lngs[::2].size)
+        self.assertEqual(self.server.request_count, 1)
+        with override_settings(ROUTE_LANES_ENABLED=False):
+            self.assertEqual(self.client.get(reverse('route'), self.QUERY).json(), body)
+
+        self.set_stations(self.lngs[1::2], 2.9, 'v3')
+        self.assertIn('Refreshed 1 lanes', self.precompute('--refresh'))
+        self.assertEqual(Lane.objects.get().location_version, stations.get_station_index().location_version)
+
+    def test_prune_and_bad_lane_file(self):
+        self.precompute(self.lane_file)
+        with open(self.lane_file, 'w') as f:
+            json.dump([{**self.QUERY, 'end_lng': -90.0}], f)
+        self.assertIn('Deleted 1 lanes', self.precompute(self.lane_file, '--prune'))
+        self.assertEqual(Lane.objects.get().coordinates, [[-80.0, 40.0], [-90.0, 40.0]])
+        with open(self.lane_file, 'w') as f:
+            json.dump([{'start_lat': 40.0}], f)
+        with self.assertRaisesMessage(CommandError, 'Invalid/missing coordinates'):
+            self.precompute(self.lane_file)
+
+    def test_station_positions_and_location_version(self):
+        index = stations.StationIndex([1.0, 2.0, 3.0], [4.0, 5.0, 6.0], [3.0, 3.1, 3.2], version='a', ids=[7, 3, 5])
+        np.testing.assert_array_equal(index.positions([5, 7, 4, -1, 99]), [2, 0, -1, -1, -1])
+        reordered = stations.StationIndex([2.0, 3.0, 1.0], [5.0, 6.0, 4.0], [1.0, 1.0, 1.0], version='b',
+                                          ids=[3, 5, 7])
+        self.assertEqual(reordered.location_version, index.location_version)
+        moved = stations.StationIndex([1.0, 2.0, 3.5], [4.0, 5.0, 6.0], [3.0, 3.1, 3.2], version='a', ids=[7, 3, 5])
+        self.assertNotEqual(moved.location_version, index.location_version)
+        self.assertIsNone(stations.StationIndex([1.0], [2.0], [3.0]).location_version)
+
+
+@override_settings(ROUTE_MAP_CACHE_ALIAS='default')
+class RouteMapTests(RouteViewTestMixin, SimpleTestCase):
+    QUERY = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('api.maps.plot_route_on_map', wraps=plot_route_on_map)
+        self.plot = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_map_by_default(self):
+        body = self.client.get(reverse('route'), self.QUERY).json()
+        self.assertNotIn('map_url', body)
+        self.plot.assert_not_called()
+
+    def test_map_is_rendered_lazily_once(self):
+        body = self.client.get(reverse('route'), {**self.QUERY, 'include_map': 'true'}).json()
+        self.plot.assert_not_called()
+
+        first = self.client.get(body['map_url'])
+        second = self.client.get(body['map_url'])
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'text/html')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(self.plot.call_count, 1)
+
+        # Route coordinates reach the map as (lat, lng)
+        start, finish, map_stations, route = self.plot.call_args.args
+        self.assertEqual(route[0][:2], (40.0, -80.0))
+        self.assertEqual(route[-1][:2], (40.0, -90.0))
+        self.assertLess(len(route), self.server.points_per_leg)
+        self.assertEqual(len(map_stations), len(body['fuel_stops']))
+
+    def test_same_plan_gets_same_map_id(self):
+        query = {**self.QUERY, 'include_map': '1'}
+        first = self.client.get(reverse('route'), query).json()['map_url']
+        second = self.client.get(reverse('route'), query).json()['map_url']
+        self.assertEqual(first, second)
+
+    def test_unknown_map(self):
+        response = self.client.get(reverse('route-map', args=['0' * 32]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_map_cache_error(self):
+        with mock.patch.object(caches['default'], 'get', side_effect=DatabaseError('no table')), \
+                self.assertLogs('api.maps', 'ERROR'):
+            response = self.client.get(reverse('route-map', args=['0' * 32]))
+        self.assertEqual(response.status_code, 404)
+
+
+STATION_COLUMNS = ['OPIS Truckstop ID', 'Truckstop Name', 'Address', 'City', 'State', 'Rack ID',
+                   'Retail Price', 'Latitude', 'Longitude', 'Geocoding_Timestamp', 'Geocoding_Status']
+
+
+def write_station_rows(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, STATION_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def lane_station_rows(price, ids=range(1, 10)):
+    """Stations every degree along latitude 40.01 between -81 and -89"""
+    return [{'OPIS Truckstop ID': i, 'Truckstop Name': f"STOP {i}", 'Address': f"I-70, EXIT {i}",
+             'City': 'Town', 'State': 'OH', 'Rack ID': 1, 'Retail Price': price,
+             'Latitude': 40.01, 'Longitude': -80.0 - i, 'Geocoding_Status': 'SUCCESS'} for i in ids]
+
+
+# Stored plans would short-circuit the reload test, and need the database
+@override_settings(ROUTE_PLANS_ENABLED=False, ROUTE_LANES_ENABLED=False)
+class IngestPricesTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.stations_csv = write_station_rows(os.path.join(tmp.name, 'stations.csv'),
+                                               lane_station_rows('3.5'))
+        self.geocoder = FakeGeocoder().__enter__()
+        self.addCleanup(self.geocoder.__exit__, None, None, None)
+
+    def ingest(self, price_rows):
+        prices = write_station_rows(os.path.join(self.dir, 'prices.csv'), price_rows)
+        out = io.StringIO()
+        call_command('ingest_prices', prices, stations=self.stations_csv, provider='here',
+                     geocoder_url=self.geocoder.url('here'), cache=os.path.join(self.dir, 'cache.sqlite3'),
+                     stdout=out)
+        return out.getvalue()
+
+    def read_stations(self):
+        with open(self.stations_csv, newline='') as f:
+            return {row['OPIS Truckstop ID']: row for row in csv.DictReader(f)}
+
+    def test_diff_on_opis_id(self):
+        rows = lane_station_rows('3.5', ids=range(1, 9))
+        rows[0]['Retail Price'] = '2.999'
+        rows.append({**rows[1], 'OPIS Truckstop ID': 42, 'Address': 'I-80, EXIT 1'})
+        output = self.ingest([{k: v for k, v in row.items() if k not in ('Latitude', 'Longitude')}
+                              for row in rows])
+        self.assertIn('1 updated, 7 unchanged, 1 added, 1 removed, 0 could not be geocoded', output)
+
+        stations = self.read_stations()
+        # Only the new station was geocoded; the others keep their coordinates
+        self.assertEqual(self.geocoder.queries, ['I-80, EXIT 1, Town, OH, USA'])
+        self.assertEqual(sorted(stations, key=int), [str(i) for i in range(1, 9)] + ['42'])
+        self.assertEqual((stations['1']['Retail Price'], stations['1']['Longitude']), ('2.999', '-81.0'))
+        self.assertNotIn('9', stations)
+        self.assertEqual(stations['42']['Geocoding_Status'], 'SUCCESS')
+
+    def test_reload_under_concurrent_requests(self):
+        serve_routes(self)
+        settings_override = override_settings(FUEL_STATIONS_CSV=self.stations_csv, STATION_RELOAD_INTERVAL=0.01)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(stations.set_station_index, stations.get_station_index())
+        stations.set_station_index(None)
+        old_version = stations.get_station_index().version
+
+        results = []
+        stop = threading.Event()
+
+        def requests():
+            client = self.client_class()
+            while not stop.is_set():
+                response = client.get(reverse('route'), {'start_lat': 40.0, 'start_lng': -80.0,
+                                                         'end_lat': 40.0, 'end_lng': -90.0})
+                results.append((response.status_code, response.json().get('total_cost')))
+
+        threads = [threading.Thread(target=requests) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        try:
+            time.sleep(0.2)
+            self.ingest(lane_station_rows('2.999'))
+            deadline = time.monotonic() + 5
+            while stations.get_station_index().version == old_version and time.monotonic() < deadline:
+                time.sleep(0.01)
+            time.sleep(0.2)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertNotEqual(stations.get_station_index().version, old_version)
+        self.assertEqual({status for status, _ in results}, {200})
+        # Every request saw one complete index: all old prices or all new
+        costs = [cost for _, cost in results]
+        self.assertEqual(len(set(costs)), 2)
+        self.assertLess(costs[-1], costs[0])
+
+
+class CleanDataTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        rows = lane_station_rows('3.5', ids=[1, 2, 3])
+        rows += [{**rows[0], 'Retail Price': '3.2'}, {**rows[2], 'Retail Price': '3.6'},
+                 {**rows[0], 'Retail Price': '3.4'}]
+        rows += [{**rows[1], 'OPIS Truckstop ID': 'x'}, {**rows[1], 'Retail Price': 'N/A'},
+                 {**rows[1], 'Retail Price': '99', 'City': ''}, {**rows[1], 'Latitude': 95.0}]
+        self.prices = write_station_rows(os.path.join(self.dir, 'prices.csv'), rows)
+
+    def clean(self, policy, **kwargs):
+        output = os.path.join(self.dir, f"{policy}.csv")
+        stats = deduplicate_truckstops(self.prices, output, policy, **kwargs)
+        with open(output, newline='') as f:
+            return stats, [(row['OPIS Truckstop ID'], row['Retail Price']) for row in csv.DictReader(f)]
+
+    def test_dedup_policies(self):
+        expected = {
+            'first': [('1', '3.5'), ('2', '3.5'), ('3', '3.5')],
+            'latest': [('1', '3.4'), ('2', '3.5'), ('3', '3.6')],
+            'min': [('1', '3.2'), ('2', '3.5'), ('3', '3.5')],
+        }
+        for policy, rows in expected.items():
+            stats, output = self.clean(policy)
+            self.assertEqual(output, rows, policy)
+            # The same across chunk boundaries
+            self.assertEqual(self.clean(policy, chunk_rows=2), (stats, rows), policy)
+        self.assertEqual(stats, {'rows': 10, 'rejected': 4, 'duplicates': 3, 'written': 3,
+                                 'conflicting_prices': 2})
+
+    def test_rejects_and_output_format(self):
+        rejects = os.path.join(self.dir, 'rejects.csv')
+        self.clean('latest', rejects_file=rejects)
+        with open(rejects, newline='') as f:
+            reasons = [row['Reject_Reason'] for row in csv.DictReader(f)]
+        self.assertEqual(reasons, ['invalid OPIS Truckstop ID', 'invalid Retail Price',
+                                   'Retail Price out of range; missing City', 'invalid Latitude/Longitude'])
+
+        output = os.path.join(self.dir, 'latest.csv')
+        with open(output, newline='') as f:
+            self.assertEqual(next(csv.reader(f)), STATION_COLUMNS)
+        index = stations.read_station_index(output)
+        self.assertEqual(index.ids.tolist(), [1, 2, 3])
+        self.assertEqual(index.prices.tolist(), [3.4, 3.5, 3.6])
+        with self.assertRaisesMessage(ValueError, 'Unknown policy'):
+            deduplicate_truckstops(self.prices, output, 'last')
+
+
+class FuelStationTests(TestCase):
+    # Diagonal route from Columbus, OH towards Kansas City
+    ROUTE = RouteGeometry.from_coordinates([(40.0 - i / 100, -83.0 - i / 50) for i in range(401)])
+
+    def test_sync_rows(self):
+        stats = FuelStation.objects.sync_rows(lane_station_rows('3.5'))
+        self.assertEqual(stats, {'created': 9, 'updated': 0, 'unchanged': 0, 'removed': 0})
+
+        rows = lane_station_rows('3.5', ids=range(1, 9))
+        rows[0]['Retail Price'] = '2.999'
+        rows.append({**rows[1], 'OPIS Truckstop ID': 42, 'Latitude': ''})
+        stats = FuelStation.objects.sync_rows(rows, prune=True)
+        self.assertEqual(stats, {'created': 1, 'updated': 1, 'unchanged': 7, 'removed': 1})
+        self.assertEqual(FuelStation.objects.get(pk=1).price, 2.999)
+        self.assertIsNone(FuelStation.objects.get(pk=42).lat)
+        self.assertFalse(FuelStation.objects.filter(pk=9).exists())
+
+    def test_location_version_ignores_prices(self):
+        FuelStation.objects.sync_rows(lane_station_rows('3.5'))
+        version, location = FuelStation.objects.data_version(), FuelStation.objects.location_version()
+        FuelStation.objects.sync_rows(lane_station_rows('2.999'))
+        self.assertNotEqual(FuelStation.objects.data_version(), version)
+        self.assertEqual(FuelStation.objects.location_version(), location)
+        moved = lane_station_rows('2.999')
+        moved[0]['Latitude'] = 45.0
+        FuelStation.objects.sync_rows(moved)
+        self.assertNotEqual(FuelStation.objects.location_version(), location)
+
+    def test_rtree_follows_writes(self):
+        self.assertTrue(spatial.has_rtree(connection))
+        FuelStation.objects.sync_rows(lane_station_rows('3.5'))
+        box = (39.9, -81.5, 40.1, -80.5)
+        self.assertEqual(list(FuelStation.objects.in_bbox(*box).values_list('pk', flat=True)), [1])
+
+        moved = lane_station_rows('3.5')
+        moved[0]['Latitude'] = 45.0
+        moved[1]['Longitude'] = -81.0
+        FuelStation.objects.sync_rows(moved)
+        self.assertEqual(list(FuelStation.objects.in_bbox(*box).values_list('pk', flat=True)), [2])
+        FuelStation.objects.filter(pk=2).delete()
+        self.assertFalse(FuelStation.objects.in_bbox(*box).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {spatial.RTREE_TABLE}")
+            self.assertEqual(cursor.fetchone()[0], 8)
+
+    def test_near_route_matches_memory_index(self):
+        rng = np.random.default_rng(7)
+        lats, lngs = rng.uniform(35.0, 41.0, 3000), rng.uniform(-92.0, -80.0, 3000)
+        prices = rng.uniform(3.0, 4.0, 3000).round(3)
+        FuelStation.objects.bulk_create([
+            FuelStation(opis_id=i, name=f"STOP {i}", address='', city='', state='OH',
+                        price=prices[i], lat=lats[i], lng=lngs[i]) for i in range(3000)])
+
+        view = RouteView()
+        memory = stations.StationIndex(lats, lngs, prices)
+        expected = memory.coords[view._project_stations(self.ROUTE, memory, 10)['station_index']]
+        candidates = FuelStation.objects.near_route(self.ROUTE, 10)
+        self.assertLess(candidates.count(), 3000 // 4)
+        database = candidates.as_index()
+        found = database.coords[view._project_stations(self.ROUTE, database, 10)['station_index']]
+        self.assertEqual(sorted(map(tuple, found)), sorted(map(tuple, expected)))
+
+        previous = stations.get_station_index()
+        self.addCleanup(stations.set_station_index, previous)
+        stations.set_station_index(memory)
+        plan = view._calculate_fuel_stops(self.ROUTE, self.ROUTE.total_miles)
+        with override_settings(STATION_BACKEND='database'):
+            self.assertEqual(view._calculate_fuel_stops(self.ROUTE, self.ROUTE.total_miles), plan)
+
+    @override_settings(STATION_BACKEND='database', ROUTE_PLANS_ENABLED=False, ROUTE_LANES_ENABLED=False)
+    def test_single_and_batch_requests(self):
+        serve_routes(self)
+        FuelStation.objects.bulk_create([
+            FuelStation(opis_id=offset + i, name=f"STOP {offset + i}", address='', city='', state='OH',
+                        price=3.0 + i / 10, lat=lat, lng=-81.0 - i)
+            for offset, lat in ((1, 40.01), (11, 35.01)) for i in range(9)])
+
+        north = {'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': -90.0}
+        south = {**north, 'start_lat': 35.0, 'end_lat': 35.0}
+        single = self.client.get(reverse('route'), south).json()
+        # The batch index also holds the northern stations, so the southern ones move
+        batch = self.client.post(reverse('route-batch'), data=json.dumps([north, south]),
+                                 content_type='application/json').json()
+        self.assertEqual(batch['trips'][1]['fuel_stops'], single['fuel_stops'])
+        self.assertEqual({stop['lat'] for stop in batch['trips'][0]['fuel_stops']}, {40.01})
+        self.assertEqual({stop['lat'] for stop in batch['trips'][1]['fuel_stops']}, {35.01})
 
-    # Add more tests as needed for your application logic
\ No newline at end of file
+    def test_load_stations_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_station_rows(os.path.join(tmp, 'stations.csv'), lane_station_rows('3.5'))
+            out = io.StringIO()
+            call_command('load_stations', stations=path, stdout=out)
+        self.assertIn('9 created, 0 updated, 0 unchanged, 0 removed; 9 stations', out.getvalue())
@@ -1,8 +1,12 @@
 from django.contrib import admin
 from django.urls import path
-from api.views import RouteView
+from api.views import AsyncRouteView, MetricsView, RouteBatchView, RouteMapView, RouteView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('route/', RouteView.as_view(), name='route'),
+    path('route/async/', AsyncRouteView.as_view(), name='route-async'),
+    path('route/batch/', RouteBatchView.as_view(), name='route-batch'),
+    path('route/<str:map_id>/map/', RouteMapView.as_view(), name='route-map'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,14 +1,34 @@
 # filepath: /c:/Users/zagor/Documents/django-api/api/views.py
-import csv
+import asyncio
+import json
 import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+
 import polyline
-import requests
 import numpy as np
 from scipy.spatial import KDTree
-from geopy.distance import great_circle
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.views import View
-from visualize_map import plot_route_on_map
+from .geo import RouteGeometry
+from .lanes import get_lane, is_current, lane_key, lane_projection, lane_record, lane_route_data, save_lane
+from .maps import render_map, store_map
+from .metrics import increment, render as render_metrics, run_in_context, stage
+from .models import FuelStation
+from .plans import get_plans, plan_key, plan_record, save_plans
+from .projection import SegmentIndex, query_spacing
+from .route_cache import get_projection_cache, get_route_cache
+from .simplify import simplify
+from .singleflight import get_route_flight
+from .routing import RoutingError, get_async_routing_client, get_routing_client
+from .solver import STRATEGIES
+from .stations import get_station_index
 from dotenv import load_dotenv
 import os
 
@@ -17,185 +37,650 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+
+def _closing_connections(func):
+    """Wrap `func` to close stale database connections around it, for pool threads
+
+    Django does this at the start and end of each request, but only in the
+    request thread; pool threads would otherwise keep theirs open.
+    """
+    def wrapper(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return wrapper
+
+
+def _station_index(routes):
+    """Stations to plan `routes` against
+
+    The shared in-memory index, or with STATION_BACKEND = 'database' an index
+    of just the stations near the routes, read from FuelStation.
+    """
+    with stage('stations'):
+        if settings.STATION_BACKEND == 'database':
+            return FuelStation.objects.index_near_routes(routes, settings.ROUTE_CORRIDOR_MILES)
+        return get_station_index()
+
+
+def _stations_version():
+    """Version of the station data _station_index currently plans against"""
+    if settings.STATION_BACKEND == 'database':
+        return FuelStation.objects.data_version()
+    return get_station_index().version
+
+
+def _stations_location_version():
+    """Version of the station locations only, which precomputed lanes depend on"""
+    if settings.STATION_BACKEND == 'database':
+        return FuelStation.objects.location_version()
+    return get_station_index().location_version
+
+
+def _lane_stations(lane):
+    """Stations to plan a precomputed lane against, with current prices"""
+    with stage('stations'):
+        if settings.STATION_BACKEND == 'database':
+            return FuelStation.objects.filter(pk__in=lane.station_ids).as_index(
+                version=FuelStation.objects.data_version())
+        return get_station_index()
+
+
 class RouteView(View):
     GEOAPIFY_API_KEY = os.getenv('GEOAPIFY_API_KEY')
-    ORS_API_KEY = os.getenv('ORS_API_KEY')
 
     MAX_RANGE = 500  # miles
     MPG = 10
 
-    def __init__(self):
-        super().__init__()
-        self.fuel_stations = self._load_fuel_stations()
-        
-    def _load_fuel_stations(self):
-        """Load fuel stations from CSV and build spatial index"""
-        stations = []
-        coords = []
-        try:
-            with open('fuelprices_HERE_geocoded.csv', 'r') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    try:
-                        lat = float(row['Latitude'])
-                        lng = float(row['Longitude'])
-                        price = float(row['Retail Price'])
-                        stations.append({'lat': lat, 'lng': lng, 'price': price})
-                        coords.append([lat, lng])
-                    except (KeyError, ValueError) as e:
-                        logger.warning(f"Invalid station data: {e}")
-                        continue
-            return {
-                'stations': stations,
-                'tree': KDTree(coords) if coords else None
-            }
-        except Exception as e:
-            logger.error(f"Failed loading fuel data: {e}")
-            return {'stations': [], 'tree': None}
-
     def get(self, request):
-        # Validate parameters
         try:
-            start_lat = float(request.GET['start_lat'])
-            start_lng = float(request.GET['start_lng'])
-            end_lat = float(request.GET['end_lat'])
-            end_lng = float(request.GET['end_lng'])
-        except (KeyError, ValueError):
-            return JsonResponse({'error': 'Invalid/missing coordinates'}, status=400)
+            params = self._parse_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if settings.ROUTE_SINGLE_FLIGHT:
+            body, status = get_route_flight().do(self._flight_key(params), lambda: self._plan_trip(params))
+        else:
+            body, status = self._plan_trip(params)
+        return JsonResponse(body, status=status)
+
+    def _plan_trip(self, params):
+        """(body, status) of the response for a trip"""
+        plan = self._stored_plan(params)
+        if plan is not None and not params['include_map']:
+            return plan, 200
+
+        lane = self._precomputed_lane(params)
+        if lane is not None:
+            route_data, fuel_stations, projection = lane
+            return self._plan_result(params, route_data, plan, (fuel_stations, projection))
 
         # Get route geometry from OpenRouteService
-        route_data = self._get_route_geometry(start_lng, start_lat, end_lng, end_lat)
-        if not route_data:
-            return JsonResponse({'error': 'Route calculation failed'}, status=500)
-
-        # Find fuel stations along route
-        fuel_stops, total_cost = self._calculate_fuel_stops(route_data['coordinates'], 
-                                                          route_data['total_miles'])
-        if not fuel_stops:
-            return JsonResponse({'error': 'No fuel stations found along route'}, status=500)
-
-        # Generate map using visualize_map.py
-        start = (start_lat, start_lng)
-        finish = (end_lat, end_lng)
-        stations = [(stop['lat'], stop['lng'], stop['price_per_gallon']) for stop in fuel_stops]
-        route = [(coord[1], coord[0], 0) for coord in route_data['coordinates']]  # Note: coord[1] is lat, coord[0] is lng
-
-        map_result = plot_route_on_map(start, finish, stations, route)
-        map_result.save("map.html")
-
-        return JsonResponse({
-            'total_cost': round(total_cost, 2),
-            'fuel_stops': fuel_stops,
-            'map_url': "map.html"
-        })
-
-    def _get_route_geometry(self, start_lng, start_lat, end_lng, end_lat):
-        """Get route data from OpenRouteService API"""
+        route_data = self._get_route_geometry(params['start_lng'], params['start_lat'],
+                                              params['end_lng'], params['end_lat'], params['waypoints'])
+        return self._plan_result(params, route_data, plan)
+
+    def _flight_key(self, params):
+        """Requests with the same key get the same response, so concurrent ones are coalesced"""
+        coordinates = self._route_coordinates(params['start_lng'], params['start_lat'],
+                                              params['end_lng'], params['end_lat'], params['waypoints'])
+        route_key = get_route_cache().make_key(*(c for point in coordinates for c in point))
+        return (route_key, params['strategy'], self._vehicle(params), params['include_map'])
+
+    def _parse_params(self, query):
+        """Validate trip parameters, raising ValueError with the message for the client"""
+        names = ('start_lat', 'start_lng', 'end_lat', 'end_lng')
         try:
-            url = "https://api.openrouteservice.org/v2/directions/driving-car"
-            headers = {
-                'Authorization': self.ORS_API_KEY,
-                'Content-Type': 'application/json'
-            }
-            payload = {
-                "coordinates": [
-                    [start_lng, start_lat],
-                    [end_lng, end_lat]
-                ]
+            if any(isinstance(query[name], bool) for name in names):
+                raise ValueError
+            params = {name: float(query[name]) for name in names}
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Invalid/missing coordinates')
+
+        params['waypoints'] = self._parse_waypoints(query.get('waypoints'))
+        # Batch trips are JSON, so these need not be strings
+        include_map = query.get('include_map', '')
+        if not isinstance(include_map, (str, bool, int)):
+            raise ValueError('Invalid include_map')
+        params['include_map'] = str(include_map).lower() in ('1', 'true', 'yes')
+        params['strategy'] = query.get('strategy', 'optimal')
+        if not isinstance(params['strategy'], str) or params['strategy'] not in STRATEGIES:
+            raise ValueError(f"Unknown strategy, expected one of: {', '.join(STRATEGIES)}")
+        params.update(self._parse_vehicle(query))
+        if params['strategy'] == 'greedy' and params['start_fuel'] is not None:
+            # plan_greedy always starts with a full tank
+            raise ValueError('start_fuel is not supported with strategy=greedy')
+        return params
+
+    def _parse_waypoints(self, value):
+        """Intermediate stops as (lat, lng) pairs, from "lat,lng|lat,lng" or a list of pairs"""
+        if not value:
+            return []
+        points = [point.split(',') for point in value.split('|')] if isinstance(value, str) else value
+        try:
+            waypoints = [(float(lat), float(lng)) for lat, lng in points]
+        except (TypeError, ValueError):
+            raise ValueError('Invalid waypoints, expected "lat,lng|lat,lng"')
+        if len(waypoints) > settings.ROUTE_MAX_WAYPOINTS:
+            raise ValueError(f"At most {settings.ROUTE_MAX_WAYPOINTS} waypoints")
+        return waypoints
+
+    def _parse_vehicle(self, query):
+        """Vehicle parameters: range and MPG, tank size and fuel at the start in gallons
+
+        The range defaults to a full tank when only `tank_gallons` is given,
+        and the trip starts with a full tank unless `start_fuel` says otherwise.
+        """
+        def number(name, default=None):
+            value = query.get(name)
+            if value is None or value == '':
+                return default
+            if isinstance(value, bool):
+                raise ValueError(f"Invalid {name}")
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid {name}")
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f"{name} must be a non-negative number")
+            return value
+
+        mpg = number('mpg', self.MPG)
+        tank_gallons = number('tank_gallons')
+        range_miles = number('range_miles')
+        if not mpg or tank_gallons == 0 or range_miles == 0:
+            raise ValueError('mpg, range_miles and tank_gallons must be positive')
+        if range_miles is None:
+            range_miles = tank_gallons * mpg if tank_gallons else self.MAX_RANGE
+        elif tank_gallons and range_miles > tank_gallons * mpg * (1 + 1e-9):
+            raise ValueError('range_miles is more than tank_gallons * mpg')
+        start_fuel = number('start_fuel')
+        if start_fuel is not None and start_fuel * mpg > range_miles * (1 + 1e-9):
+            raise ValueError('start_fuel is more than a full tank')
+        return {'range_miles': range_miles, 'mpg': mpg, 'tank_gallons': tank_gallons, 'start_fuel': start_fuel}
+
+    def _vehicle(self, params=None):
+        """(range_miles, mpg, start fuel in miles or None for a full tank) for the solvers"""
+        params = params or {}
+        mpg = params.get('mpg', self.MPG)
+        start_fuel = params.get('start_fuel')
+        return (params.get('range_miles', self.MAX_RANGE), mpg,
+                None if start_fuel is None else start_fuel * mpg)
+
+    def _plan_key(self, params, version):
+        return plan_key(params, version, self._vehicle(params))
+
+    def _stored_plan(self, params):
+        """The plan stored for these trip parameters and the current station data, if any"""
+        key = self._plan_key(params, _stations_version())
+        if not key:
+            return None
+        with stage('plan_store'):
+            plan = get_plans([key]).get(key)
+        increment('route_plan_hits' if plan is not None else 'route_plan_misses')
+        return plan
+
+    def _plan_result(self, params, route_data, plan=None, lane=None):
+        """Plan fuel stops on a fetched route, unless a stored plan is given, as (body, status)
+
+        `lane` is the (fuel_stations, projection) of a precomputed lane, which
+        leaves only the solver to run. The body may be shared by coalesced
+        requests and must not be changed.
+        """
+        if not route_data:
+            return {'error': 'Route calculation failed'}, 500
+
+        if plan is None:
+            if lane is not None:
+                fuel_stations, projection = lane
+                fuel_stops, total_cost = self._plan_stops(projection, fuel_stations, route_data['total_miles'],
+                                                          params['strategy'], params)
+            else:
+                # Find fuel stations along route
+                fuel_stations = _station_index([route_data['geometry']])
+                fuel_stops, total_cost = self._calculate_fuel_stops(route_data['geometry'],
+                                                                  route_data['total_miles'],
+                                                                  params['strategy'], fuel_stations, params)
+            if fuel_stops is None:
+                return {'error': 'No fuel stations found along route'}, 500
+            plan = {
+                'total_cost': round(total_cost, 2),
+                'fuel_stops': fuel_stops
             }
-            response = requests.post(url, json=payload, headers=headers)
-            if response.status_code != 200:
+            self._add_legs(plan, params, route_data)
+            key = self._plan_key(params, fuel_stations.version)
+            if key:
+                with stage('plan_store'):
+                    save_plans([plan_record(key, params, fuel_stations.version, route_data['total_miles'], plan)])
+
+        response = dict(plan)
+        if params['include_map']:
+            self._add_map(response, params, route_data)
+        return response, 200
+
+    def _add_map(self, response, params, route_data):
+        """Store the map inputs of a planned trip and add its map_url to the response
+
+        Only the map inputs are stored; the HTML is rendered when first fetched.
+        """
+        stations = [(stop['lat'], stop['lng'], stop['price_per_gallon']) for stop in response['fuel_stops']]
+        with stage('map'):
+            map_id = store_map((params['start_lat'], params['start_lng']),
+                               (params['end_lat'], params['end_lng']),
+                               stations, route_data['polyline'])
+        if map_id:
+            response['map_url'] = reverse('route-map', args=[map_id])
+
+    def _add_legs(self, plan, params, route_data):
+        """Report leg boundaries of a trip with waypoints and the leg of each fuel stop"""
+        if not params['waypoints']:
+            return
+        points = [(params['start_lat'], params['start_lng']), *params['waypoints'],
+                  (params['end_lat'], params['end_lng'])]
+        way_points = route_data['way_points']
+        if len(way_points) != len(points):
+            logger.warning(f"Route has {len(way_points)} way points for {len(points)} stops")
+            return
+        if 'way_point_miles' in route_data:
+            boundaries = np.asarray(route_data['way_point_miles'])
+        else:
+            boundaries = route_data['geometry'].miles[way_points]
+        plan['legs'] = [{
+            'from': list(points[i]),
+            'to': list(points[i + 1]),
+            'start_mile': round(float(boundaries[i]), 1),
+            'end_mile': round(float(boundaries[i + 1]), 1),
+            'distance': round(float(route_data['leg_miles'][i]), 1),
+        } for i in range(len(points) - 1)]
+        # A stop exactly at a drop belongs to the leg leaving it
+        legs = np.searchsorted(boundaries[1:-1], [stop['distance_from_start'] for stop in plan['fuel_stops']],
+                               side='right')
+        for stop, leg in zip(plan['fuel_stops'], legs.tolist()):
+            stop['leg'] = leg
+
+    def _precomputed_lane(self, params):
+        """(route_data, fuel_stations, projection) of the stored lane for a trip, or None
+
+        A lane projected against other station locations is projected again
+        from its stored route first; price changes alone leave it as it is.
+        """
+        if not settings.ROUTE_LANES_ENABLED:
+            return None
+        location_version = _stations_location_version()
+        if location_version is None:
+            return None
+        coordinates = self._route_coordinates(params['start_lng'], params['start_lat'],
+                                              params['end_lng'], params['end_lat'], params['waypoints'])
+        with stage('lane'):
+            lane = get_lane(lane_key(coordinates))
+            if lane is None:
                 return None
-            
-            data = response.json()
-            geometry = polyline.decode(data['routes'][0]['geometry'])
-            total_miles = data['routes'][0]['summary']['distance'] / 1609.34
-            
+            if not is_current(lane, location_version):
+                increment('route_lane_refreshes')
+                lane = self._refresh_lane(lane, location_version)
+        fuel_stations = _lane_stations(lane)
+        with stage('lane'):
+            projection = lane_projection(lane, fuel_stations)
+        increment('route_lane_hits')
+        return lane_route_data(lane), fuel_stations, projection
+
+    def _precompute_lane(self, coordinates, route_data, location_version):
+        """Project the stations onto a routed lane and store it, returning the Lane"""
+        geometry = route_data['geometry']
+        fuel_stations = _station_index([geometry])
+        corridor_miles = settings.ROUTE_CORRIDOR_MILES
+        with stage('projection'):
+            projection = self._project_stations(geometry, fuel_stations, corridor_miles)
+        record = lane_record(lane_key(coordinates), coordinates, route_data, projection, fuel_stations,
+                             location_version)
+        save_lane(record)
+        return record
+
+    def _refresh_lane(self, lane, location_version):
+        """Project the current stations onto a stored lane's route, without routing it again"""
+        logger.info(f"Refreshing {lane} for station locations {location_version}")
+        return self._precompute_lane(lane.coordinates, lane_route_data(lane, geometry=True), location_version)
+
+    def _route_coordinates(self, start_lng, start_lat, end_lng, end_lat, waypoints=()):
+        """[lng, lat] pairs for ORS from the start through the (lat, lng) waypoints to the end"""
+        return [[start_lng, start_lat], *([lng, lat] for lat, lng in waypoints), [end_lng, end_lat]]
+
+    def _get_route_geometry(self, start_lng, start_lat, end_lng, end_lat, waypoints=()):
+        """Get route data from the route cache, falling back to OpenRouteService"""
+        coordinates = self._route_coordinates(start_lng, start_lat, end_lng, end_lat, waypoints)
+        route_cache = get_route_cache()
+        key = route_cache.make_key(*(c for point in coordinates for c in point))
+        route_data = route_cache.get(key)
+        if route_data is None:
+            route_data = self._fetch_route_geometry(coordinates)
+            if route_data:
+                route_cache.set(key, route_data)
+        return route_data
+
+    def _fetch_route_geometry(self, coordinates):
+        """Get route data through [lng, lat] coordinates from OpenRouteService API, in one request"""
+        try:
+            with stage('routing'):
+                route = get_routing_client().directions(coordinates)
+        except RoutingError as e:
+            logger.error(f"Routing error: {e}")
+            return None
+        return self._parse_route(route)
+
+    def _parse_route(self, route):
+        """Decode an ORS route into its geometry, mileage and leg boundaries
+
+        `way_points` are the geometry indices of the requested coordinates
+        and `leg_miles` the length of each leg between them.
+        """
+        try:
+            with stage('decode'):
+                geometry = RouteGeometry.from_coordinates(polyline.decode(route['geometry']))
+            total_miles = route['summary']['distance'] / 1609.34
+            segments = route.get('segments') or []
+            way_points = route.get('way_points') or [0, max(len(geometry) - 1, 0)]
+            if len(segments) == len(way_points) - 1:
+                leg_miles = [segment['distance'] / 1609.34 for segment in segments]
+            else:
+                leg_miles = np.diff(geometry.miles[way_points]).tolist()
             return {
-                'coordinates': geometry,
+                'geometry': geometry,
                 'total_miles': total_miles,
-                'polyline': data['routes'][0]['geometry']
+                'polyline': route['geometry'],
+                'way_points': [int(i) for i in way_points],
+                'leg_miles': leg_miles,
             }
-        except Exception as e:
+        except (KeyError, TypeError, ValueError, IndexError) as e:
             logger.error(f"Routing error: {e}")
             return None
 
-    def _calculate_fuel_stops(self, route_coords, total_distance):
-        """Calculate optimal fuel stops along route"""
+    def _calculate_fuel_stops(self, route, total_distance, strategy='optimal', fuel_stations=None,
+                              vehicle=None):
+        """Calculate optimal fuel stops along a RouteGeometry
+
+        `vehicle` holds the parsed vehicle parameters, the class defaults if
+        omitted. The station projection is cached per route, so calls with
+        other vehicle parameters only rerun the solver.
+        """
+        if fuel_stations is None:
+            fuel_stations = _station_index([route])
+        corridor_miles = settings.ROUTE_CORRIDOR_MILES
+        with stage('projection'):
+            projection = get_projection_cache().get_or_compute(
+                route, fuel_stations, corridor_miles,
+                lambda: self._project_stations(route, fuel_stations, corridor_miles))
+        return self._plan_stops(projection, fuel_stations, total_distance, strategy, vehicle)
+
+    def _plan_stops(self, projection, fuel_stations, total_distance, strategy, vehicle=None):
+        """Run the fuel planner over projected stations and format the stops"""
+        # Solvers expect stations sorted by mile position, ties in load order
+        order = np.lexsort((projection['station_index'], projection['mile_position']))
+        sorted_miles = projection['mile_position'][order]
+        sorted_stations = projection['station_index'][order]
+
+        range_miles, mpg, start_fuel = self._vehicle(vehicle)
+        with stage('solver'):
+            plan = STRATEGIES[strategy](sorted_miles, fuel_stations.prices[sorted_stations],
+                                        total_distance, range_miles, mpg, start_fuel)
+        if plan is None:
+            logger.warning(f"No feasible fuel plan for {total_distance:.1f} mile route")
+            return None, 0
+
         stops = []
-        total_cost = 0.0
-        route_points = self._create_route_points(route_coords)
-        route_tree = KDTree([[p['lat'], p['lng']] for p in route_points])
-
-        current_pos = 0.0
-        while current_pos < total_distance:
-            max_range = min(current_pos + self.MAX_RANGE, total_distance)
-            print(f"Current position: {current_pos} miles, max range: {max_range} miles")
-            # Find station candidates in current segment
-            candidates = []
-     
-            for station in self.fuel_stations['stations']:
-                # Find nearest point on route
-                _, idx = route_tree.query([[station['lat'], station['lng']]])
-                print(f"Nearest route point index: {idx}")
-                idx = int(idx)  # Ensure idx is an integer
-                route_point = route_points[idx]
-                print(f"Nearest route point: {route_point}")
-                
-                logger.debug(f"Checking station at ({station['lat']}, {station['lng']}) with price {station['price']}")
-                logger.debug(f"Nearest route point at ({route_point['lat']}, {route_point['lng']}) with mile position {route_point['mile_position']}")
-                print(f"Checking station at ({station['lat']}, {station['lng']}) with price {station['price']}")
-
-                if current_pos <= route_point['mile_position'] <= max_range:
-                    distance_from_route = great_circle(
-                        (station['lat'], station['lng']),
-                        (route_point['lat'], route_point['lng'])
-                    ).miles
-                    
-                    logger.debug(f"Distance from route: {distance_from_route} miles")
-                    print(f"Distance from route: {distance_from_route} miles")
-                    if distance_from_route > 0:
-                        candidates.append({
-                            **station,
-                            'mile_position': route_point['mile_position'],
-                            'distance_from_route': distance_from_route
-                        })
-
-            if not candidates:
-                logger.warning(f"No stations found in range for segment starting at {current_pos} miles")
-                return None, 0  # No stations in range
-
-            # Select cheapest station in segment
-            cheapest = min(candidates, key=lambda x: x['price'])
-            segment_distance = cheapest['mile_position'] - current_pos
-            total_cost += (segment_distance / self.MPG) * cheapest['price']
+        for purchase in plan:
+            station = sorted_stations[purchase['index']]
             stops.append({
-                'lat': cheapest['lat'],
-                'lng': cheapest['lng'],
-                'price_per_gallon': cheapest['price'],
-                'distance_from_start': round(cheapest['mile_position'], 1)
+                'lat': float(fuel_stations.lats[station]),
+                'lng': float(fuel_stations.lngs[station]),
+                'price_per_gallon': float(fuel_stations.prices[station]),
+                'distance_from_start': round(float(sorted_miles[purchase['index']]), 1),
+                'gallons': round(float(purchase['gallons']), 2),
+                'cost': round(float(purchase['cost']), 2)
             })
-            
-            current_pos = cheapest['mile_position'] + (self.MAX_RANGE)  # Conservative buffer
-
-        return stops, total_cost
-
-    def _create_route_points(self, coordinates):
-        """Create route points with cumulative mileage"""
-        points = []
-        cumulative_miles = 0.0
-        prev = None
-        
-        for coord in coordinates:
-            if prev:
-                segment = great_circle(prev, coord).miles 
-                cumulative_miles += segment
-                
-            points.append({
-                'lat': coord[0],  # Note: coord[1] is latitude, coord[0] is longitude
-                'lng': coord[1],
-                'mile_position': cumulative_miles
-            })
-            prev = coord
-            
-        return points
\ No newline at end of file
+        return stops, float(sum(purchase['cost'] for purchase in plan))
+
+    def _project_stations(self, route, fuel_stations, corridor_miles):
+        """Project the stations within `corridor_miles` of the route onto its nearest segment"""
+        segments = self._segment_index(route, corridor_miles)
+        query_tree = KDTree(segments.coords) if len(segments.coords) else None
+        candidates = fuel_stations.near_route(query_tree, corridor_miles + segments.spacing_miles / 2)
+        return self._snap_stations(segments, fuel_stations, candidates, corridor_miles)
+
+    def _project_routes(self, routes, fuel_stations, corridor_miles):
+        """_project_stations for many routes, sharing one corridor query on the station index"""
+        segments = [self._segment_index(route, corridor_miles) for route in routes]
+        candidates = fuel_stations.near_routes([s.coords for s in segments],
+                                               corridor_miles + query_spacing(corridor_miles) / 2)
+        return [self._snap_stations(route_segments, fuel_stations, route_candidates, corridor_miles)
+                for route_segments, route_candidates in zip(segments, candidates)]
+
+    def _segment_index(self, route, corridor_miles):
+        """SegmentIndex over the simplified route, with query points spaced for the corridor"""
+        return SegmentIndex(self._index_geometry(route), query_spacing(corridor_miles))
+
+    def _index_geometry(self, route):
+        """Route vertices used for projection, simplified but keeping full-resolution mileage"""
+        return route.subset(simplify(route.lats, route.lngs, settings.ROUTE_SIMPLIFY_INDEX_METERS,
+                                     settings.ROUTE_SIMPLIFY_INDEX_MAX_SEGMENT_METERS or None))
+
+    def _snap_stations(self, segments, fuel_stations, candidates, corridor_miles):
+        """Interpolated mile position and exact distance for candidates inside the corridor"""
+        inside, _, mile_position, distance = segments.project(
+            fuel_stations.lats[candidates], fuel_stations.lngs[candidates], corridor_miles)
+        return {
+            'station_index': candidates[inside],
+            'mile_position': mile_position,
+            'distance_from_route': distance,
+        }
+
+
+class RouteMapView(View):
+    """Serve the map of a planned route, rendering it on first fetch"""
+
+    def get(self, request, map_id):
+        with stage('map'):
+            html = render_map(map_id)
+        if html is None:
+            raise Http404('Unknown or expired map')
+        return HttpResponse(html, content_type='text/html')
+
+
+_batch_executor = ThreadPoolExecutor(max_workers=settings.ROUTE_BATCH_CONCURRENCY,
+                                     thread_name_prefix='route-batch')
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class RouteBatchView(RouteView):
+    """Plan many trips in one call
+
+    The body is a JSON array of trips with the same fields as the /route/
+    query parameters. Identical lanes are routed once and unique lanes are
+    routed concurrently; stations are projected onto every route with one
+    query against the shared station index. Trips with a stored plan are
+    answered without routing unless they ask for a map, and new plans are
+    stored in one insert. Errors are reported per trip.
+    """
+    http_method_names = ['post', 'options']
+
+    def post(self, request):
+        try:
+            trips = json.loads(request.body)
+        except ValueError:
+            trips = None
+        if not isinstance(trips, list):
+            return JsonResponse({'error': 'Request body must be a JSON array of trips'}, status=400)
+        if len(trips) > settings.ROUTE_BATCH_MAX_TRIPS:
+            return JsonResponse({'error': f"At most {settings.ROUTE_BATCH_MAX_TRIPS} trips per batch"},
+                                status=400)
+
+        results = [None] * len(trips)
+        valid = {}
+        for i, trip in enumerate(trips):
+            try:
+                if not isinstance(trip, dict):
+                    raise ValueError('Trip must be a JSON object')
+                valid[i] = self._parse_params(trip)
+            except ValueError as e:
+                results[i] = {'index': i, 'error': str(e)}
+
+        version = _stations_version()
+        plan_keys = {i: self._plan_key(params, version) for i, params in valid.items()}
+        with stage('plan_store'):
+            stored = get_plans(plan_keys.values())
+        planned = {}
+        lanes = {}
+        route_cache = get_route_cache()
+        for i, params in valid.items():
+            plan = stored.get(plan_keys[i])
+            if plan is not None:
+                increment('route_plan_hits')
+                if not params['include_map']:
+                    results[i] = {'index': i, **plan}
+                    continue
+            elif plan_keys[i]:
+                increment('route_plan_misses')
+            coordinates = self._route_coordinates(params['start_lng'], params['start_lat'],
+                                                  params['end_lng'], params['end_lat'], params['waypoints'])
+            key = route_cache.make_key(*(c for point in coordinates for c in point))
+            planned[i] = (params, key, plan)
+            lanes.setdefault(key, params)
+
+        routes = dict(zip(lanes, _batch_executor.map(
+            run_in_context(_closing_connections(lambda p: self._get_route_geometry(
+                p['start_lng'], p['start_lat'], p['end_lng'], p['end_lat'], p['waypoints']))),
+            lanes.values())))
+        routed = [key for key, route_data in routes.items() if route_data]
+        fuel_stations = _station_index([routes[key]['geometry'] for key in routed])
+        with stage('projection'):
+            projections = self._cached_projections({key: routes[key]['geometry'] for key in routed},
+                                                   fuel_stations, settings.ROUTE_CORRIDOR_MILES)
+
+        records = {}
+        for i, (params, key, plan) in planned.items():
+            if not routes[key]:
+                results[i] = {'index': i, 'error': 'Route calculation failed'}
+                continue
+            if plan is None:
+                fuel_stops, total_cost = self._plan_stops(projections[key], fuel_stations,
+                                                          routes[key]['total_miles'], params['strategy'], params)
+                if fuel_stops is None:
+                    results[i] = {'index': i, 'error': 'No fuel stations found along route'}
+                    continue
+                plan = {'total_cost': round(total_cost, 2), 'fuel_stops': fuel_stops}
+                self._add_legs(plan, params, routes[key])
+                plan_id = self._plan_key(params, fuel_stations.version)
+                if plan_id:
+                    records[plan_id] = plan_record(plan_id, params, fuel_stations.version,
+                                                   routes[key]['total_miles'], plan)
+            results[i] = {'index': i, **plan}
+            if params['include_map']:
+                self._add_map(results[i], params, routes[key])
+        with stage('plan_store'):
+            save_plans(list(records.values()))
+
+        return JsonResponse({'trips': results, 'unique_routes': len(lanes)})
+
+    def _cached_projections(self, routes, fuel_stations, corridor_miles):
+        """Projections for {key: RouteGeometry}, projecting the uncached routes in one query"""
+        cache = get_projection_cache()
+        projections = {key: cache.get(route, fuel_stations, corridor_miles) for key, route in routes.items()}
+        missing = [key for key, projection in projections.items() if projection is None]
+        for key, projection in zip(missing, self._project_routes(
+                [routes[key] for key in missing], fuel_stations, corridor_miles)):
+            cache.set(routes[key], fuel_stations, corridor_miles, projection)
+            projections[key] = projection
+        return projections
+
+
+_cpu_executor = ThreadPoolExecutor(max_workers=settings.ROUTE_CPU_WORKERS,
+                                   thread_name_prefix='route-cpu')
+
+
+class AsyncRouteView(RouteView):
+    """RouteView for the ASGI app
+
+    The upstream routing call is awaited on an async HTTP client, and the
+    CPU-bound planning and map rendering run in a thread pool, so one worker
+    can keep many route requests in flight.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Django 3.2 only recognises async function views, not async class-based views
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        return self._awaitable(super().http_method_not_allowed(request, *args, **kwargs))
+
+    def options(self, request, *args, **kwargs):
+        return self._awaitable(super().options(request, *args, **kwargs))
+
+    @staticmethod
+    def _awaitable(response):
+        """Wrap a response from a sync View handler, which an async view must await"""
+        async def func():
+            return response
+
+        return func()
+
+    async def get(self, request):
+        try:
+            params = self._parse_params(request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        if settings.ROUTE_SINGLE_FLIGHT:
+            body, status = await get_route_flight().ado(self._flight_key(params),
+                                                         lambda: self._aplan_trip(params))
+        else:
+            body, status = await self._aplan_trip(params)
+        return JsonResponse(body, status=status)
+
+    async def _aplan_trip(self, params):
+        """Async _plan_trip"""
+        plan = await sync_to_async(_closing_connections(self._stored_plan), thread_sensitive=False)(params)
+        if plan is not None and not params['include_map']:
+            return plan, 200
+
+        loop = asyncio.get_running_loop()
+        plan_result = run_in_context(_closing_connections(self._plan_result))
+        lane = await sync_to_async(_closing_connections(self._precomputed_lane), thread_sensitive=False)(params)
+        if lane is not None:
+            route_data, fuel_stations, projection = lane
+            return await loop.run_in_executor(_cpu_executor, plan_result,
+                                              params, route_data, plan, (fuel_stations, projection))
+
+        route_data = await self._aget_route_geometry(params['start_lng'], params['start_lat'],
+                                                     params['end_lng'], params['end_lat'], params['waypoints'])
+        return await loop.run_in_executor(_cpu_executor, plan_result, params, route_data, plan)
+
+    async def _aget_route_geometry(self, start_lng, start_lat, end_lng, end_lat, waypoints=()):
+        """Async _get_route_geometry: cache lookups in threads, upstream call awaited"""
+        coordinates = self._route_coordinates(start_lng, start_lat, end_lng, end_lat, waypoints)
+        route_cache = get_route_cache()
+        key = route_cache.make_key(*(c for point in coordinates for c in point))
+        route_data = await sync_to_async(_closing_connections(route_cache.get), thread_sensitive=False)(key)
+        if route_data is None:
+            try:
+                with stage('routing'):
+                    route = await get_async_routing_client().directions(coordinates)
+            except RoutingError as e:
+                logger.error(f"Routing error: {e}")
+                return None
+            route_data = self._parse_route(route)
+            if route_data:
+                await sync_to_async(_closing_connections(route_cache.set), thread_sensitive=False)(key, route_data)
+        return route_data
+
+
+class MetricsView(View):
+    """Prometheus text metrics for this worker process, while METRICS_ENABLED is set"""
+
+    def get(self, request):
+        if not settings.METRICS_ENABLED:
+            raise Http404('Metrics are disabled')
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
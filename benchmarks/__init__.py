@@ -0,0 +1,6 @@
+"""Offline benchmarks for the route planning pipeline.
+
+Run a benchmark from the repository root, e.g.::
+
+    python -m benchmarks.station_index
+"""
@@ -0,0 +1,68 @@
+"""A fleet plan sent as one POST /route/batch/ vs one GET /route/ per trip.
+
+Trips are drawn from a smaller set of recurring lanes, as in a dispatch
+plan. The app runs in-process against a local fake OpenRouteService with a
+fixed upstream latency, with a fresh route cache for each run.
+"""
+import argparse
+import json
+import os
+import random
+import time
+from urllib.parse import urlencode
+
+from .common import lane_stations, setup_django, wsgi_request
+
+
+def fleet_trips(count, lanes, seed=0):
+    rng = random.Random(seed)
+    ends = [round(-85.0 - i * 0.05, 4) for i in range(lanes)]
+    return [{'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0, 'end_lng': rng.choice(ends)}
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--trips', type=int, default=500)
+    parser.add_argument('--lanes', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.1, help="upstream latency in seconds")
+    args = parser.parse_args()
+
+    from api.testing import FakeORSServer
+
+    with FakeORSServer(latency=args.latency, points_per_leg=1000) as server:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        os.environ['ROUTE_LANES_ENABLED'] = 'false'
+        setup_django()
+        from django.core.wsgi import get_wsgi_application
+        from api import route_cache, stations
+
+        stations.set_station_index(lane_stations())
+        application = get_wsgi_application()
+        trips = fleet_trips(args.trips, args.lanes)
+        print(f"{args.trips} trips over {args.lanes} lanes, upstream latency "
+              f"{args.latency * 1000:.0f} ms")
+
+        route_cache._route_cache = route_cache.RouteCache(alias='default')
+        start = time.perf_counter()
+        ok = sum(wsgi_request(application, '/route/', urlencode(trip))[0] for trip in trips)
+        sequential = time.perf_counter() - start
+        print(f"{'sequential GET /route/':<28} {sequential:8.2f} s   ok {ok}/{len(trips)}   "
+              f"upstream calls {server.request_count}")
+
+        from django.core.cache import caches
+        caches['default'].clear()
+        route_cache._route_cache = route_cache.RouteCache(alias='default')
+        upstream_before = server.request_count
+        start = time.perf_counter()
+        _, _, content = wsgi_request(application, '/route/batch/', method='POST',
+                                     body=json.dumps(trips).encode())
+        batch = time.perf_counter() - start
+        ok = sum(1 for trip in json.loads(content)['trips'] if 'fuel_stops' in trip)
+        print(f"{'POST /route/batch/':<28} {batch:8.2f} s   ok {ok}/{len(trips)}   "
+              f"upstream calls {server.request_count - upstream_before}")
+        print(f"speedup {sequential / batch:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
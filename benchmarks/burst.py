@@ -0,0 +1,78 @@
+"""Bursts of identical /route/ requests with and without single-flight coalescing.
+
+Each burst sends `--duplicates` concurrent requests for each of `--lanes`
+lanes, as when many clients ask for the same lane as dispatch opens. It
+reports upstream calls and the process CPU time spent, once through
+threaded WSGI workers and once through the ASGI app. Every pass uses fresh
+lanes, so the route cache never answers.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import lane_stations, setup_django, wsgi_request
+from .load_test import lane_queries, run_asgi, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lanes', type=int, default=5)
+    parser.add_argument('--duplicates', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=32, help="WSGI worker threads")
+    parser.add_argument('--latency', type=float, default=0.3, help="upstream latency in seconds")
+    args = parser.parse_args()
+
+    from api.testing import FakeORSServer
+
+    with FakeORSServer(latency=args.latency, points_per_leg=1000) as server:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        os.environ['ROUTE_LANES_ENABLED'] = 'false'
+        os.environ['ORS_POOL_SIZE'] = str(max(args.workers, args.lanes * args.duplicates))
+        setup_django()
+        from django.core.asgi import get_asgi_application
+        from django.core.wsgi import get_wsgi_application
+        from django.test import override_settings
+        from api import route_cache, stations
+
+        route_cache._route_cache = route_cache.RouteCache(alias='default', max_entries=0)
+        stations.set_station_index(lane_stations())
+        wsgi_app = get_wsgi_application()
+        asgi_app = get_asgi_application()
+        total = args.lanes * args.duplicates
+        print(f"{args.lanes} lanes x {args.duplicates} concurrent duplicates, "
+              f"upstream latency {args.latency * 1000:.0f} ms")
+
+        lanes = iter(lane_queries(args.lanes * 4))
+        rng = random.Random(0)
+
+        def burst():
+            queries = [query for query in [next(lanes) for _ in range(args.lanes)]
+                       for _ in range(args.duplicates)]
+            rng.shuffle(queries)
+            return queries
+
+        def run_wsgi(queries):
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                return list(pool.map(lambda q: wsgi_request(wsgi_app, '/route/', q), queries))
+
+        def run_async(queries):
+            return asyncio.run(run_asgi(asgi_app, queries, total))
+
+        for enabled in (False, True):
+            with override_settings(ROUTE_SINGLE_FLIGHT=enabled):
+                label = 'coalesced' if enabled else 'independent'
+                for name, run in ((f"WSGI, {args.workers} threads", run_wsgi), ("ASGI, 1 worker", run_async)):
+                    queries = burst()
+                    calls, cpu, start = server.request_count, time.process_time(), time.perf_counter()
+                    results = run(queries)
+                    elapsed = time.perf_counter() - start
+                    summarize(f"{name}, {label}", results, elapsed)
+                    print(f"{'':<28} upstream calls {server.request_count - calls}, "
+                          f"CPU {(time.process_time() - cpu) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
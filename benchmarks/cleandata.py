@@ -0,0 +1,109 @@
+"""Throughput and peak memory of cleandata.py on multi-million-row price files.
+
+Writes synthetic OPIS price files of each size in --rows, drawing from
+--stations distinct OPIS IDs with about 1% invalid rows, like a price file
+with history appended. Each run goes to a fresh process, so the peak RSS it
+reports is its own. With --legacy the old whole-file pandas drop_duplicates
+runs too, for comparison.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from cleandata import PRICE_COLUMNS, deduplicate_truckstops
+
+DEFAULT_ROWS = [1000000, 2000000, 5000000]
+
+
+def write_price_file(path, rows, stations, seed=0, chunk_rows=500000):
+    """Write a synthetic raw OPIS price file with repeated IDs and some invalid rows"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        ids = rng.integers(1, stations + 1, n)
+        prices = rng.uniform(2.8, 4.2, n).round(8).astype(str)
+        prices[rng.random(n) < 0.005] = 'N/A'
+        prices[rng.random(n) < 0.005] = '99.9'
+        chunk = pd.DataFrame({
+            'OPIS Truckstop ID': ids,
+            'Truckstop Name': np.char.add('STATION ', ids.astype(str)),
+            'Address': np.char.add('I-40, EXIT ', (ids % 400).astype(str)),
+            'City': 'Town',
+            'State': 'TX',
+            'Rack ID': ids % 900 + 100,
+            'Retail Price': prices,
+        }, columns=PRICE_COLUMNS)
+        chunk.to_csv(path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    return path
+
+
+def legacy_deduplicate(input_file, output_file):
+    """The whole-file cleaner this replaced: keep the first row per ID, no validation"""
+    df = pd.read_csv(input_file)
+    df.drop_duplicates(subset=['OPIS Truckstop ID'], keep='first').to_csv(output_file, index=False)
+
+
+def peak_rss_mib():
+    """Peak resident memory of this process; ru_maxrss would include the parent's before exec"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _child(queue, func, args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss_mib()))
+
+
+def measure(func, *args):
+    """(seconds, peak RSS in MiB) of func(*args) in a fresh process"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_child, args=(queue, func, args))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--stations', type=int, default=20000)
+    parser.add_argument('--chunk-rows', type=int, default=100000)
+    parser.add_argument('--legacy', action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'clean.csv')
+        rejects = os.path.join(tmp, 'rejects.csv')
+        for rows in args.rows:
+            path = write_price_file(os.path.join(tmp, f"prices_{rows}.csv"), rows, args.stations)
+            size = os.path.getsize(path) / 2 ** 20
+            print(f"\n{rows} rows, {args.stations} stations, {size:.0f} MiB")
+            for policy in ('first', 'latest', 'min'):
+                seconds, peak = measure(deduplicate_truckstops, path, output, policy, rejects, args.chunk_rows)
+                print(f"  {policy:<8} {seconds:7.2f} s  {rows / seconds / 1e6:6.2f} M rows/s  "
+                      f"{size / seconds:6.1f} MiB/s  peak RSS {peak:7.0f} MiB")
+            if args.legacy:
+                seconds, peak = measure(legacy_deduplicate, path, output)
+                print(f"  {'legacy':<8} {seconds:7.2f} s  {rows / seconds / 1e6:6.2f} M rows/s  "
+                      f"{size / seconds:6.1f} MiB/s  peak RSS {peak:7.0f} MiB")
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
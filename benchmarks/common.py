@@ -0,0 +1,97 @@
+import csv
+import io
+import os
+import random
+import statistics
+import time
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_api.settings')
+    django.setup()
+
+
+def write_station_csv(path, rows, seed=0):
+    """Write a synthetic geocoded fuel price CSV spread over the contiguous US"""
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['OPIS Truckstop ID', 'Truckstop Name', 'Address', 'City',
+                         'State', 'Rack ID', 'Retail Price', 'Latitude', 'Longitude'])
+        for i in range(rows):
+            writer.writerow([
+                i, f"STATION {i}", f"I-{i % 99}, EXIT {i % 400}", "Town", "TX",
+                rng.randint(100, 999), round(rng.uniform(2.8, 4.2), 5),
+                round(rng.uniform(25.0, 49.0), 5), round(rng.uniform(-124.0, -67.0), 5),
+            ])
+    return path
+
+
+def time_call(func, repeat=5, number=1):
+    """Return per-call timings in milliseconds for `repeat` runs of `number` calls"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) * 1000 / number)
+    return timings
+
+
+def report(label, timings):
+    print(f"{label:<40} median {statistics.median(timings):10.3f} ms   "
+          f"min {min(timings):10.3f} ms")
+
+
+def synthetic_route(start=(40.7128, -74.0060), end=(34.0522, -118.2437), points=20000, seed=0):
+    """Return a wiggly (lat, lng) polyline between two points, like polyline.decode output"""
+    rng = random.Random(seed)
+    coords = []
+    for i in range(points):
+        t = i / (points - 1)
+        wiggle = 0.0 if i in (0, points - 1) else rng.uniform(-0.002, 0.002)
+        coords.append((
+            round(start[0] + (end[0] - start[0]) * t + 1.5 * (t * (1 - t)) + wiggle, 5),
+            round(start[1] + (end[1] - start[1]) * t + wiggle, 5),
+        ))
+    return coords
+
+
+def legacy_route_points(coordinates):
+    """Route points as RouteView._create_route_points used to build them"""
+    from geopy.distance import great_circle
+
+    points = []
+    cumulative_miles = 0.0
+    prev = None
+    for coord in coordinates:
+        if prev:
+            cumulative_miles += great_circle(prev, coord).miles
+        points.append({'lat': coord[0], 'lng': coord[1], 'mile_position': cumulative_miles})
+        prev = coord
+    return points
+
+
+def lane_stations():
+    """Station index with a station every ~10 miles along latitude 40 from -80 to -100"""
+    import numpy as np
+    from api.stations import StationIndex
+
+    lngs = np.arange(-80.1, -100.0, -0.2)
+    return StationIndex(np.full(lngs.size, 40.01), lngs, np.linspace(2.9, 3.9, lngs.size))
+
+
+def wsgi_request(application, path, query='', method='GET', body=b''):
+    """Call a WSGI app in-process, returning (succeeded, seconds, response body)"""
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': io.StringIO(),
+    }
+    status = []
+    start = time.perf_counter()
+    content = b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+    return status[0].startswith('200'), time.perf_counter() - start, content
@@ -0,0 +1,96 @@
+"""Coast-to-coast fuel stop search: per-station Python loop vs batched projection.
+
+"before" is the loop _calculate_fuel_stops used to run (one KDTree query and
+one geopy great_circle per station per 500-mile segment), minus its print
+calls and with the corridor check applied. "after" is the current
+RouteView._calculate_fuel_stops with the greedy strategy; both must return
+the same stops. The optimal strategy is timed alongside.
+"""
+import argparse
+import os
+import tempfile
+
+from geopy.distance import great_circle
+from scipy.spatial import KDTree
+
+from .common import (legacy_route_points, report, setup_django, synthetic_route, time_call,
+                     write_station_csv)
+
+
+def legacy_fuel_stops(view, stations, route_coords, total_distance, corridor_miles):
+    stops = []
+    total_cost = 0.0
+    route_points = legacy_route_points(route_coords)
+    route_tree = KDTree([[p['lat'], p['lng']] for p in route_points])
+    current_pos = 0.0
+    while current_pos < total_distance:
+        max_range = min(current_pos + view.MAX_RANGE, total_distance)
+        candidates = []
+        for station in stations:
+            _, idx = route_tree.query([[station['lat'], station['lng']]])
+            route_point = route_points[int(idx[0])]
+            if current_pos <= route_point['mile_position'] <= max_range:
+                distance_from_route = great_circle(
+                    (station['lat'], station['lng']),
+                    (route_point['lat'], route_point['lng'])
+                ).miles
+                if distance_from_route <= corridor_miles:
+                    candidates.append({**station, 'mile_position': route_point['mile_position']})
+        if not candidates:
+            return None, 0
+        cheapest = min(candidates, key=lambda x: x['price'])
+        total_cost += ((cheapest['mile_position'] - current_pos) / view.MPG) * cheapest['price']
+        stops.append({
+            'lat': cheapest['lat'],
+            'lng': cheapest['lng'],
+            'price_per_gallon': cheapest['price'],
+            'distance_from_start': round(cheapest['mile_position'], 1)
+        })
+        current_pos = cheapest['mile_position'] + view.MAX_RANGE
+    return stops, total_cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=8152)
+    parser.add_argument('--points', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from api import stations
+    from api.geo import RouteGeometry
+    from api.views import RouteView
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_station_csv(os.path.join(tmp, 'stations.csv'), args.rows)
+        index = stations.load_station_index(path)
+    stations.set_station_index(index)
+    station_dicts = [{'lat': lat, 'lng': lng, 'price': price} for lat, lng, price
+                     in zip(index.lats.tolist(), index.lngs.tolist(), index.prices.tolist())]
+
+    view = RouteView()
+    route = synthetic_route(points=args.points)
+    geometry = RouteGeometry.from_coordinates(route)
+    total = geometry.total_miles
+    corridor = settings.ROUTE_CORRIDOR_MILES
+    near = view._project_stations(geometry, index, corridor)
+    print(f"{args.rows} stations, {args.points} route points, {total:.0f} miles, "
+          f"{near['station_index'].size} stations within {corridor:g} miles")
+
+    before = legacy_fuel_stops(view, station_dicts, route, total, corridor)
+    after = view._calculate_fuel_stops(geometry, total, 'greedy')
+    legacy_fields = [{k: stop[k] for k in before[0][0]} for stop in after[0]]
+    assert before[0] == legacy_fields and abs(before[1] - after[1]) < 1e-6, "results differ"
+
+    report("before: per-station loop",
+           time_call(lambda: legacy_fuel_stops(view, station_dicts, route, total, corridor), repeat=args.repeat))
+    report("after: batched projection, greedy",
+           time_call(lambda: view._calculate_fuel_stops(geometry, total, 'greedy'), repeat=args.repeat))
+    report("after: batched projection, optimal",
+           time_call(lambda: view._calculate_fuel_stops(geometry, total, 'optimal'), repeat=args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""GET /route/ on a precomputed lane against routing and projecting it.
+
+Replays the recorded New York to Los Angeles route from api/response.json
+through a local stand-in server, over --rows synthetic stations. Before each
+request the prices change, as after a price ingest, so the projection cache
+never answers and stored plans are off:
+
+  routed            cold route cache: routing, projection and solver
+  route cached      warm route cache: projection and solver
+  precomputed lane  lane stored by precompute_lanes: solver only
+
+It also times refreshing the lane after station locations change, which
+projects again from the stored route without routing. Runs against a
+throwaway migrated test database.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from urllib.parse import urlencode
+
+from .common import report, setup_django, wsgi_request, write_station_csv
+
+RECORDED_ROUTE = os.path.join(os.path.dirname(__file__), '..', 'api', 'response.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    import polyline
+
+    from api.testing import FakeORSServer, recorded_response
+
+    ors = recorded_response(RECORDED_ROUTE)
+    coordinates = polyline.decode(ors['routes'][0]['geometry'])
+    trip = {'start_lat': coordinates[0][0], 'start_lng': coordinates[0][1],
+            'end_lat': coordinates[-1][0], 'end_lng': coordinates[-1][1]}
+
+    with FakeORSServer(response=ors) as server, tempfile.TemporaryDirectory() as tmp:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        setup_django()
+        from django.core.cache import caches
+        from django.core.management import call_command
+        from django.core.wsgi import get_wsgi_application
+        from django.db import connection
+        from django.test import override_settings
+        from api import route_cache, stations
+        from api.models import Lane
+        from api.views import RouteView
+
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            index = stations.read_station_index(write_station_csv(os.path.join(tmp, 'stations.csv'), args.rows))
+            route_cache._route_cache = route_cache.RouteCache(alias='default')
+            application = get_wsgi_application()
+            query = urlencode(trip)
+            updates = iter(range(1, 1 << 30))
+
+            def new_prices():
+                i = next(updates)
+                stations.set_station_index(stations.StationIndex.from_arrays(
+                    index.coords, index.prices * (1 + i / 1000), index.ids, tree=index.tree, version=f"prices-{i}"))
+
+            def run(label, clear_routes=False):
+                timings = []
+                for _ in range(args.repeat):
+                    new_prices()
+                    if clear_routes:
+                        caches['default'].clear()
+                        route_cache.get_route_cache().clear_memory()
+                    ok, seconds, _ = wsgi_request(application, '/route/', query)
+                    assert ok, 'route request failed'
+                    timings.append(seconds * 1000)
+                report(label, timings)
+
+            print(f"{len(index)} stations, {ors['routes'][0]['summary']['distance'] / 1609.34:.0f} mile route")
+            with override_settings(ROUTE_PLANS_ENABLED=False, ROUTE_MAP_CACHE_ALIAS='default'):
+                with override_settings(ROUTE_LANES_ENABLED=False):
+                    run("routed", clear_routes=True)
+                    run("route cached")
+                lane_file = os.path.join(tmp, 'lanes.json')
+                with open(lane_file, 'w') as f:
+                    json.dump([trip], f)
+                call_command('precompute_lanes', lane_file, stdout=open(os.devnull, 'w'))
+                calls = server.request_count
+                run("precomputed lane", clear_routes=True)
+                assert server.request_count == calls, 'precomputed lane was routed'
+
+                lane = Lane.objects.get()
+                moved = stations.StationIndex.from_arrays(index.coords[::-1].copy(), index.prices, index.ids,
+                                                          version='moved')
+                stations.set_station_index(moved)
+                view = RouteView()
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    view._refresh_lane(lane, moved.location_version)
+                    timings.append((time.perf_counter() - start) * 1000)
+                report("lane refresh after a location change", timings)
+            print(f"{len(lane.station_ids)} stations on the lane, upstream calls {server.request_count}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Throughput of /route/ on sync WSGI workers vs /route/async/ on one ASGI worker.
+
+Both apps are driven in-process against a local fake OpenRouteService with a
+fixed upstream latency. The WSGI side gets `--workers` threads, like that many
+sync gunicorn workers; the ASGI side runs on a single event loop with up to
+`--concurrency` requests in flight. Every request uses a distinct lane so the
+route cache never hits.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from .common import lane_stations, setup_django, wsgi_request
+
+
+def lane_queries(count):
+    return [urlencode({'start_lat': 40.0, 'start_lng': -80.0,
+                       'end_lat': 40.0, 'end_lng': round(-90.0 - i * 0.001, 4)})
+            for i in range(count)]
+
+
+async def asgi_request(application, query):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': '/route/async/', 'raw_path': b'/route/async/',
+        'query_string': query.encode(), 'headers': [], 'server': ('localhost', 80),
+        'client': ('127.0.0.1', 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    start = time.perf_counter()
+    await application(scope, receive, send)
+    return messages[0]['status'] == 200, time.perf_counter() - start, messages[1]['body']
+
+
+async def run_asgi(application, queries, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def bounded(query):
+        async with limit:
+            return await asgi_request(application, query)
+
+    return await asyncio.gather(*(bounded(q) for q in queries))
+
+
+def summarize(label, results, elapsed):
+    latencies = sorted(result[1] * 1000 for result in results)
+    ok = sum(1 for result in results if result[0])
+    print(f"{label:<28} {len(results) / elapsed:8.1f} req/s   ok {ok}/{len(results)}   "
+          f"p50 {statistics.median(latencies):8.1f} ms   "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.3, help="upstream latency in seconds")
+    args = parser.parse_args()
+
+    from api.testing import FakeORSServer
+
+    with FakeORSServer(latency=args.latency, points_per_leg=1000) as server:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        os.environ['ROUTE_LANES_ENABLED'] = 'false'
+        os.environ['ORS_POOL_SIZE'] = str(args.concurrency)
+        setup_django()
+        from django.core.asgi import get_asgi_application
+        from django.core.wsgi import get_wsgi_application
+        from api import route_cache, stations
+
+        # Route cache in local memory only
+        route_cache._route_cache = route_cache.RouteCache(alias='default', max_entries=0)
+        stations.set_station_index(lane_stations())
+
+        wsgi_app = get_wsgi_application()
+        asgi_app = get_asgi_application()
+        print(f"{args.requests} requests, upstream latency {args.latency * 1000:.0f} ms")
+
+        queries = lane_queries(args.requests)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(lambda q: wsgi_request(wsgi_app, '/route/', q), queries))
+        summarize(f"WSGI, {args.workers} sync workers", results, time.perf_counter() - start)
+
+        queries = lane_queries(args.requests * 2)[args.requests:]
+        start = time.perf_counter()
+        results = asyncio.run(run_asgi(asgi_app, queries, args.concurrency))
+        summarize("ASGI, 1 async worker", results, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""GET /route/ with metrics off and on, and the cost of a /metrics scrape.
+
+Routes come from a warm route cache and plans are not stored, so each
+request is dominated by projection and the solver; the difference between
+the passes is the timing overhead. A scrape renders every histogram and
+cache counter of the worker.
+"""
+import argparse
+import os
+from urllib.parse import urlencode
+
+from .common import lane_stations, report, setup_django, time_call, wsgi_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lanes', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    from api.testing import FakeORSServer
+
+    with FakeORSServer(points_per_leg=1000) as server:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        setup_django()
+        from django.core.wsgi import get_wsgi_application
+        from django.test import override_settings
+        from api import route_cache, stations
+
+        stations.set_station_index(lane_stations())
+        route_cache._route_cache = route_cache.RouteCache(alias='default')
+        application = get_wsgi_application()
+        queries = [urlencode({'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0,
+                              'end_lng': round(-90.0 - i * 0.05, 4)}) for i in range(args.lanes)]
+
+        def run():
+            for query in queries:
+                ok, _, _ = wsgi_request(application, '/route/', query)
+                assert ok, query
+
+        with override_settings(ROUTE_PLANS_ENABLED=False, ROUTE_LANES_ENABLED=False):
+            run()
+            with override_settings(METRICS_ENABLED=False):
+                off = time_call(run, repeat=args.repeat)
+            with override_settings(METRICS_ENABLED=True):
+                on = time_call(run, repeat=args.repeat)
+                scrape = time_call(lambda: wsgi_request(application, '/metrics'), repeat=args.repeat, number=20)
+                _, _, text = wsgi_request(application, '/metrics')
+
+        print(f"{args.lanes} lanes per pass, upstream calls {server.request_count}")
+        report("metrics off", [t / args.lanes for t in off])
+        report("metrics on", [t / args.lanes for t in on])
+        report("/metrics scrape", scrape)
+        print(f"{'':<40} {len(text.splitlines())} exposition lines")
+
+
+if __name__ == '__main__':
+    main()
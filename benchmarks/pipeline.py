@@ -0,0 +1,177 @@
+"""Stage-by-stage timings of the route planning pipeline, as JSON.
+
+Replays a recorded ORS response (api/response.json by default) through a
+local stand-in server, so nothing leaves the machine, and plans it against
+synthetic station sets of each size in --rows. Stages:
+
+  load_stations  parse the geocoded station CSV into the StationIndex
+  route_points   decode the ORS response into a RouteGeometry
+  fuel_stops     project stations onto the route and run the solver, cold
+  map            store and render the route map
+  request        a full GET /route/ through the WSGI app, routed upstream
+
+The JSON goes to --output (stdout by default) with the commit it ran on, so
+runs on two commits can be compared with --compare.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from .common import setup_django, time_call, wsgi_request, write_station_csv
+
+RECORDED_ROUTE = os.path.join(os.path.dirname(__file__), '..', 'api', 'response.json')
+DEFAULT_ROWS = [1000, 10000, 100000, 1000000]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(timings):
+    return {'median_ms': round(statistics.median(timings), 3), 'min_ms': round(min(timings), 3),
+            'runs_ms': [round(t, 3) for t in timings]}
+
+
+def run_stages(rows, ors_route, query, application, repeat, tmp):
+    from unittest import mock
+
+    from django.conf import settings
+    from django.core.cache import caches
+    from api import stations
+    from api.maps import render_map, store_map
+    from api.route_cache import ProjectionCache, get_route_cache
+    from api.views import RouteView
+
+    view = RouteView()
+    path = write_station_csv(os.path.join(tmp, f"stations_{rows}.csv"), rows)
+    results = {'load_stations': time_call(lambda: stations.read_station_index(path), repeat=repeat)}
+    index = stations.read_station_index(path)
+    stations.set_station_index(index)
+
+    results['route_points'] = time_call(lambda: view._parse_route(ors_route), repeat=repeat)
+    route_data = view._parse_route(ors_route)
+
+    def fuel_stops():
+        with mock.patch('api.views.get_projection_cache', return_value=ProjectionCache()):
+            return view._calculate_fuel_stops(route_data['geometry'], route_data['total_miles'],
+                                              fuel_stations=index)
+    results['fuel_stops'] = time_call(fuel_stops, repeat=repeat)
+    stops, total_cost = fuel_stops()
+
+    map_cache = caches[settings.ROUTE_MAP_CACHE_ALIAS]
+    map_stations = [(stop['lat'], stop['lng'], stop['price_per_gallon']) for stop in stops or []]
+
+    def render():
+        map_cache.clear()
+        return render_map(store_map(*query['points'], map_stations, route_data['polyline']))
+    results['map'] = time_call(render, repeat=repeat)
+
+    def request():
+        # Cold route and projection caches, so every request goes upstream to
+        # the stand-in and projects the stations again
+        caches['default'].clear()
+        get_route_cache().clear_memory()
+        with mock.patch('api.views.get_projection_cache', return_value=ProjectionCache()):
+            ok, _, _ = wsgi_request(application, '/route/', query['string'])
+        # Too few stations along the route is a 500, as for any infeasible trip
+        assert ok == (stops is not None), 'route request failed'
+    results['request'] = time_call(request, repeat=repeat)
+
+    return {
+        'rows': rows,
+        'fuel_stops': None if stops is None else len(stops),
+        'total_cost': round(total_cost, 2),
+        'stages': {stage: summarize(timings) for stage, timings in results.items()},
+    }
+
+
+def compare(baseline_path, current):
+    """Print each stage's median against a baseline run"""
+    with open(baseline_path) as f:
+        baseline = {run['rows']: run for run in json.load(f)['runs']}
+    print(f"against {baseline_path}", file=sys.stderr)
+    for run in current['runs']:
+        old = baseline.get(run['rows'])
+        if old is None:
+            continue
+        for stage, timings in run['stages'].items():
+            if stage in old['stages']:
+                before, after = old['stages'][stage]['median_ms'], timings['median_ms']
+                print(f"{run['rows']:>8} {stage:<14} {before:10.3f} -> {after:10.3f} ms "
+                      f"({after / before if before else float('inf'):.2f}x)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--route', default=RECORDED_ROUTE, help='recorded ORS or /route/ response')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='write the JSON here instead of stdout')
+    parser.add_argument('--compare', help='JSON from an earlier run to compare against')
+    args = parser.parse_args()
+
+    import polyline
+
+    from api.testing import FakeORSServer, recorded_response
+
+    ors = recorded_response(args.route)
+    coordinates = polyline.decode(ors['routes'][0]['geometry'])
+    start, finish = coordinates[0], coordinates[-1]
+    query = {
+        'points': (start, finish),
+        'string': urlencode({'start_lat': start[0], 'start_lng': start[1],
+                             'end_lat': finish[0], 'end_lng': finish[1]}),
+    }
+
+    with FakeORSServer(response=ors) as server:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        setup_django()
+        import numpy as np
+        from django.core.wsgi import get_wsgi_application
+        from django.test import override_settings
+        from api import route_cache
+
+        route_cache._route_cache = route_cache.RouteCache(alias='default')
+        application = get_wsgi_application()
+        report = {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'route': {'file': os.path.relpath(args.route), 'points': len(coordinates),
+                      'miles': round(ors['routes'][0]['summary']['distance'] / 1609.34, 1)},
+            'repeat': args.repeat,
+            'runs': [],
+        }
+        # Sparse station sets leave no feasible plan, which logs a warning and a 500 per run
+        logging.disable(logging.ERROR)
+        with override_settings(ROUTE_PLANS_ENABLED=False, ROUTE_LANES_ENABLED=False, ROUTE_MAP_CACHE_ALIAS='default'), \
+                tempfile.TemporaryDirectory() as tmp:
+            for rows in args.rows:
+                print(f"{rows} stations...", file=sys.stderr)
+                report['runs'].append(run_stages(rows, ors['routes'][0], query, application, args.repeat, tmp))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == '__main__':
+    main()
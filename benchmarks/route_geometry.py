@@ -0,0 +1,57 @@
+"""Route representation: per-point dicts vs the array-backed RouteGeometry.
+
+"before" is the list of {'lat', 'lng', 'mile_position'} dicts built with a
+geopy great_circle call per segment, plus the list of lists handed to the
+KDTree. "after" is RouteGeometry.from_coordinates. Both start from decoded
+polyline output and must agree on the mileage.
+"""
+import argparse
+import gc
+import tracemalloc
+
+from scipy.spatial import KDTree
+
+from .common import legacy_route_points, report, setup_django, synthetic_route, time_call
+
+
+def peak_kib(func):
+    """Peak traced allocation of func() in KiB, and the result kept alive"""
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 1024, peak / 1024, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--points', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from api.geo import RouteGeometry
+
+    route = synthetic_route(points=args.points)
+    before = legacy_route_points(route)
+    after = RouteGeometry.from_coordinates(route)
+    assert abs(before[-1]['mile_position'] - after.total_miles) < 1e-6, "mileage differs"
+    print(f"{args.points} route points, {after.total_miles:.0f} miles")
+
+    def legacy():
+        points = legacy_route_points(route)
+        return points, KDTree([[p['lat'], p['lng']] for p in points])
+
+    def arrays():
+        geometry = RouteGeometry.from_coordinates(route)
+        return geometry, KDTree(geometry.coords)
+
+    for label, func in (("before: dicts + great_circle", legacy), ("after: RouteGeometry", arrays)):
+        retained, peak, _ = peak_kib(func)
+        report(label, time_call(func, repeat=args.repeat))
+        print(f"{'':<40} retained {retained:10.0f} KiB   peak {peak:10.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
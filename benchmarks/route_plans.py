@@ -0,0 +1,61 @@
+"""GET /route/ with and without stored fuel plans.
+
+Routes come from a warm route cache in every pass, so the timings isolate
+planning. "planned" computes the plan without storing it, "planned + stored"
+also inserts the Route row, and "stored plan" answers from that row. Runs
+against a throwaway migrated test database.
+"""
+import argparse
+import os
+from urllib.parse import urlencode
+
+from .common import lane_stations, report, setup_django, wsgi_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lanes', type=int, default=50)
+    args = parser.parse_args()
+
+    from api.testing import FakeORSServer
+
+    with FakeORSServer(points_per_leg=1000) as server:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        setup_django()
+        from django.core.wsgi import get_wsgi_application
+        from django.db import connection
+        from django.test import override_settings
+        from api import route_cache, stations
+        from api.models import Route
+
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            index = lane_stations()
+            index.version = 'benchmark'
+            stations.set_station_index(index)
+            route_cache._route_cache = route_cache.RouteCache(alias='default')
+            application = get_wsgi_application()
+            queries = [urlencode({'start_lat': 40.0, 'start_lng': -80.0, 'end_lat': 40.0,
+                                  'end_lng': round(-90.0 - i * 0.05, 4)}) for i in range(args.lanes)]
+
+            def run(label):
+                timings = []
+                for query in queries:
+                    ok, seconds, _ = wsgi_request(application, '/route/', query)
+                    assert ok, query
+                    timings.append(seconds * 1000)
+                report(label, timings)
+
+            with override_settings(ROUTE_PLANS_ENABLED=False):
+                run("warm route cache")
+                run("planned")
+            run("planned + stored")
+            run("stored plan")
+            print(f"{args.lanes} lanes, {Route.objects.count()} stored plans, "
+                  f"upstream calls {server.request_count}")
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
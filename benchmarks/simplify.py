@@ -0,0 +1,80 @@
+"""Douglas-Peucker route simplification: point count, latency and error.
+
+Runs on the recorded New York to Los Angeles ORS route in api/response.json
+and on a synthetic wiggly route. For each tolerance it reports the vertices
+kept, the simplification time, the largest distance from an original point
+to the simplified line, the time to project stations and render the map
+from the simplified geometry, and how far the projected stations move
+compared with the first tolerance.
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+import polyline
+
+from .common import report, setup_django, synthetic_route, time_call, write_station_csv
+
+RECORDED_ROUTE = os.path.join(os.path.dirname(__file__), '..', 'api', 'response.json')
+
+
+def recorded_route():
+    with open(RECORDED_ROUTE) as f:
+        return polyline.decode(json.load(f)['route']['steps'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=8152)
+    parser.add_argument('--tolerances', type=float, nargs='+', default=[0, 5, 20, 50, 200])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import override_settings
+    from api import stations
+    from api.geo import RouteGeometry
+    from api.simplify import max_error, simplify
+    from api.views import RouteView
+    from visualize_map import plot_route_on_map
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = stations.load_station_index(write_station_csv(os.path.join(tmp, 'stations.csv'), args.rows))
+    view = RouteView()
+    corridor = settings.ROUTE_CORRIDOR_MILES
+
+    for name, route in (('recorded NY-LA', recorded_route()), ('synthetic', synthetic_route())):
+        coords = np.array(route)
+        lats, lngs = coords[:, 0], coords[:, 1]
+        geometry = RouteGeometry.from_coordinates(route)
+        print(f"\n{name}: {len(route)} points, {geometry.total_miles:.0f} miles")
+
+        for tolerance in args.tolerances:
+            kept = simplify(lats, lngs, tolerance)
+            print(f"tolerance {tolerance:g} m: {kept.size} points "
+                  f"({kept.size / len(route):.1%}), max error {max_error(lats, lngs, kept):.1f} m")
+            report("  simplify", time_call(lambda: simplify(lats, lngs, tolerance), repeat=args.repeat))
+            with override_settings(ROUTE_SIMPLIFY_INDEX_METERS=tolerance,
+                                   ROUTE_SIMPLIFY_INDEX_MAX_SEGMENT_METERS=None):
+                report("  project stations",
+                       time_call(lambda: view._project_stations(geometry, index, corridor), repeat=args.repeat))
+                projection = view._project_stations(geometry, index, corridor)
+            if tolerance == args.tolerances[0]:
+                reference = dict(zip(projection['station_index'].tolist(), projection['mile_position']))
+            shift = max((abs(reference[s] - m) for s, m in zip(projection['station_index'].tolist(),
+                                                              projection['mile_position']) if s in reference),
+                        default=0.0)
+            print(f"{'':<40} {projection['station_index'].size} stations in corridor, "
+                  f"mile positions within {shift:.3f} of tolerance {args.tolerances[0]:g} m")
+            simplified = [(lat, lng, 0) for lat, lng in coords[kept].tolist()]
+            report("  render map", time_call(
+                lambda: plot_route_on_map(route[0], route[-1], [], simplified).get_root().render(),
+                repeat=args.repeat))
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""Fuel planner cost as the number of on-route candidate stations grows."""
+import argparse
+
+import numpy as np
+
+from api.solver import STRATEGIES
+
+from .common import report, time_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        miles = np.sort(rng.uniform(0, 2800, size))
+        prices = rng.uniform(2.8, 4.2, size)
+        for name, plan in STRATEGIES.items():
+            report(f"{name}: {size} stations",
+                   time_call(lambda: plan(miles, prices, 2800, 500, 10), repeat=args.repeat))
+
+
+if __name__ == '__main__':
+    main()
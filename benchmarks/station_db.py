@@ -0,0 +1,74 @@
+"""FuelStation table: bulk load, diff sync and route corridor queries.
+
+Runs against a throwaway migrated test database. The corridor query goes
+through the SQLite R*Tree and is compared with a plain (lat, lng) range
+filter on the same boxes, and with the in-memory StationIndex.
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+
+from .common import report, setup_django, synthetic_route, time_call, write_station_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=8152)
+    parser.add_argument('--corridor', type=float, default=10.0)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from unittest import mock
+
+    from django.db import connection
+
+    from api import spatial
+    from api.geo import RouteGeometry
+    from api.models import FuelStation
+    from api.stations import read_station_index
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = write_station_csv(os.path.join(tmp, 'stations.csv'), args.rows)
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+            memory = read_station_index(path)
+
+        def load():
+            FuelStation.objects.all().delete()
+            return FuelStation.objects.sync_rows(rows)
+
+        report(f"bulk load {args.rows} stations", time_call(load, repeat=3))
+        rng = random.Random(1)
+        changed = [{**row, 'Retail Price': round(rng.uniform(2.8, 4.2), 5)} if rng.random() < 0.1 else row
+                   for row in rows]
+        stats = FuelStation.objects.sync_rows(changed)
+        print(f"{'':<40} 10% price changes: {stats['updated']} updated, {stats['unchanged']} unchanged")
+        report("sync with no changes", time_call(lambda: FuelStation.objects.sync_rows(changed), repeat=3))
+
+        route = RouteGeometry.from_coordinates(synthetic_route())
+        boxes = spatial.route_boxes(route.lats, route.lngs, args.corridor)
+        print(f"{len(route)} route points, {len(boxes)} boxes, {args.corridor} mile corridor")
+
+        def database():
+            return FuelStation.objects.near_route(route, args.corridor).as_index()
+
+        def range_scan():
+            with mock.patch('api.spatial.has_rtree', return_value=False):
+                return database()
+
+        for label, func in (("R*Tree corridor query", database), ("lat/lng range scan", range_scan)):
+            report(label, time_call(func, repeat=args.repeat))
+            print(f"{'':<40} {len(func())} candidate stations")
+        report("in-memory KDTree corridor", time_call(
+            lambda: memory.near_routes([route.coords], args.corridor), repeat=args.repeat))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Per-request station loading cost before and after the shared index.
+
+"before" replays what RouteView.__init__ did on every request: parse the
+CSV with csv.DictReader and build a KDTree. "after" is the lookup a request
+now performs against the process-wide index.
+"""
+import argparse
+import csv
+import os
+import tempfile
+
+from scipy.spatial import KDTree
+
+from .common import report, setup_django, time_call, write_station_csv
+
+
+def legacy_load(path):
+    stations = []
+    coords = []
+    with open(path, 'r') as f:
+        for row in csv.DictReader(f):
+            try:
+                lat = float(row['Latitude'])
+                lng = float(row['Longitude'])
+                price = float(row['Retail Price'])
+            except (KeyError, ValueError):
+                continue
+            stations.append({'lat': lat, 'lng': lng, 'price': price})
+            coords.append([lat, lng])
+    return {'stations': stations, 'tree': KDTree(coords) if coords else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=8152)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from api import stations
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_station_csv(os.path.join(tmp, 'stations.csv'), args.rows)
+        print(f"{args.rows} stations")
+        report("before: CSV parse + KDTree per request",
+               time_call(lambda: legacy_load(path), repeat=args.repeat))
+        report("startup: load_station_index",
+               time_call(lambda: stations.load_station_index(path), repeat=args.repeat))
+        stations.set_station_index(stations.load_station_index(path))
+        report("after: get_station_index per request",
+               time_call(stations.get_station_index, repeat=args.repeat, number=1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Station loading: CSV parse vs the memory-mapped binary snapshot.
+
+Times a single load of each, then starts --workers processes that each load
+the index and reports how much private memory every worker gained (USS)
+and its proportional share of the pages it maps (PSS). Snapshot arrays
+live in the shared page cache, so PSS shrinks as workers are added. Memory
+figures come from /proc and need Linux.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+
+from .common import report, setup_django, time_call, write_station_csv
+
+
+def memory_kib():
+    """(private, proportional) memory of this process in KiB"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values['Private_Clean'] + values['Private_Dirty'], values['Pss']
+
+
+def worker(path, loaded, release, results):
+    from api.stations import read_stations
+
+    before, _ = memory_kib()
+    index = read_stations(path)
+    # Touch every page, as queries over the whole index eventually would
+    float(index.coords.sum() + index.prices.sum() + index.tree.indices.sum())
+    loaded.wait()
+    private, pss = memory_kib()
+    results.put((private - before, pss))
+    release.wait()
+    return index
+
+
+def measure(path, workers):
+    context = multiprocessing.get_context('spawn')
+    loaded, release = context.Barrier(workers + 1), context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(path, loaded, release, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    loaded.wait()
+    # Every worker holds its index while the others measure
+    samples = [results.get() for _ in processes]
+    release.wait()
+    for process in processes:
+        process.join()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from api.stations import read_station_index, read_station_snapshot, write_station_snapshot
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = write_station_csv(os.path.join(tmp, 'stations.csv'), args.rows)
+        snapshot = os.path.join(tmp, 'snapshot')
+        write_station_snapshot(read_station_index(csv_path), snapshot, source=csv_path)
+        print(f"{args.rows} stations: CSV {os.path.getsize(csv_path) / 1024:.0f} KiB")
+
+        report("CSV parse + KDTree build", time_call(lambda: read_station_index(csv_path), repeat=args.repeat))
+        report("snapshot mmap + tree load", time_call(lambda: read_station_snapshot(snapshot),
+                                                          repeat=args.repeat))
+
+        for label, path in (("CSV", csv_path), ("snapshot", snapshot)):
+            samples = measure(path, args.workers)
+            uss = sum(private for private, _ in samples) / len(samples)
+            pss = sum(share for _, share in samples) / len(samples)
+            print(f"{label:<10} {args.workers} workers: index adds {uss:8.0f} KiB private per worker, "
+                  f"PSS {pss:8.0f} KiB per worker")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""What-if sweep over vehicle parameters on one route.
+
+Plans the recorded New York to Los Angeles route for every combination of
+range, MPG and starting fuel. "cold" projects the stations onto the route
+for every plan, as before the projection cache; "cached" reuses the
+projection so each extra plan only runs the solver.
+"""
+import argparse
+import itertools
+import logging
+import os
+import tempfile
+
+from .common import report, setup_django, time_call, write_station_csv
+from .simplify import recorded_route
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=8152)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from unittest import mock
+
+    from api import stations
+    from api.geo import RouteGeometry
+    from api.route_cache import ProjectionCache
+    from api.views import RouteView
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = stations.read_station_index(write_station_csv(os.path.join(tmp, 'stations.csv'), args.rows))
+    route = RouteGeometry.from_coordinates(recorded_route())
+    view = RouteView()
+    vehicles = [view._parse_vehicle({'range_miles': r, 'mpg': m, 'start_fuel': f})
+                for r, m, f in itertools.product(['500', '700', '900'], ['6', '8', '10'], ['', '10'])]
+    # Infeasible combinations log a warning per plan
+    logging.disable(logging.WARNING)
+    print(f"{len(route)} route points, {args.rows} stations, {len(vehicles)} vehicle configurations")
+
+    def sweep(cache_factory):
+        with mock.patch('api.views.get_projection_cache', side_effect=cache_factory):
+            return [view._calculate_fuel_stops(route, route.total_miles, 'optimal', index, vehicle)
+                    for vehicle in vehicles]
+
+    shared = ProjectionCache()
+    cold = time_call(lambda: sweep(ProjectionCache), repeat=args.repeat)
+    cached = time_call(lambda: sweep(lambda: shared), repeat=args.repeat)
+    assert sweep(ProjectionCache) == sweep(lambda: shared), "cached plans differ"
+    feasible = sum(stops is not None for stops, _ in sweep(lambda: shared))
+    print(f"{'':<40} {feasible} feasible plans")
+    report("cold: project for every plan", cold)
+    report("cached projection", cached)
+    print(f"{'':<40} per plan {min(cached) / len(vehicles):.3f} ms vs {min(cold) / len(vehicles):.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
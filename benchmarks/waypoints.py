@@ -0,0 +1,73 @@
+"""Multi-stop trip: one /route/ call per leg vs one call with waypoints.
+
+The app runs in-process against a local fake OpenRouteService with a fixed
+upstream latency and a fresh route cache for each trip. Per-leg calls plan
+every leg as if it started on a full tank; the waypoint call plans fuel
+once over the whole trip.
+"""
+import argparse
+import json
+import os
+import time
+from urllib.parse import urlencode
+
+from .common import lane_stations, setup_django, wsgi_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stops', type=int, default=4, help="drops between start and end")
+    parser.add_argument('--latency', type=float, default=0.15, help="upstream latency in seconds")
+    parser.add_argument('--trips', type=int, default=10)
+    args = parser.parse_args()
+
+    from api.testing import FakeORSServer
+
+    with FakeORSServer(latency=args.latency, points_per_leg=1000) as server:
+        os.environ['ORS_DIRECTIONS_URL'] = server.url
+        os.environ['ROUTE_LANES_ENABLED'] = 'false'
+        setup_django()
+        from django.core.cache import caches
+        from django.core.wsgi import get_wsgi_application
+        from api import route_cache, stations
+
+        stations.set_station_index(lane_stations())
+        application = get_wsgi_application()
+
+        def trip_points(trip):
+            step = (20.0 - trip * 0.1) / (args.stops + 1)
+            return [(40.0, round(-80.0 - i * step, 4)) for i in range(args.stops + 2)]
+
+        def fresh_cache():
+            caches['default'].clear()
+            route_cache._route_cache = route_cache.RouteCache(alias='default')
+
+        def per_leg(points):
+            ok = True
+            for (lat1, lng1), (lat2, lng2) in zip(points, points[1:]):
+                ok &= wsgi_request(application, '/route/', urlencode(
+                    {'start_lat': lat1, 'start_lng': lng1, 'end_lat': lat2, 'end_lng': lng2}))[0]
+            return ok
+
+        def waypoints(points):
+            (start_lat, start_lng), *middle, (end_lat, end_lng) = points
+            ok, _, content = wsgi_request(application, '/route/', urlencode({
+                'start_lat': start_lat, 'start_lng': start_lng, 'end_lat': end_lat, 'end_lng': end_lng,
+                'waypoints': '|'.join(f"{lat},{lng}" for lat, lng in middle)}))
+            return ok and len(json.loads(content)['legs']) == len(points) - 1
+
+        print(f"{args.trips} trips with {args.stops} drops, upstream latency {args.latency * 1000:.0f} ms")
+        for label, plan in (("one call per leg", per_leg), ("one call with waypoints", waypoints)):
+            upstream = server.request_count
+            timings = []
+            for trip in range(args.trips):
+                fresh_cache()
+                start = time.perf_counter()
+                assert plan(trip_points(trip)), label
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{label:<28} {sum(timings) / len(timings):8.1f} ms per trip   "
+                  f"upstream calls {(server.request_count - upstream) / args.trips:.0f} per trip")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,209 @@
+"""Clean and deduplicate an OPIS price file in bounded memory.
+
+The file is read in chunks with explicit dtypes, so memory depends on the
+chunk size and the number of distinct stations, not on the number of rows.
+Rows that fail validation go to a rejects file with the reason. Of the
+remaining rows one is kept per OPIS Truckstop ID, by the chosen policy:
+
+  first   the first row in the file
+  latest  the last row in the file; price files are appended in time order
+  min     the lowest price, the first such row on ties
+
+The output keeps the columns the API reads, in its order, and can be passed
+to `manage.py ingest_prices`; a geocoded input stays loadable as
+FUEL_STATIONS_CSV.
+"""
+import argparse
+import csv
+import os
+import tempfile
+
+import numpy as np
 import pandas as pd
 
-def deduplicate_truckstops(input_file, output_file):
+ID_COLUMN = 'OPIS Truckstop ID'
+PRICE_COLUMN = 'Retail Price'
+PRICE_COLUMNS = ['OPIS Truckstop ID', 'Truckstop Name', 'Address', 'City', 'State', 'Rack ID', 'Retail Price']
+GEOCODING_COLUMNS = ['Latitude', 'Longitude', 'Geocoding_Timestamp', 'Geocoding_Status']
+REQUIRED_TEXT = ['Truckstop Name', 'Address', 'City', 'State']
+REJECT_COLUMN = 'Reject_Reason'
+
+# Parsed types of the output columns; everything is read as text and converted
+DTYPES = {
+    'OPIS Truckstop ID': 'int64',
+    'Rack ID': 'Int64',
+    'Retail Price': 'float64',
+    'Latitude': 'float64',
+    'Longitude': 'float64',
+}
+
+POLICIES = ('first', 'latest', 'min')
+CHUNK_ROWS = 100_000
+MIN_PRICE = 1.0  # dollars per gallon
+MAX_PRICE = 15.0
+
+
+def _numbers(column):
+    """float64 values of a text column, NaN where a value is not a number"""
+    values = column.to_numpy()
+    try:
+        numbers = values.astype(np.float64)
+    except ValueError:
+        numbers = np.fromiter(map(_number, values), dtype=np.float64, count=len(values))
+    return pd.Series(numbers, index=column.index)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def clean_chunk(chunk, min_price=MIN_PRICE, max_price=MAX_PRICE):
+    """(parsed rows, reasons) for a chunk of text rows; rows with a reason are rejected
+
+    `reasons` holds '; '-joined validation failures, empty for valid rows.
     """
-    Remove duplicate entries from truckstop data based on OPIS Truckstop ID.
-    Keeps the first occurrence of each ID.
-    
-    Args:
-        input_file (str): Path to input CSV file
-        output_file (str): Path to output CSV file
+    def empty(column):
+        return chunk[column].to_numpy() == ''
+
+    def integers(column):
+        values = _numbers(chunk[column])
+        return values.where(values % 1 == 0)
+
+    opis_id = integers(ID_COLUMN)
+    price = _numbers(chunk[PRICE_COLUMN])
+    rack_id = integers('Rack ID')
+    state_length = np.fromiter(map(len, chunk['State'].to_numpy()), dtype=np.intp, count=len(chunk))
+    checks = [
+        (~(opis_id > 0).to_numpy(), f"invalid {ID_COLUMN}"),
+        (price.isna().to_numpy(), f"invalid {PRICE_COLUMN}"),
+        (((price < min_price) | (price > max_price)).to_numpy(), f"{PRICE_COLUMN} out of range"),
+        *((empty(column), f"missing {column}") for column in REQUIRED_TEXT),
+        ((state_length != 0) & (state_length != 2), 'invalid State'),
+        (~empty('Rack ID') & ~(rack_id >= 0).to_numpy(), 'invalid Rack ID'),
+    ]
+
+    parsed = pd.DataFrame(index=chunk.index)
+    if 'Latitude' in chunk and 'Longitude' in chunk:
+        lat, lng = _numbers(chunk['Latitude']), _numbers(chunk['Longitude'])
+        # Not geocoded yet is fine; half a coordinate or one off the map is not
+        located = ~(empty('Latitude') & empty('Longitude'))
+        checks.append((located & ~(lat.between(-90, 90) & lng.between(-180, 180)).to_numpy(),
+                       'invalid Latitude/Longitude'))
+        parsed['Latitude'] = lat.astype(DTYPES['Latitude'])
+        parsed['Longitude'] = lng.astype(DTYPES['Longitude'])
+
+    invalid = np.logical_or.reduce([mask for mask, _ in checks])
+    reasons = pd.Series('', index=chunk.index, dtype=object)
+    if invalid.any():
+        rows = np.flatnonzero(invalid)
+        reasons.iloc[rows] = ['; '.join(reason for mask, reason in checks if mask[row]) for row in rows]
+
+    parsed[ID_COLUMN] = opis_id.where(~invalid, 0).astype(DTYPES[ID_COLUMN])
+    parsed['Rack ID'] = rack_id.astype(DTYPES['Rack ID'])
+    parsed[PRICE_COLUMN] = price.astype(DTYPES[PRICE_COLUMN])
+    for column in chunk.columns:
+        if column not in parsed:
+            parsed[column] = chunk[column]
+    return parsed, reasons
+
+
+def _keep(kept, rows, policy):
+    """Rows of `kept` plus `rows` reduced to one per OPIS ID by `policy`
+
+    `_pos` is a row's position in the file; `_first`, `_low` and `_high`
+    carry each ID's first position and price range across chunks.
+    """
+    combined = pd.concat([kept, rows], ignore_index=True)
+    groups = combined.groupby(ID_COLUMN, sort=False)
+    combined['_first'] = groups['_first'].transform('min')
+    combined['_low'] = groups['_low'].transform('min')
+    combined['_high'] = groups['_high'].transform('max')
+    if policy == 'min':
+        combined = combined.sort_values([PRICE_COLUMN, '_pos'], kind='mergesort')
+    return combined.drop_duplicates(ID_COLUMN, keep='last' if policy == 'latest' else 'first')
+
+
+def deduplicate_truckstops(input_file, output_file, policy='first', rejects_file=None,
+                           chunk_rows=CHUNK_ROWS, min_price=MIN_PRICE, max_price=MAX_PRICE):
+    """Write one valid row per OPIS Truckstop ID of `input_file` to `output_file`
+
+    Invalid rows go to `rejects_file`, if given, as read plus a
+    Reject_Reason column. The output is replaced atomically and lists the
+    stations in the order they first appear. Returns counts of the rows
+    read, rejected, dropped as duplicates and written, and of the stations
+    whose duplicate rows disagree on price.
     """
-    # Read the CSV file
-    df = pd.read_csv(input_file)
-    
-    # Remove duplicates based on 'OPIS Truckstop ID', keeping first occurrence
-    df_deduplicated = df.drop_duplicates(subset=['OPIS Truckstop ID'], keep='first')
-    
-    # Save the deduplicated data to a new CSV file
-    df_deduplicated.to_csv(output_file, index=False)
-    
-    # Print statistics
-    total_rows = len(df)
-    unique_rows = len(df_deduplicated)
-    duplicates_removed = total_rows - unique_rows
-    
-    print(f"Original rows: {total_rows}")
-    print(f"Rows after deduplication: {unique_rows}")
-    print(f"Duplicates removed: {duplicates_removed}")
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown policy {policy!r}, expected one of: {', '.join(POLICIES)}")
+    header = pd.read_csv(input_file, nrows=0).columns.str.strip()
+    missing = [column for column in PRICE_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"{input_file} is missing columns: {', '.join(missing)}")
+    columns = PRICE_COLUMNS + [column for column in GEOCODING_COLUMNS if column in header]
+
+    stats = {'rows': 0, 'rejected': 0, 'duplicates': 0, 'written': 0, 'conflicting_prices': 0}
+    kept = None
+    rejects = None
+    try:
+        if rejects_file:
+            rejects = open(rejects_file, 'w', newline='')
+            rejects_writer = csv.writer(rejects)
+            rejects_writer.writerow(list(header) + [REJECT_COLUMN])
+        reader = pd.read_csv(input_file, dtype=str, keep_default_na=False, skipinitialspace=True,
+                             chunksize=chunk_rows, names=list(header), header=0)
+        for chunk in reader:
+            chunk = chunk.fillna('')
+            parsed, reasons = clean_chunk(chunk, min_price, max_price)
+            valid = (reasons == '').to_numpy()
+            stats['rows'] += len(chunk)
+            stats['rejected'] += int((~valid).sum())
+            if rejects is not None and not valid.all():
+                rejects_writer.writerows(chunk.assign(**{REJECT_COLUMN: reasons})[~valid].itertuples(index=False))
+
+            rows = parsed.loc[valid, columns].reset_index(drop=True)
+            rows['_pos'] = rows['_first'] = np.flatnonzero(valid) + stats['rows'] - len(chunk)
+            rows['_low'] = rows['_high'] = rows[PRICE_COLUMN]
+            kept = _keep(rows.iloc[:0] if kept is None else kept, rows, policy)
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+    if kept is None:
+        kept = pd.DataFrame(columns=columns + ['_first', '_low', '_high'])
+    kept = kept.sort_values('_first', kind='mergesort')
+    stats['written'] = len(kept)
+    stats['duplicates'] = stats['rows'] - stats['rejected'] - stats['written']
+    stats['conflicting_prices'] = int((kept['_low'] != kept['_high']).sum())
+
+    directory = os.path.dirname(os.path.abspath(output_file))
+    with tempfile.NamedTemporaryFile('w', newline='', dir=directory, suffix='.tmp', delete=False) as f:
+        kept[columns].to_csv(f, index=False)
+    os.replace(f.name, output_file)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', default='fuel_prices.csv')
+    parser.add_argument('output', nargs='?', default='fuel_prices_deduplicated.csv')
+    parser.add_argument('--policy', choices=POLICIES, default='first')
+    parser.add_argument('--rejects', help="write rejected rows with the reason here")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--min-price', type=float, default=MIN_PRICE)
+    parser.add_argument('--max-price', type=float, default=MAX_PRICE)
+    args = parser.parse_args()
+
+    stats = deduplicate_truckstops(args.input, args.output, args.policy, args.rejects,
+                                   args.chunk_rows, args.min_price, args.max_price)
+    print(f"Original rows: {stats['rows']}")
+    print(f"Rejected rows: {stats['rejected']}" + (f" (see {args.rejects})" if args.rejects else ''))
+    print(f"Rows after deduplication: {stats['written']}")
+    print(f"Duplicates removed: {stats['duplicates']}, "
+          f"{stats['conflicting_prices']} stations with differing prices ({args.policy} kept)")
+
 
 if __name__ == "__main__":
-    input_file = "fuel_prices.csv"  
-    output_file = "fuel_prices_deduplicated.csv"  
-    
-    deduplicate_truckstops(input_file, output_file)
\ No newline at end of file
+    main()
@@ -1,78 +1,36 @@
-import pandas as pd
-import requests
-import time
-from urllib.parse import quote
+from geocoding.cache import get_default_cache
+from geocoding.pipeline import geocode_address, geocode_csv, print_summary
+from geocoding.providers import GeocodingError, PhotonProvider
+
+provider = PhotonProvider()
+
 
 def geocode_address_photon(address, city, state):
     """
     Geocode an address using Photon
     """
-    # Combine address components
     full_address = f"{address}, {city}, {state}, USA"
-    
-    # URL encode the address
-    encoded_address = quote(full_address)
-    
-    # Create the URL (Photon's endpoint)
-    url = f"http://photon.komoot.io/api/?q={encoded_address}&limit=1"
-    
     try:
-        # Add a small delay to be nice to the API
-        time.sleep(0.5)
-        
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if data.get('features') and len(data['features']) > 0:
-            # Get coordinates from the first result
-            coordinates = data['features'][0]['geometry']['coordinates']
-            # Photon returns [lon, lat], but we want [lat, lon]
-            return (coordinates[1], coordinates[0])
-        else:
-            print(f"No results found for address: {full_address}")
-            return None
-            
-    except requests.exceptions.RequestException as e:
+        result = geocode_address(provider, full_address, get_default_cache())
+    except GeocodingError as e:
         print(f"Error geocoding address: {full_address}")
         print(f"Error details: {e}")
         return None
+    if result is None:
+        print(f"No results found for address: {full_address}")
+    return result
 
-def process_csv(input_file, output_file):
+
+def process_csv(input_file, output_file, workers=4):
     """
-    Process CSV file and add geocoding results
+    Process CSV file and add geocoding results, resuming an interrupted run
     """
-    # Read the CSV file
-    df = pd.read_csv(input_file)
-    
-    # Add new columns for coordinates
-    df['Latitude'] = None
-    df['Longitude'] = None
-    
-    # Process each row
-    for index, row in df.iterrows():
-        print(f"Processing: {row['Truckstop Name']}")
-        
-        result = geocode_address_photon(row['Address'], row['City'], row['State'])
-        
-        if result:
-            df.at[index, 'Latitude'] = result[0]
-            df.at[index, 'Longitude'] = result[1]
-    
-    # Save results to new CSV
-    df.to_csv(output_file, index=False)
-    
-    # Print summary
-    total_rows = len(df)
-    geocoded_rows = df['Latitude'].notna().sum()
-    print(f"\nGeocoding Summary:")
-    print(f"Total rows processed: {total_rows}")
-    print(f"Successfully geocoded: {geocoded_rows}")
-    print(f"Failed to geocode: {total_rows - geocoded_rows}")
+    stats = geocode_csv(input_file, output_file, provider, workers=workers, cache=get_default_cache(),
+                        progress=lambda done, total, entry: print(f"Processing: {entry['query']}"))
+    print_summary(stats)
 
 if __name__ == "__main__":
     input_file = "fuel_prices.csv"  
     output_file = "fuel_prices_geocoded.csv" 
     
-    process_csv(input_file, output_file)
\ No newline at end of file
+    process_csv(input_file, output_file)
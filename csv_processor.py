@@ -1,38 +1,28 @@
-import pandas as pd
-from geopy.geocoders import OpenCage
-import time
+import os
 
-# Replace with your OpenCage API key
-api_key = '6971f7b651ba45049b778d1bc54ce5c7'
-geolocator = OpenCage(api_key)
+from geocoding.cache import get_default_cache
+from geocoding.pipeline import geocode_address as cached_geocode, geocode_csv, print_summary
+from geocoding.providers import GeocodingError, OpenCageProvider
 
-# Read the CSV file
-fuel_prices = pd.read_csv('fuel_prices.csv')
+# Replace with your OpenCage API key
+api_key = os.getenv('OPENCAGE_API_KEY', '6971f7b651ba45049b778d1bc54ce5c7')
+provider = OpenCageProvider(api_key=api_key)
 
 # Function to geocode an address
 def geocode_address(address):
     try:
-        location = geolocator.geocode(address)
+        location = cached_geocode(provider, address, get_default_cache())
         if location:
-            return location.latitude, location.longitude
+            return location
         else:
             return None, None
-    except Exception as e:
+    except GeocodingError as e:
         print(f"Error geocoding {address}: {e}")
         return None, None
 
-# Create new columns for latitude and longitude
-fuel_prices['Latitude'] = None
-fuel_prices['Longitude'] = None
-
-# Geocode each address and update the DataFrame
-for index, row in fuel_prices.iterrows():
-    address = f"{row['Address']}, {row['City']}, {row['State']}"
-    lat, lng = geocode_address(address)
-
-    fuel_prices.at[index, 'Latitude'] = lat
-    fuel_prices.at[index, 'Longitude'] = lng
-    time.sleep(1)  # To avoid hitting the API rate limit
 
-# Write the updated DataFrame to a new CSV file
-fuel_prices.to_csv('fuel_prices_with_lat_lng.csv', index=False)
\ No newline at end of file
+if __name__ == "__main__":
+    # Geocode every row at OpenCage's rate limit, resuming an interrupted run
+    stats = geocode_csv('fuel_prices.csv', 'fuel_prices_with_lat_lng.csv', provider, workers=2,
+                        cache=get_default_cache())
+    print_summary(stats)
@@ -2,6 +2,10 @@
 import os
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+load_dotenv()
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'your-secret-key'
@@ -19,6 +23,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -78,6 +83,97 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Geocoded fuel station data loaded into the shared station index at startup
+FUEL_STATIONS_CSV = BASE_DIR / 'fuelprices_HERE_geocoded.csv'
+# Binary snapshot of the station file (build_station_snapshot). When set and
+# built, workers memory-map it instead of parsing the CSV
+FUEL_STATIONS_SNAPSHOT = os.getenv('FUEL_STATIONS_SNAPSHOT') or None
+# Seconds between checks for a changed station file or snapshot, which is then reloaded
+# in the background (0 disables)
+STATION_RELOAD_INTERVAL = float(os.getenv('STATION_RELOAD_INTERVAL', 30))
+# Where routes look up stations: 'csv' for the in-memory index above, or
+# 'database' to query the FuelStation table (filled by load_stations)
+STATION_BACKEND = os.getenv('STATION_BACKEND', 'csv')
+
+# OpenRouteService directions endpoint used for route geometry
+ORS_DIRECTIONS_URL = os.getenv('ORS_DIRECTIONS_URL', 'https://api.openrouteservice.org/v2/directions/driving-car')
+ORS_API_KEY = os.getenv('ORS_API_KEY')
+
+# Routing client: keep-alive pool, timeouts (seconds), retries with jittered
+# backoff, and a circuit breaker that fails fast while ORS is down
+ORS_POOL_SIZE = int(os.getenv('ORS_POOL_SIZE', 20))
+ORS_CONNECT_TIMEOUT = float(os.getenv('ORS_CONNECT_TIMEOUT', 3.05))
+ORS_READ_TIMEOUT = float(os.getenv('ORS_READ_TIMEOUT', 20))
+ORS_MAX_RETRIES = int(os.getenv('ORS_MAX_RETRIES', 2))
+ORS_BACKOFF_SECONDS = float(os.getenv('ORS_BACKOFF_SECONDS', 0.25))
+ORS_BREAKER_FAILURES = int(os.getenv('ORS_BREAKER_FAILURES', 5))
+ORS_BREAKER_RESET_SECONDS = float(os.getenv('ORS_BREAKER_RESET_SECONDS', 30))
+
+# Route geometry cache: per-process LRU in front of the 'routes' cache below.
+# Create the table with `python manage.py createcachetable`.
+ROUTE_CACHE_ALIAS = 'routes'
+ROUTE_CACHE_TTL = int(os.getenv('ROUTE_CACHE_TTL', 24 * 60 * 60))  # seconds
+ROUTE_CACHE_MEMORY_ENTRIES = int(os.getenv('ROUTE_CACHE_MEMORY_ENTRIES', 512))
+ROUTE_CACHE_PRECISION = 4  # decimal places of the coordinates in the cache key, ~11 m
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'routes': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'route_cache',
+        'TIMEOUT': ROUTE_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('ROUTE_CACHE_MAX_ENTRIES', 50000)),
+        },
+    },
+}
+
+# Threads used by the async route view for planning and map rendering
+ROUTE_CPU_WORKERS = int(os.getenv('ROUTE_CPU_WORKERS', os.cpu_count() or 4))
+
+# Route maps requested with ?include_map=true, stored and rendered on first fetch
+ROUTE_MAP_CACHE_ALIAS = 'routes'
+ROUTE_MAP_TTL = int(os.getenv('ROUTE_MAP_TTL', 24 * 60 * 60))  # seconds
+
+# Store computed fuel plans on the Route model and serve repeat trips from
+# them; plans are keyed on the station data version so price updates
+# invalidate them
+ROUTE_PLANS_ENABLED = os.getenv('ROUTE_PLANS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Serve lanes stored by the precompute_lanes command without routing or
+# projecting; they are projected again when station locations change
+ROUTE_LANES_ENABLED = os.getenv('ROUTE_LANES_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Concurrent identical /route/ requests share one computation; duplicates
+# wait for the first one instead of calling ORS and planning again
+ROUTE_SINGLE_FLIGHT = os.getenv('ROUTE_SINGLE_FLIGHT', 'true').lower() in ('1', 'true', 'yes')
+
+# POST /route/batch/: maximum trips per request and concurrent upstream routing calls
+ROUTE_BATCH_MAX_TRIPS = int(os.getenv('ROUTE_BATCH_MAX_TRIPS', 1000))
+ROUTE_BATCH_CONCURRENCY = int(os.getenv('ROUTE_BATCH_CONCURRENCY', 16))
+
+# Intermediate stops per trip (`waypoints`); ORS takes at most 50 coordinates
+ROUTE_MAX_WAYPOINTS = int(os.getenv('ROUTE_MAX_WAYPOINTS', 48))
+
+# Stations further than this from the route are never considered for a stop
+ROUTE_CORRIDOR_MILES = float(os.getenv('ROUTE_CORRIDOR_MILES', 5))
+
+# Douglas-Peucker tolerances (meters) for route polylines, 0 disables. The map
+# copy is cheap to simplify and much faster to render. Stations are projected
+# onto the segments of the copy used for projection, so simplifying it keeps
+# them within the tolerance of where they would be; it pays off when routes
+# are very dense. The optional maximum segment length splits long straight
+# segments.
+ROUTE_SIMPLIFY_INDEX_METERS = float(os.getenv('ROUTE_SIMPLIFY_INDEX_METERS', 0))
+ROUTE_SIMPLIFY_INDEX_MAX_SEGMENT_METERS = float(os.getenv('ROUTE_SIMPLIFY_INDEX_MAX_SEGMENT_METERS', 0))
+ROUTE_SIMPLIFY_MAP_METERS = float(os.getenv('ROUTE_SIMPLIFY_MAP_METERS', 50))
+
+# Per-stage timings in Server-Timing headers and Prometheus metrics at
+# /metrics; when off, requests skip all timing and /metrics is a 404
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -1,6 +1,10 @@
 from django.urls import path
-from api.views import RouteView
+from api.views import AsyncRouteView, MetricsView, RouteBatchView, RouteMapView, RouteView
 
 urlpatterns = [
     path('route/', RouteView.as_view(), name='route'),
+    path('route/async/', AsyncRouteView.as_view(), name='route-async'),
+    path('route/batch/', RouteBatchView.as_view(), name='route-batch'),
+    path('route/<str:map_id>/map/', RouteMapView.as_view(), name='route-map'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
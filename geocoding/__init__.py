@@ -0,0 +1,6 @@
+"""Concurrent, rate-limited and resumable geocoding of the fuel price CSVs.
+
+Run it with `python -m geocoding <input.csv> <output.csv> --provider here`.
+"""
+from .pipeline import geocode_csv
+from .providers import PROVIDERS, GeocodingError, HereProvider, OpenCageProvider, PhotonProvider
@@ -0,0 +1,45 @@
+import argparse
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from .cache import DEFAULT_CACHE_PATH, GeocodeCache
+from .pipeline import geocode_csv, print_summary
+from .providers import PROVIDERS
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog='python -m geocoding',
+                                     description="Add Latitude/Longitude columns to a fuel price CSV")
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--provider', choices=sorted(PROVIDERS), default='here')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, help="requests per second, defaults to the provider's limit")
+    parser.add_argument('--checkpoint', help="defaults to <output>.checkpoint.jsonl")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="SQLite address cache shared by all runs")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--seed', action='append', default=[], metavar='CSV',
+                        help="load coordinates from an already geocoded CSV into the cache first")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else GeocodeCache(args.cache)
+    for path in args.seed:
+        if cache is not None:
+            print(f"Seeded {cache.seed_from_csv(path, f'file:{path}')} addresses from {path}")
+
+    provider = PROVIDERS[args.provider](rate=args.rate, pool_size=args.workers)
+    failed_path = f"failed_geocoding_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+
+    def progress(done, total, entry):
+        print(f"Processing {done}/{total}: {entry['query']} {entry['status']}")
+
+    stats = geocode_csv(args.input, args.output, provider, workers=args.workers,
+                        checkpoint_path=args.checkpoint, failed_path=failed_path, progress=progress,
+                        cache=cache)
+    print_summary(stats, failed_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import csv
+import re
+import sqlite3
+from datetime import datetime
+
+DEFAULT_CACHE_PATH = 'geocode_cache.sqlite3'
+
+
+def normalize_address(query):
+    """Cache key for a free-text address: upper case with punctuation spacing collapsed"""
+    query = re.sub(r'\s*([,&/])\s*', r'\1 ', query.upper())
+    return re.sub(r'\s+', ' ', query).strip(' ,')
+
+
+class GeocodeCache:
+    """Persistent normalized address -> (lat, lng, provider, timestamp) store in SQLite
+
+    Only successful lookups are stored, so an address one provider could not
+    find is still tried again, possibly with another provider. The connection
+    belongs to the thread that created the cache.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS geocodes ('
+            ' address TEXT PRIMARY KEY, lat REAL NOT NULL, lng REAL NOT NULL,'
+            ' provider TEXT NOT NULL, geocoded_at TEXT NOT NULL)'
+        )
+        self.connection.commit()
+
+    def get_many(self, addresses):
+        """Cached entries for the given normalized addresses, as {address: (lat, lng, provider, timestamp)}"""
+        found = {}
+        addresses = list(addresses)
+        # Stay under SQLite's bound parameter limit
+        for start in range(0, len(addresses), 500):
+            chunk = addresses[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT address, lat, lng, provider, geocoded_at FROM geocodes"
+                f" WHERE address IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((row[0], row[1:]) for row in rows)
+        return found
+
+    def put(self, address, lat, lng, provider, geocoded_at=None):
+        self.put_many([(address, lat, lng, provider, geocoded_at or datetime.now().isoformat())])
+
+    def put_many(self, entries):
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?)', entries)
+
+    def seed_from_csv(self, path, provider):
+        """Load coordinates from a previously geocoded CSV, returning how many were added"""
+        entries = []
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                if row.get('Geocoding_Status', 'SUCCESS') != 'SUCCESS':
+                    continue
+                try:
+                    lat, lng = float(row['Latitude']), float(row['Longitude'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                address = normalize_address(f"{row['Address']}, {row['City']}, {row['State']}, USA")
+                entries.append((address, lat, lng, provider,
+                                row.get('Geocoding_Timestamp') or datetime.now().isoformat()))
+        before = len(self)
+        with self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO geocodes VALUES (?, ?, ?, ?, ?)', entries)
+        return len(self) - before
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM geocodes').fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Return the GeocodeCache at DEFAULT_CACHE_PATH, opened on first use rather than at import"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = GeocodeCache()
+    return _default_cache
@@ -0,0 +1,179 @@
+import csv
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from .cache import normalize_address
+from .providers import GeocodingError
+
+logger = logging.getLogger(__name__)
+
+GEOCODING_COLUMNS = ['Latitude', 'Longitude', 'Geocoding_Timestamp', 'Geocoding_Status']
+
+SUCCESS = 'SUCCESS'
+FAILED = 'FAILED'  # the provider has no match for the address
+ERROR = 'ERROR'  # the provider kept failing; retried on the next run
+
+
+def address_query(row):
+    return f"{row['Address']}, {row['City']}, {row['State']}, USA"
+
+
+def load_checkpoint(path):
+    """Results recorded by earlier runs, keyed by input row number"""
+    results = {}
+    if not path or not os.path.exists(path):
+        return results
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A run killed mid-write leaves a partial last line
+                continue
+            results[entry['row']] = entry
+    return results
+
+
+def _geocode(provider, query):
+    """(lat, lng, status) for one address query"""
+    try:
+        location = provider.geocode(query)
+    except GeocodingError as e:
+        logger.error(f"Geocoding failed for {query}: {e}")
+        return None, None, ERROR
+    if location is None:
+        return None, None, FAILED
+    return location[0], location[1], SUCCESS
+
+
+def geocode_address(provider, query, cache=None):
+    """(lat, lng) for one address from the cache or the provider, None if not found
+
+    Raises GeocodingError when the provider keeps failing.
+    """
+    address = normalize_address(query)
+    if cache is not None:
+        cached = cache.get_many([address]).get(address)
+        if cached:
+            return cached[0], cached[1]
+    location = provider.geocode(query)
+    if location is not None and cache is not None:
+        cache.put(address, location[0], location[1], provider.name)
+    return location
+
+
+def geocode_csv(input_path, output_path, provider, workers=8, checkpoint_path=None,
+                failed_path=None, progress=None, cache=None):
+    """Geocode every row of a fuel price CSV into `output_path`
+
+    Rows sharing an address are looked up once, first in `cache` (a
+    GeocodeCache) and then from the provider, on `workers` threads sharing
+    its rate limit. Each finished row is appended to `checkpoint_path`
+    straight away, so a rerun after a crash only geocodes what is missing.
+    Rows that errored are not checkpointed and get another try next run.
+    The checkpoint is removed once every row has a final answer.
+    """
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint.jsonl"
+    with open(input_path, newline='') as f:
+        reader = csv.DictReader(f)
+        fieldnames = list(reader.fieldnames)
+        rows = list(reader)
+
+    results = {}
+    for row_number, entry in load_checkpoint(checkpoint_path).items():
+        # Ignore entries from a different input file
+        if row_number < len(rows) and entry['query'] == address_query(rows[row_number]):
+            results[row_number] = entry
+
+    addresses = {}
+    for row_number in range(len(rows)):
+        if row_number not in results:
+            addresses.setdefault(normalize_address(address_query(rows[row_number])), []).append(row_number)
+    cached = cache.get_many(addresses) if cache is not None else {}
+    missing = [address for address in addresses if address not in cached]
+    stats = {
+        'rows': len(rows), 'resumed': len(results),
+        'addresses': len(addresses), 'cache_hits': len(cached), 'cache_misses': len(missing),
+        SUCCESS: 0, FAILED: 0, ERROR: 0,
+    }
+
+    with open(checkpoint_path, 'a') as checkpoint, ThreadPoolExecutor(max_workers=workers) as executor:
+        def record(address, lat, lng, status, timestamp):
+            for row_number in addresses[address]:
+                entry = {
+                    'row': row_number, 'query': address_query(rows[row_number]),
+                    'lat': lat, 'lng': lng, 'timestamp': timestamp, 'status': status,
+                }
+                results[row_number] = entry
+                if status != ERROR:
+                    checkpoint.write(json.dumps(entry) + '\n')
+            checkpoint.flush()
+            return entry
+
+        for address, (lat, lng, _, timestamp) in cached.items():
+            record(address, lat, lng, SUCCESS, timestamp)
+
+        futures = {executor.submit(_geocode, provider, address_query(rows[addresses[address][0]])): address
+                   for address in missing}
+        try:
+            for done, future in enumerate(as_completed(futures), 1):
+                address = futures[future]
+                lat, lng, status = future.result()
+                timestamp = datetime.now().isoformat()
+                if status == SUCCESS and cache is not None:
+                    cache.put(address, lat, lng, provider.name, timestamp)
+                entry = record(address, lat, lng, status, timestamp)
+                if progress:
+                    progress(done, len(missing), entry)
+        except BaseException:
+            # Interrupted: drop queued addresses instead of geocoding them unrecorded
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    columns = fieldnames + [c for c in GEOCODING_COLUMNS if c not in fieldnames]
+    failed = []
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        for row_number, row in enumerate(rows):
+            entry = results[row_number]
+            stats[entry['status']] += 1
+            row.update({
+                'Latitude': entry['lat'],
+                'Longitude': entry['lng'],
+                'Geocoding_Timestamp': entry['timestamp'],
+                'Geocoding_Status': entry['status'],
+            })
+            writer.writerow(row)
+            if entry['status'] != SUCCESS:
+                failed.append(row)
+    os.replace(tmp_path, output_path)
+
+    if failed and failed_path:
+        with open(failed_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, columns)
+            writer.writeheader()
+            writer.writerows(failed)
+    if not stats[ERROR]:
+        os.remove(checkpoint_path)
+    return stats
+
+
+def print_summary(stats, failed_path=None):
+    print(f"\nGeocoding Summary:")
+    print(f"Total rows processed: {stats['rows']}")
+    print(f"Resumed from checkpoint: {stats['resumed']}")
+    if stats['addresses']:
+        print(f"Distinct addresses: {stats['addresses']}, cache hits: {stats['cache_hits']}, "
+              f"misses: {stats['cache_misses']} "
+              f"(hit rate {stats['cache_hits'] / stats['addresses']:.1%})")
+    print(f"Successfully geocoded: {stats[SUCCESS]}")
+    print(f"Failed to geocode: {stats[FAILED] + stats[ERROR]}")
+    if stats[ERROR]:
+        print(f"Provider errors, retried on the next run: {stats[ERROR]}")
+    if failed_path and stats[FAILED] + stats[ERROR]:
+        print(f"Failed geocoding attempts saved to: {failed_path}")
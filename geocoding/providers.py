@@ -0,0 +1,119 @@
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .ratelimit import TokenBucket
+
+# Statuses worth another attempt; anything else is final
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class GeocodingError(Exception):
+    """The provider could not answer, the address may still be valid"""
+
+
+class Provider:
+    """Rate-limited, pooled and retrying client for one geocoding service
+
+    Subclasses set the endpoint, default rate and the request/response format.
+    geocode() returns (lat, lng), None when the address is not found, or
+    raises GeocodingError when the service keeps failing.
+    """
+
+    name = None
+    url = None
+    rate = 1.0  # requests per second
+    api_key_env = None
+
+    def __init__(self, api_key=None, url=None, rate=None, burst=1, timeout=10,
+                 max_retries=2, backoff=0.5, pool_size=16):
+        self.api_key = api_key or (os.getenv(self.api_key_env) if self.api_key_env else None)
+        self.url = url or self.url
+        self.bucket = TokenBucket(rate or self.rate, burst)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def params(self, query):
+        raise NotImplementedError
+
+    def parse(self, data):
+        raise NotImplementedError
+
+    def geocode(self, query):
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+            self.bucket.acquire()
+            try:
+                response = self.session.get(self.url, params=self.params(query), timeout=self.timeout)
+            except requests.RequestException as e:
+                error = GeocodingError(f"{self.name} request failed: {e}")
+                continue
+            if response.status_code == 200:
+                try:
+                    return self.parse(response.json())
+                except (ValueError, KeyError, IndexError, TypeError) as e:
+                    raise GeocodingError(f"Malformed {self.name} response: {e}")
+            error = GeocodingError(f"{self.name} returned {response.status_code}")
+            if response.status_code not in RETRY_STATUSES:
+                raise error
+        raise error
+
+
+class HereProvider(Provider):
+    name = 'here'
+    url = 'https://geocode.search.hereapi.com/v1/geocode'
+    rate = 5.0
+    api_key_env = 'HERE_API_KEY'
+
+    def params(self, query):
+        return {'q': query, 'apiKey': self.api_key, 'limit': 1}
+
+    def parse(self, data):
+        if not data.get('items'):
+            return None
+        position = data['items'][0]['position']
+        return position['lat'], position['lng']
+
+
+class PhotonProvider(Provider):
+    name = 'photon'
+    url = 'https://photon.komoot.io/api/'
+    rate = 2.0
+
+    def params(self, query):
+        return {'q': query, 'limit': 1}
+
+    def parse(self, data):
+        if not data.get('features'):
+            return None
+        # Photon returns [lon, lat]
+        lng, lat = data['features'][0]['geometry']['coordinates'][:2]
+        return lat, lng
+
+
+class OpenCageProvider(Provider):
+    name = 'opencage'
+    url = 'https://api.opencagedata.com/geocode/v1/json'
+    rate = 1.0
+    api_key_env = 'OPENCAGE_API_KEY'
+
+    def params(self, query):
+        return {'q': query, 'key': self.api_key, 'limit': 1, 'no_annotations': 1}
+
+    def parse(self, data):
+        if not data.get('results'):
+            return None
+        geometry = data['results'][0]['geometry']
+        return geometry['lat'], geometry['lng']
+
+
+PROVIDERS = {provider.name: provider for provider in (HereProvider, PhotonProvider, OpenCageProvider)}
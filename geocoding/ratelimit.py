@@ -0,0 +1,28 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second in bursts of up to `capacity`"""
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
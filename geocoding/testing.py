@@ -0,0 +1,85 @@
+"""Local stand-in for the geocoding services, used by the tests."""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_location(query):
+    """Deterministic (lat, lng) inside the contiguous US for a query"""
+    digest = hashlib.sha256(query.encode()).digest()
+    lat = 25.0 + 24.0 * int.from_bytes(digest[:4], 'big') / 2 ** 32
+    lng = -124.0 + 57.0 * int.from_bytes(digest[4:8], 'big') / 2 ** 32
+    return round(lat, 5), round(lng, 5)
+
+
+class FakeGeocoder:
+    """Threaded HTTP server answering HERE, Photon and OpenCage style requests
+
+    The response format follows the request path. Queries containing
+    'NOWHERE' have no match. `latency` delays every response and `status`
+    forces an error status. Received queries are kept in `queries`.
+    """
+
+    PATHS = {'here': '/v1/geocode', 'photon': '/api/', 'opencage': '/geocode/v1/json'}
+
+    def __init__(self, latency=0.0, status=200):
+        self.latency = latency
+        self.status = status
+        self.queries = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)['q'][0]
+                with server._lock:
+                    server.queries.append(query)
+                    status = server.status
+                if server.latency:
+                    time.sleep(server.latency)
+                location = None if 'NOWHERE' in query else fake_location(query)
+                body = server.response(url.path, location) if status == 200 else {'error': 'fake'}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05}, daemon=True)
+
+    def url(self, provider):
+        return self.base_url + self.PATHS[provider]
+
+    def response(self, path, location):
+        if path == self.PATHS['here']:
+            return {'items': [{'position': {'lat': location[0], 'lng': location[1]}}] if location else []}
+        if path == self.PATHS['photon']:
+            return {'features': [{'geometry': {'coordinates': [location[1], location[0]]}}] if location else []}
+        return {'results': [{'geometry': {'lat': location[0], 'lng': location[1]}}] if location else []}
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def query_count(self):
+        with self._lock:
+            return len(self.queries)
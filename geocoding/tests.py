@@ -0,0 +1,177 @@
+import csv
+import os
+import tempfile
+import time
+
+from django.test import SimpleTestCase
+
+from geocoding.cache import GeocodeCache, normalize_address
+from geocoding.pipeline import geocode_address, geocode_csv, load_checkpoint
+from geocoding.providers import PROVIDERS, GeocodingError, HereProvider
+from geocoding.ratelimit import TokenBucket
+from geocoding.testing import FakeGeocoder, fake_location
+
+
+def write_prices(path, rows, repeat_every=None):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['OPIS Truckstop ID', 'Truckstop Name', 'Address', 'City', 'State',
+                         'Rack ID', 'Retail Price'])
+        for i in range(rows):
+            exit_number = i % repeat_every if repeat_every else i
+            address = 'NOWHERE' if i == 3 else f"I-{exit_number}, EXIT {exit_number}"
+            writer.writerow([i, f"STATION {i}", address, 'Town', 'TX', 100, 3.0])
+    return path
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_waits_for_tokens(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+        # Two calls ride the burst, the next two wait half a second each
+        self.assertEqual(sleeps, [0.5, 0.5])
+
+
+class ProviderTests(SimpleTestCase):
+    def test_each_provider_format(self):
+        with FakeGeocoder() as server:
+            for name, provider_class in PROVIDERS.items():
+                provider = provider_class(api_key='key', url=server.url(name), rate=100)
+                self.assertEqual(provider.geocode('1 Main St'), fake_location('1 Main St'))
+                self.assertIsNone(provider.geocode('NOWHERE'))
+
+    def test_provider_errors_are_retried_then_raised(self):
+        with FakeGeocoder(status=503) as server:
+            provider = HereProvider(url=server.url('here'), rate=100, max_retries=2, backoff=0)
+            with self.assertRaises(GeocodingError):
+                provider.geocode('1 Main St')
+            self.assertEqual(server.query_count, 3)
+
+
+class PipelineTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.input = write_prices(os.path.join(tmp.name, 'prices.csv'), 40)
+        self.output = os.path.join(tmp.name, 'geocoded.csv')
+        self.checkpoint = os.path.join(tmp.name, 'checkpoint.jsonl')
+        self.server = FakeGeocoder(latency=0.05).__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+
+    def provider(self):
+        return HereProvider(url=self.server.url('here'), rate=1000, burst=10, backoff=0)
+
+    def read_output(self):
+        with open(self.output, newline='') as f:
+            return list(csv.DictReader(f))
+
+    def test_geocodes_concurrently_in_input_order(self):
+        start = time.perf_counter()
+        stats = geocode_csv(self.input, self.output, self.provider(), workers=8,
+                            checkpoint_path=self.checkpoint)
+        # 40 requests at 50 ms each would take 2 s one at a time
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual((stats['SUCCESS'], stats['FAILED'], stats['ERROR']), (39, 1, 0))
+
+        rows = self.read_output()
+        self.assertEqual([row['OPIS Truckstop ID'] for row in rows], [str(i) for i in range(40)])
+        self.assertEqual(rows[3]['Geocoding_Status'], 'FAILED')
+        self.assertEqual((float(rows[0]['Latitude']), float(rows[0]['Longitude'])),
+                         fake_location('I-0, EXIT 0, Town, TX, USA'))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_resumes_from_checkpoint_after_crash(self):
+        def crash(done, total, entry):
+            if done == 10:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            geocode_csv(self.input, self.output, self.provider(), workers=4,
+                        checkpoint_path=self.checkpoint, progress=crash)
+        self.assertFalse(os.path.exists(self.output))
+        done = load_checkpoint(self.checkpoint)
+        self.assertGreaterEqual(len(done), 10)
+
+        before = self.server.query_count
+        stats = geocode_csv(self.input, self.output, self.provider(), workers=4,
+                            checkpoint_path=self.checkpoint)
+        self.assertEqual(stats['resumed'], len(done))
+        self.assertEqual(self.server.query_count - before, 40 - len(done))
+        self.assertEqual(len(self.read_output()), 40)
+
+    def test_provider_errors_are_retried_next_run(self):
+        self.server.latency = 0
+        self.server.status = 503
+        with self.assertLogs('geocoding.pipeline', 'ERROR'):
+            stats = geocode_csv(self.input, self.output, self.provider(), workers=4,
+                                checkpoint_path=self.checkpoint)
+        self.assertEqual(stats['ERROR'], 40)
+        self.assertEqual(load_checkpoint(self.checkpoint), {})
+
+        self.server.status = 200
+        stats = geocode_csv(self.input, self.output, self.provider(), workers=4,
+                            checkpoint_path=self.checkpoint)
+        self.assertEqual((stats['SUCCESS'], stats['ERROR']), (39, 0))
+
+
+class GeocodeCacheTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.cache_path = os.path.join(tmp.name, 'cache.sqlite3')
+        self.server = FakeGeocoder().__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.provider = HereProvider(url=self.server.url('here'), rate=1000, burst=10)
+
+    def run_pipeline(self, input_path, name):
+        cache = GeocodeCache(self.cache_path)
+        self.addCleanup(cache.close)
+        return geocode_csv(input_path, os.path.join(self.dir, name), self.provider, workers=4, cache=cache)
+
+    def test_normalize_address(self):
+        self.assertEqual(normalize_address(' I-44 ,  Exit 283&US-69, Big Cabin,OK, USA'),
+                         'I-44, EXIT 283& US-69, BIG CABIN, OK, USA')
+
+    def test_repeated_addresses_are_geocoded_once_per_run(self):
+        prices = write_prices(os.path.join(self.dir, 'prices.csv'), 40, repeat_every=10)
+        stats = self.run_pipeline(prices, 'out.csv')
+        # Exits 0-9 repeat four times; row 3 is the unknown address
+        self.assertEqual((stats['addresses'], stats['cache_misses']), (11, 11))
+        self.assertEqual(self.server.query_count, 11)
+        self.assertEqual((stats['SUCCESS'], stats['FAILED']), (39, 1))
+
+    def test_later_runs_only_query_cache_misses(self):
+        prices = write_prices(os.path.join(self.dir, 'prices.csv'), 20)
+        self.run_pipeline(prices, 'first.csv')
+        self.assertEqual(self.server.query_count, 20)
+
+        bigger = write_prices(os.path.join(self.dir, 'more.csv'), 25)
+        stats = self.run_pipeline(bigger, 'second.csv')
+        # 19 found last time; the unknown address and 5 new rows go to the network
+        self.assertEqual((stats['cache_hits'], stats['cache_misses']), (19, 6))
+        self.assertEqual(self.server.query_count, 26)
+        with open(os.path.join(self.dir, 'first.csv'), newline='') as a, \
+                open(os.path.join(self.dir, 'second.csv'), newline='') as b:
+            first, second = list(csv.DictReader(a)), list(csv.DictReader(b))
+        self.assertEqual([r['Latitude'] for r in second[:20]], [r['Latitude'] for r in first])
+
+    def test_seed_from_geocoded_csv(self):
+        prices = write_prices(os.path.join(self.dir, 'prices.csv'), 10)
+        geocode_csv(prices, os.path.join(self.dir, 'old.csv'), self.provider)
+        cache = GeocodeCache(self.cache_path)
+        self.addCleanup(cache.close)
+        self.assertEqual(cache.seed_from_csv(os.path.join(self.dir, 'old.csv'), 'file:old.csv'), 9)
+
+        before = self.server.query_count
+        self.assertEqual(geocode_address(self.provider, 'I-0, EXIT 0, Town, TX, USA', cache),
+                         fake_location('I-0, EXIT 0, Town, TX, USA'))
+        self.assertEqual(self.server.query_count, before)
@@ -58,7 +58,7 @@ def main():
     data = response.json()
     total_cost = data['total_cost']
     fuel_stops = data['fuel_stops']
-    map_url = data['map_url']
+    # The map is drawn locally; the server only returns a map_url with include_map=true
 
     # Extract start and finish points
     start = (start_lat, start_lng)